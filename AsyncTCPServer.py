@@ -0,0 +1,188 @@
+#
+# AtHomePowerlineServer - networked server for various controllers
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# asyncio based TCP server.
+# All connections are accepted and read on a single event loop. Requests
+# are executed by the existing (blocking) command handlers on a bounded
+# pool of worker threads. When the maximum number of requests are in flight,
+# the server stops reading new requests until one completes (backpressure).
+#
+# The public methods mirror socketserver.TCPServer (serve_forever, shutdown)
+# so SocketServerThread can run either server.
+#
+
+import asyncio
+import socket
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from Configuration import Configuration
+from MyTCPHandlerJson import MyTCPHandlerJson
+from helpers.json_framing import JsonFrameDecoder, FramingError
+
+logger = logging.getLogger("server")
+
+
+class AsyncTCPServer:
+    CHUNK_SIZE = 4096
+
+    def __init__(self, server_address, max_in_flight=32, max_workers=8):
+        """
+        Create a server bound to the given address
+        :param server_address: (host, port)
+        :param max_in_flight: Maximum number of requests executing or waiting for a worker
+        :param max_workers: Number of worker threads used to execute requests
+        """
+        self.server_address = server_address
+        self._max_in_flight = max_in_flight
+        self._max_workers = max_workers
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._in_flight = None
+        self._connections = set()
+        self._stop_requested = asyncio.Event()
+        self._serving = False
+        self._stopped = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="RequestWorker")
+
+        # Bind now so that address errors surface when the server is created
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(server_address)
+        self._socket.listen(socket.SOMAXCONN)
+        self._socket.setblocking(False)
+
+    def serve_forever(self):
+        """
+        Run the event loop on the calling thread until shutdown is called
+        :return: None
+        """
+        self._serving = True
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+            self._executor.shutdown(wait=False)
+            self._stopped.set()
+
+    def shutdown(self):
+        """
+        Stop the server. Safe to call from any thread. Blocks until the server has stopped.
+        :return: None
+        """
+        if self._serving:
+            if not self._stopped.is_set():
+                self._loop.call_soon_threadsafe(self._stop_requested.set)
+                self._stopped.wait()
+        else:
+            self._socket.close()
+            self._loop.close()
+
+    async def _serve(self):
+        self._in_flight = asyncio.Semaphore(self._max_in_flight)
+        self._server = await asyncio.start_server(self._handle_connection, sock=self._socket)
+        logger.info("asyncio server accepting connections (max in flight %d, workers %d)",
+                    self._max_in_flight, self._max_workers)
+        await self._stop_requested.wait()
+
+        # Stop accepting connections and drop any open connections
+        self._server.close()
+        connections = list(self._connections)
+        for task in connections:
+            task.cancel()
+        if connections:
+            await asyncio.gather(*connections, return_exceptions=True)
+        await self._server.wait_closed()
+        logger.info("asyncio server stopped")
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Read and execute requests from a single connection
+        :param reader: asyncio StreamReader
+        :param writer: asyncio StreamWriter
+        :return: None
+        """
+        this_task = asyncio.current_task()
+        self._connections.add(this_task)
+        peer = writer.get_extra_info("peername")
+        client_address = peer[0] if peer else "unknown"
+        logger.info("Request from %s", client_address)
+
+        decoder = JsonFrameDecoder()
+        write_lock = asyncio.Lock()
+        pending = set()
+        keep_alive = True
+        try:
+            while keep_alive:
+                try:
+                    raw_json = decoder.next_frame()
+                except FramingError as ex:
+                    logger.error("Unable to read request from %s", client_address)
+                    logger.error(str(ex))
+                    break
+
+                if raw_json is None:
+                    try:
+                        data = await asyncio.wait_for(reader.read(AsyncTCPServer.CHUNK_SIZE),
+                                                      timeout=Configuration.KeepAliveTimeout())
+                    except asyncio.TimeoutError:
+                        logger.info("Idle connection from %s timed out", client_address)
+                        break
+                    if not data:
+                        break
+                    decoder.feed(data)
+                    continue
+
+                # Backpressure. Wait here until there is room for another request.
+                await self._in_flight.acquire()
+                task = asyncio.create_task(self._run_request(raw_json, decoder, writer, write_lock))
+                if decoder.framing == JsonFrameDecoder.FRAMING_JSON:
+                    # The original framing is one request per connection unless the
+                    # client asks for keep-alive, which is only known after parsing.
+                    request = await task
+                    keep_alive = MyTCPHandlerJson.is_keep_alive(request, decoder.framing)
+                else:
+                    # Persistent framings allow pipelined requests to run concurrently.
+                    # The request ID lets the client match responses.
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        except (ConnectionError, OSError) as ex:
+            logger.info("Connection from %s closed: %s", client_address, str(ex))
+        except asyncio.CancelledError:
+            # The server is shutting down
+            logger.debug("Connection from %s dropped", client_address)
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+            self._connections.discard(this_task)
+
+    async def _run_request(self, raw_json, decoder, writer, write_lock):
+        """
+        Execute a request on a worker thread and send the response
+        :return: The parsed request
+        """
+        try:
+            request, response = await self._loop.run_in_executor(self._executor,
+                                                                 MyTCPHandlerJson.process_request, raw_json)
+        finally:
+            self._in_flight.release()
+
+        async with write_lock:
+            writer.write(decoder.encode(response))
+            await writer.drain()
+
+        return request
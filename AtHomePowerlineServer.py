@@ -17,6 +17,7 @@
 # along with this program (the LICENSE file).  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from helpers.startup_timer import StartupTimer
 import SocketServerThread
 import Configuration
 import Logging
@@ -30,7 +31,6 @@ import os
 import pwd
 import time
 import sys
-import ntplib
 
 
 #
@@ -51,6 +51,7 @@ def main():
         timer_service.Stop()
         server.Stop()
         DeviceDriverManager.close_drivers()
+        database.AtHomePowerlineServerDb.AtHomePowerlineServerDb.ClosePool()
         logger.info("AtHomePowerlineServer shutdown complete")
         logger.info("################################################################################")
         Logging.Shutdown()
@@ -82,37 +83,24 @@ def main():
 
     logger.info("Using configuration file: %s", Configuration.Configuration.GetConfigurationFilePath())
 
-    # Verify Internet access. This is required for Meross devices to work.
-    # This is mostly about recovering from power outages.
-    logger.info("Verifying Internet connection...")
-    ntp_client = ntplib.NTPClient()
-    while True:
-        try:
-            # Internet access is verified by connecting to a reliable, well-known
-            # server (in this case an NTP server).
-            response = ntp_client.request("time.nist.gov")
-            if response is not None:
-                logger.info("Internet verification successful")
-                break
-            time.sleep(5.0)
-        except KeyboardInterrupt:
-            logger.info("AtHomePowerlineServer shutting down after Internet verification failed...")
-            exit(999)
-        except ntplib.NTPException:
-            # Wait 5 sec and try again
-            time.sleep(5.0)
-        except Exception as e:
-            logger.error("Unhandled exception occurred during Internet verification")
-            logger.error(str(e))
-            # logger.error(sys.exc_info()[0])
-            time.sleep(5.0)
-
-    # Create drivers for all supported devices/manufacturers
-    DeviceDriverManager.init()
+    # Startup is done in phases so that local requests (X10, dummy driver,
+    # database queries) can be served as soon as possible. Drivers that need
+    # Internet access (e.g. Meross) are opened in the background once the
+    # Internet is reachable. This is mostly about recovering from power outages.
 
     # Initialize the database
     logger.info("Initializing database")
-    database.AtHomePowerlineServerDb.AtHomePowerlineServerDb.Initialize()
+    with StartupTimer.measure("database initialization"):
+        database.AtHomePowerlineServerDb.AtHomePowerlineServerDb.Initialize()
+
+    # Resolve the sunrise/sunset location once. It is used by the timer service
+    # and the getsundata command.
+    try:
+        with StartupTimer.measure("sun data location"):
+            from helpers.sun_data import SunDataCache
+            SunDataCache.load_location()
+    except Exception as ex:
+        logger.error("Unable to resolve sun data location: %s", str(ex))
 
     # HOST, PORT = "localhost", 9999
     # HOST, PORT = "hedwig", 9999
@@ -120,17 +108,15 @@ def main():
     # way to get it to work in the RPi from remote machines.
     HOST, PORT = "0.0.0.0", Configuration.Configuration.Port()
 
-    # Fire up the timer service - watches for timer events to occur
-    timer_service = services.TimerService.TimerService()
-    timer_service.Start()
-    logger.info("Timer service started")
-
     # Create the TCP socket server on its own thread.
     # This is done so that we can handle the kill signal which
     # arrives on the main thread. If we didn't put the TCP server
     # on its own thread we would not be able to shut it down in
     # an orderly fashion.
-    server = SocketServerThread.SocketServerThread(HOST, PORT)
+    with StartupTimer.measure("socket server creation"):
+        server = SocketServerThread.SocketServerThread(HOST, PORT)
+
+    timer_service = services.TimerService.TimerService()
 
     # Set up handler for the kill signal
     signal.signal(signal.SIGTERM, term_handler)
@@ -140,8 +126,23 @@ def main():
 
     # Launch the socket server
     try:
+        # Requests that arrive before the drivers are created
+        # get a "driver initializing" error
+        DeviceDriverManager.install_placeholders()
+
         # This runs "forever", until ctrl-c or killed
         server.Start()
+
+        # Create drivers for all supported devices/manufacturers.
+        # Until a driver is open, requests for it get a "driver initializing" error.
+        DeviceDriverManager.init()
+
+        # Fire up the timer service - watches for timer events to occur
+        with StartupTimer.measure("timer service start"):
+            timer_service.Start()
+        logger.info("Timer service started")
+
+        StartupTimer.report()
         terminate_service = False
         while not terminate_service:
             # We do a lot of sleeping to avoid using too much CPU :-)
@@ -12,51 +12,18 @@
 import json
 import datetime
 import logging
+import threading
+import time
 import commands.ServerCommand
-import commands.ServerCommand
-import commands.StatusRequest
-import commands.DeviceOn
-import commands.DeviceOff
-import commands.DeviceDim
-import commands.DeviceBright
-import commands.DeviceAllUnitsOff
-import commands.DeviceAllLightsOff
-import commands.DeviceAllLightsOn
-import commands.GetTime
-import commands.SetTime
-import commands.GetSunData
-import commands.define_device
-import commands.query_devices
-import commands.update_device
-import commands.define_program
-import commands.update_program
-import commands.query_device_programs
-import commands.query_device_program
-import commands.delete_device
-import commands.delete_device_program
-import commands.all_devices_on
-import commands.all_devices_off
-import commands.query_available_devices
-import commands.discover_devices
-import commands.query_available_programs
-import commands.query_programs
-import commands.assign_program
-import commands.delete_program
-import commands.query_action_groups
-import commands.query_action_group
-import commands.query_action_group_devices
-import commands.update_action_group
-import commands.define_group
-import commands.group_on
-import commands.group_off
-import commands.delete_group
-import commands.query_available_group_devices
-import commands.assign_device
-import commands.delete_group_device
-import commands.assign_program_to_group
+from commands.command_registry import CommandRegistry
+from Configuration import Configuration
+from helpers.command_admission import CommandAdmission, ServerBusyError
 
 logger = logging.getLogger("server")
 
+# Find all of the commands. Each command module is imported on first use.
+CommandRegistry.build_index()
+
 
 class CommandHandler:
     call_sequence = 1
@@ -65,71 +32,63 @@ class CommandHandler:
     NotImplemented = 404
     UnhandledException = 405
 
-    COMMAND_HANDLER_LIST = {
-        "deviceon": commands.DeviceOn.DeviceOn,
-        "on": commands.DeviceOn.DeviceOn,
-        "deviceoff": commands.DeviceOff.DeviceOff,
-        "off": commands.DeviceOff.DeviceOff,
-        "dim": commands.DeviceDim.DeviceDim,
-        "bright": commands.DeviceBright.DeviceBright,
-        "statusrequest": commands.StatusRequest.StatusRequest,
-        "gettime": commands.GetTime.GetTime,
-        "settime": commands.SetTime.SetTime,
-        "getsundata": commands.GetSunData.GetSunData,
-        "definedevice": commands.define_device.DefineDevice,
-        "querydevices": commands.query_devices.QueryDevices,
-        "queryavailabledevices": commands.query_available_devices.QueryAvailableDevices,
-        "discoverdevices": commands.discover_devices.DiscoverDevices,
-        "queryavailableprograms": commands.query_available_programs.QueryAvailablePrograms,
-        "updatedevice": commands.update_device.UpdateDevice,
-        "deletedevice": commands.delete_device.DeleteDevice,
-        "queryprograms": commands.query_programs.QueryPrograms,
-        "defineprogram": commands.define_program.DefineProgram,
-        "updateprogram": commands.update_program.UpdateProgram,
-        "deleteprogram": commands.delete_program.DeleteProgram,
-        "deletedeviceprogram": commands.delete_device_program.DeleteDeviceProgram,
-        "querydeviceprograms": commands.query_device_programs.QueryDevicePrograms,
-        "querydeviceprogram": commands.query_device_program.QueryDeviceProgram,
-        "assignprogram": commands.assign_program.AssignProgram,
-        "assignprogramtogroup": commands.assign_program_to_group.AssignProgramToGroup,
-        "defineactiongroup": commands.define_group.DefineGroup,
-        "deleteactiongroup": commands.delete_group.DeleteGroup,
-        "queryactiongroups": commands.query_action_groups.QueryActionGroups,
-        "queryactiongroup": commands.query_action_group.QueryActionGroup,
-        "updateactiongroup": commands.update_action_group.UpdateActionGroup,
-        "queryactiongroupdevices": commands.query_action_group_devices.QueryActionGroupDevices,
-        "queryavailablegroupdevices": commands.query_available_group_devices.QueryAvailableGroupDevices,
-        "assigndevice": commands.assign_device.AssignDevice,
-        "deleteactiongroupdevice": commands.delete_group_device.DeleteActionGroupDevice,
-        "groupon": commands.group_on.GroupOn,
-        "groupoff": commands.group_off.GroupOff,
-        "alldeviceson": commands.all_devices_on.AllDevicesOn,
-        "alldevicesoff": commands.all_devices_off.AllDevicesOff
-    }
+    # Commands that bypass admission control so the server can be
+    # monitored while it is busy
+    UNCONTROLLED_COMMANDS = ["StatusRequest"]
+
+    # Shared by all handler threads. Created on first use after the configuration is loaded.
+    _admission = None
+    _admission_lock = threading.Lock()
 
-    def GetHandler(self, command):
+    @classmethod
+    def get_admission(cls):
+        """
+        Return the admission controller that limits concurrent command execution
+        :return: CommandAdmission instance
         """
-        Return an instance of the handler for a given command
+        with cls._admission_lock:
+            if cls._admission is None:
+                # Per command limits are configured by command name but
+                # enforced by handler class so that aliases (e.g. on/deviceon) share a limit.
+                class_limits = {}
+                for command, limit in Configuration.CommandConcurrency().items():
+                    handler_class = CommandRegistry.get_handler_class(command)
+                    if handler_class is not None:
+                        class_limits[handler_class.__name__] = int(limit)
+                    else:
+                        logger.error("CommandConcurrency: unknown command %s", command)
+                cls._admission = CommandAdmission(max_workers=Configuration.CommandWorkers(),
+                                                  max_queue_depth=Configuration.CommandQueueDepth(),
+                                                  class_limits=class_limits)
+            return cls._admission
+
+    @classmethod
+    def GetHandler(cls, command):
+        """
+        Return the handler for a given command
         :param command: API command as a string
-        :return: Instance of class that executes the command
+        :return: Shared instance of the class that executes the command
         """
         logger.info("GetHandler for command: %s", command)
+        return CommandRegistry.get_handler(command)
 
-        ci_command = command.lower()
-        if ci_command in self.COMMAND_HANDLER_LIST.keys():
-            handler = self.COMMAND_HANDLER_LIST[ci_command]()
-        else:
-            handler = None
-
-        return handler
-
-        #######################################################################
-
+    #######################################################################
     # Execute the command specified by the incoming request
-    def Execute(self, request):
-        handler = self.GetHandler(request["request"])
+    @classmethod
+    def Execute(cls, request):
+        handler = cls.GetHandler(request["request"])
         if handler is not None:
-            response = handler.Execute(request)
+            command_class = type(handler).__name__
+            start = time.monotonic()
+            error = True
+            try:
+                if command_class in CommandHandler.UNCONTROLLED_COMMANDS:
+                    response = handler.Execute(request)
+                else:
+                    response = cls._execute_admitted(handler, command_class, request)
+                error = response.get("result-code") not in [0, commands.ServerCommand.ServerCommand.OK]
+            finally:
+                CommandRegistry.record_call(command_class, time.monotonic() - start, error=error)
             response['call-sequence'] = CommandHandler.call_sequence
         else:
             logger.error("No handler for command: %s", request["request"])
@@ -140,6 +99,28 @@ class CommandHandler:
 
         return response
 
+    @classmethod
+    def _execute_admitted(cls, handler, command_class, request):
+        """
+        Execute a handler once it has been given an execution slot
+        :param handler: Handler instance
+        :param command_class: Name of the handler class
+        :param request: The request
+        :return: The response
+        """
+        admission = CommandHandler.get_admission()
+        try:
+            admission.acquire(command_class)
+        except ServerBusyError as ex:
+            logger.error("Rejected %s: %s", request["request"], str(ex))
+            return CommandHandler.CreateErrorResponse(request["request"],
+                                                      commands.ServerCommand.ServerCommand.SERVICE_UNAVAILABLE,
+                                                      str(ex), "")
+        try:
+            return handler.Execute(request)
+        finally:
+            admission.release(command_class)
+
     @classmethod
     def CreateErrorResponse(cls, request_command, result_code, error_msg, extra_data):
         r = commands.ServerCommand.ServerCommand.CreateResponse(request_command)
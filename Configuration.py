@@ -104,6 +104,19 @@ class Configuration:
             logger.error(str(ex))
         return None
 
+    ######################################################################
+    @classmethod
+    def get_optional_config_var(cls, var_name, default=None):
+        """
+        Returns the value of an optional configuration variable.
+        Unlike get_config_var, a missing variable is not an error.
+        :param var_name: Name of the configuration variable
+        :param default: Value returned when the variable is not defined
+        """
+        if cls.ActiveConfig is not None and var_name in cls.ActiveConfig:
+            return cls.ActiveConfig[var_name]
+        return default
+
     ######################################################################
     @classmethod
     def Port(cls):
@@ -164,6 +177,13 @@ class Configuration:
     def PyKasaRequestWaitTime(cls):
         return cls.get_config_var("PyKasaRequestWaitTime")
 
+    @classmethod
+    def PyKasaPollInterval(cls):
+        """
+        How often (in seconds) the state of all TPLink/Kasa devices is refreshed. Zero turns off polling.
+        """
+        return float(cls.get_optional_config_var("PyKasaPollInterval", 60.0))
+
     @classmethod
     def MerossIot(cls):
         return cls.get_config_var("MerossIot")
@@ -176,6 +196,99 @@ class Configuration:
     def logformat(cls):
         return cls.get_config_var("logformat")
 
+    @classmethod
+    def KeepAliveTimeout(cls):
+        """
+        How long (in seconds) an idle keep-alive connection is held open
+        """
+        return float(cls.get_optional_config_var("KeepAliveTimeout", 300.0))
+
+    @classmethod
+    def ServerFrontEnd(cls):
+        """
+        The socket server front end: threaded (default) or asyncio
+        """
+        return cls.get_optional_config_var("ServerFrontEnd", "threaded").lower()
+
+    @classmethod
+    def MaxInFlightRequests(cls):
+        """
+        asyncio front end: maximum number of requests executing or waiting for a worker
+        """
+        return int(cls.get_optional_config_var("MaxInFlightRequests", 32))
+
+    @classmethod
+    def ServerWorkers(cls):
+        """
+        asyncio front end: number of worker threads that execute requests
+        """
+        return int(cls.get_optional_config_var("ServerWorkers", 8))
+
+    @classmethod
+    def CommandWorkers(cls):
+        """
+        Maximum number of commands executing at the same time
+        """
+        return int(cls.get_optional_config_var("CommandWorkers", 16))
+
+    @classmethod
+    def CommandQueueDepth(cls):
+        """
+        Maximum number of commands waiting to execute before requests are rejected as busy
+        """
+        return int(cls.get_optional_config_var("CommandQueueDepth", 32))
+
+    @classmethod
+    def CommandConcurrency(cls):
+        """
+        Per command concurrency limits as a dict of command: limit
+        """
+        return cls.get_optional_config_var("CommandConcurrency", {"discoverdevices": 2})
+
+    @classmethod
+    def DriverOpenTimeout(cls):
+        """
+        How long (in seconds) startup waits for the drivers to open
+        """
+        return float(cls.get_optional_config_var("DriverOpenTimeout", 30.0))
+
+    @classmethod
+    def DatabasePoolSize(cls):
+        """
+        Maximum number of idle database connections kept open
+        """
+        return int(cls.get_optional_config_var("DatabasePoolSize", 8))
+
+    @classmethod
+    def DriverParallelism(cls):
+        """
+        Per driver limits on concurrent device operations for group and all devices
+        commands as a dict of mfg: limit. The "default" key applies to other drivers.
+        """
+        return cls.get_optional_config_var("DriverParallelism", {"default": 4, "tplink": 8, "meross": 8})
+
+    @classmethod
+    def DeviceStateTTL(cls):
+        """
+        How long (in seconds) a cached device on/off state is used before the device is asked again
+        """
+        return float(cls.get_optional_config_var("DeviceStateTTL", 60.0))
+
+    @classmethod
+    def ComPort(cls):
+        """
+        Serial port of the X10 controller (e.g. /dev/ttyUSB0 or COM1)
+        """
+        return cls.get_optional_config_var("ComPort", None)
+
+    @classmethod
+    def X10GatherWindow(cls):
+        """
+        How long (in seconds) an X10 command waits for other commands that can share
+        its transmission. Zero sends every command by itself.
+        """
+        return float(cls.get_optional_config_var("X10GatherWindow", 0.1))
+
     ######################################################################
     @classmethod
     def GetConfigurationFilePath(cls):
@@ -10,9 +10,12 @@
 #
 
 import socketserver
+import socket
 import json
 import logging
 import CommandHandler
+from Configuration import Configuration
+from helpers.json_framing import JsonFrameReader, JsonFrameDecoder, FramingError
 
 logger = logging.getLogger("server")
 
@@ -28,6 +31,10 @@ class MyTCPHandlerJson(socketserver.BaseRequestHandler):
 
     call_sequence = 1
 
+    # Optional request keys (at the top level of a request)
+    REQUEST_ID = "request-id"
+    KEEP_ALIVE = "keep-alive"
+
     """
     This handler uses raw data from the SocketServer.TCPServer class.
     """
@@ -35,53 +42,101 @@ class MyTCPHandlerJson(socketserver.BaseRequestHandler):
     def handle(self):
         logger.info("Request from %s", self.client_address[0])
         # self.request is the TCP socket connected to the client
-        self.raw_json = self.ReadJson()
-        # logger.info("raw json: %s", self.raw_json)
-        # logger.info("Request length: %s", len(self.raw_json))
+        self.reader = JsonFrameReader(self.request)
+        # An idle keep-alive connection is eventually dropped
+        self.request.settimeout(Configuration.KeepAliveTimeout())
+
+        # A connection carries one request unless the client asks for keep-alive
+        keep_alive = True
+        while keep_alive:
+            try:
+                self.raw_json = self.ReadJson()
+            except FramingError as ex:
+                logger.error("Unable to read request from %s", self.client_address[0])
+                logger.error(str(ex))
+                break
+            except socket.timeout:
+                logger.info("Idle connection from %s timed out", self.client_address[0])
+                break
+            except OSError as ex:
+                logger.info("Connection from %s closed: %s", self.client_address[0], str(ex))
+                break
+            if self.raw_json is None:
+                logger.debug("Connection closed by %s", self.client_address[0])
+                break
+            # logger.info("raw json: %s", self.raw_json)
+            # logger.info("Request length: %s", len(self.raw_json))
+
+            self.json, response = MyTCPHandlerJson.process_request(self.raw_json)
+            keep_alive = MyTCPHandlerJson.is_keep_alive(self.json, self.reader.framing)
+
+            # Return the response to the client using the framing the client chose
+            try:
+                self.request.sendall(self.reader.encode(response))
+            except OSError as ex:
+                logger.error("Unable to send response to %s", self.client_address[0])
+                logger.error(str(ex))
+                break
+
+    def ReadJson(self):
+        """
+        Read a JSON payload from a socket.
+        The payload is read in chunks and framed according to the
+        framing negotiated by the client (see helpers/json_framing.py).
+        :return: The JSON payload as a str or None if the client closed the connection
+        """
+        return self.reader.read_frame()
 
+    @classmethod
+    def process_request(cls, raw_json):
+        """
+        Parse and execute one request
+        :param raw_json: The request as a JSON string
+        :return: A tuple (request, response). The request is None if it could not be parsed.
+        """
+        request = None
+        request_command = None
         try:
-            self.json = json.loads(self.raw_json)
-            logger.info("Request: %s", self.json["request"])
-            # logger.info("Args: %s", json.dumps(self.json["args"]))
+            request = json.loads(raw_json)
+            request_command = request["request"]
+            logger.info("Request: %s", request_command)
+            # logger.info("Args: %s", json.dumps(request["args"]))
 
             # The command handler generates the response
-            response = CommandHandler.CommandHandler().Execute(self.json)
+            response = CommandHandler.CommandHandler.Execute(request)
 
             logger.info("Request completed")
         except Exception as ex:
             logger.error("Exception occurred while parsing json request")
             logger.error(str(ex))
-            logger.error(self.raw_json)
+            logger.error(raw_json)
             # Send an error response
-            response = CommandHandler.CommandHandler.CreateErrorResponse(self.json["request"],
+            response = CommandHandler.CommandHandler.CreateErrorResponse(request_command,
                                                                          CommandHandler.CommandHandler.UnhandledException,
-                                                                         "Unhandled exception occurred", ex.message)
+                                                                         "Unhandled exception occurred", str(ex))
         finally:
             pass
 
-        # Return the response to the client
-        self.request.sendall(json.JSONEncoder().encode(response).encode())
+        # A request ID allows pipelined responses to be matched to their requests
+        if isinstance(request, dict) and MyTCPHandlerJson.REQUEST_ID in request:
+            response[MyTCPHandlerJson.REQUEST_ID] = request[MyTCPHandlerJson.REQUEST_ID]
 
         MyTCPHandlerJson.call_sequence += 1
 
-    def ReadJson(self):
+        return request, response
+
+    @classmethod
+    def is_keep_alive(cls, request, framing):
         """
-        Read a JSON payload from a socket
+        Should the connection be held open for another request?
+        Newline and length framed connections are always persistent.
+        Original (bare JSON) connections are persistent only when asked for.
+        :param request: The parsed request (may be None)
+        :param framing: The connection's negotiated framing
+        :return: True if the connection should be kept open
         """
-        depth = 0
-        json_data = ""
-
-        while (True):
-            c = self.request.recv(1).decode()
-
-            if (len(json_data) == 0) and (c == "\""):
-                pass
-            else:
-                json_data += c
-
-            if (c == "{"):
-                depth += 1
-            elif (c == "}"):
-                depth -= 1
-                if (depth == 0):
-                    return json_data
+        if framing in [JsonFrameDecoder.FRAMING_NEWLINE, JsonFrameDecoder.FRAMING_LENGTH]:
+            return True
+        if isinstance(request, dict):
+            return bool(request.get(MyTCPHandlerJson.KEEP_ALIVE, False))
+        return False
@@ -15,7 +15,9 @@
 
 import threading
 import ThreadedTCPServer
+import AsyncTCPServer
 import MyTCPHandlerJson
+from Configuration import Configuration
 import logging
 
 logger = logging.getLogger("server")
@@ -28,8 +30,18 @@ class SocketServerThread:
         self.host = host
         self.port = port
         self.server_thread = threading.Thread(target=self.RunServer, name="SocketServerThread")
-        ThreadedTCPServer.ThreadedTCPServer.allow_reuse_address = True
-        self.server = ThreadedTCPServer.ThreadedTCPServer((host, port), MyTCPHandlerJson.MyTCPHandlerJson)
+        # The front end is chosen by configuration
+        self.front_end = Configuration.ServerFrontEnd()
+        if self.front_end == "asyncio":
+            self.server = AsyncTCPServer.AsyncTCPServer((host, port),
+                                                        max_in_flight=Configuration.MaxInFlightRequests(),
+                                                        max_workers=Configuration.ServerWorkers())
+        else:
+            if self.front_end != "threaded":
+                logger.error("%s is not a recognized server front end, using threaded", self.front_end)
+                self.front_end = "threaded"
+            ThreadedTCPServer.ThreadedTCPServer.allow_reuse_address = True
+            self.server = ThreadedTCPServer.ThreadedTCPServer((host, port), MyTCPHandlerJson.MyTCPHandlerJson)
 
     # Start the TCPServer on its own thread
     def Start(self):
@@ -44,5 +56,5 @@ class SocketServerThread:
 
     # Run TCPServer on a new thread
     def RunServer(self):
-        logger.info("Now serving sockets at %s:%s", self.host, self.port)
+        logger.info("Now serving sockets at %s:%s (%s)", self.host, self.port, self.front_end)
         self.server.serve_forever()
@@ -13,6 +13,9 @@
 
 import socket
 import json
+import struct
+import threading
+import itertools
 
 
 class ServerRequest:
@@ -43,8 +46,9 @@ class ServerRequest:
         """
         Open a socket to the server
         Note that a socket can only be used for one request.
-        The server seems to close the socket at when it is
-        finished handling the request.
+        The server closes the socket when it is finished
+        handling the request. See PooledServerRequest for
+        a client that reuses connections.
         :return:
         """
         # Create a socket (SOCK_STREAM means a TCP socket)
@@ -562,3 +566,237 @@ class ServerRequest:
         req = self._create_request("DiscoverDevices")
         response = self._send_command(req)
         return response
+
+
+class ServerConnection:
+    """
+    A persistent connection to the server. The connection uses
+    length framing, so it can carry any number of requests.
+    """
+    # Length prefix for length framing (4 byte, big endian)
+    LENGTH_PREFIX = struct.Struct("!I")
+
+    def __init__(self, host="localhost", port=9999, timeout=120.0):
+        """
+        Open a persistent connection to the server
+        :param host:
+        :param port:
+        :param timeout: Socket timeout in seconds
+        """
+        self.host = host
+        self.port = port
+        # Number of requests this connection has carried
+        self.requests_sent = 0
+        self.timeout = timeout
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        # Ask for length framing. This also makes the connection persistent.
+        self._sock.sendall(b"framing=length\n")
+
+    def send(self, request):
+        """
+        Send a request without waiting for the response
+        :param request: A dict containing the request definition
+        :return: None
+        """
+        payload = json.JSONEncoder().encode(request).encode()
+        self._sock.sendall(ServerConnection.LENGTH_PREFIX.pack(len(payload)) + payload)
+        self.requests_sent += 1
+
+    def receive(self):
+        """
+        Receive the next response
+        :return: The response as a dict
+        """
+        header = self._recv_exactly(ServerConnection.LENGTH_PREFIX.size)
+        (length,) = ServerConnection.LENGTH_PREFIX.unpack(header)
+        return json.loads(self._recv_exactly(length).decode())
+
+    def close(self):
+        try:
+            self._sock.close()
+        except Exception:
+            pass
+
+    def is_closed(self):
+        """
+        Check whether the server has closed an idle connection (e.g. idle timeout)
+        :return: True if the connection can not carry another request
+        """
+        try:
+            self._sock.setblocking(False)
+            try:
+                # An idle connection has nothing to read. End of file means it was closed.
+                return self._sock.recv(1, socket.MSG_PEEK) == b""
+            finally:
+                self._sock.settimeout(self.timeout)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    def _recv_exactly(self, count):
+        data = bytearray()
+        while len(data) < count:
+            chunk = self._sock.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            data += chunk
+        return bytes(data)
+
+
+class ServerConnectionPool:
+    """
+    A thread safe pool of persistent server connections
+    """
+    def __init__(self, host="localhost", port=9999, max_idle=4, timeout=120.0):
+        """
+        Create a connection pool. Connections are opened on demand.
+        :param host:
+        :param port:
+        :param max_idle: Maximum number of idle connections held by the pool
+        :param timeout: Socket timeout in seconds
+        """
+        self.host = host
+        self.port = port
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Borrow a connection from the pool
+        :return: A ServerConnection
+        """
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn = self._idle.pop()
+            # Skip connections the server dropped while they were idle
+            if not conn.is_closed():
+                return conn
+            conn.close()
+        return ServerConnection(self.host, self.port, timeout=self.timeout)
+
+    def release(self, conn, reuse=True):
+        """
+        Return a borrowed connection to the pool
+        :param conn: The connection
+        :param reuse: False if the connection is broken and must be discarded
+        :return: None
+        """
+        if reuse:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(conn)
+                    return
+        conn.close()
+
+    def close(self):
+        """
+        Close all idle connections
+        :return: None
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for conn in idle:
+            conn.close()
+
+
+class PooledServerRequest(ServerRequest):
+    """
+    A ServerRequest that reuses persistent connections instead
+    of opening a new connection for every request.
+    """
+    def __init__(self, host="localhost", port=9999, verbose=True, pool=None):
+        """
+        Create an instance of a pooled server request
+        :param host:
+        :param port:
+        :param verbose:
+        :param pool: An optional ServerConnectionPool shared with other instances
+        """
+        super().__init__(host=host, port=port, verbose=verbose)
+        self.pool = pool if pool is not None else ServerConnectionPool(host, port)
+        self._request_ids = itertools.count(1)
+        self._id_lock = threading.Lock()
+
+    def _next_request_id(self):
+        with self._id_lock:
+            return next(self._request_ids)
+
+    def _send_command(self, data):
+        """
+        Send a command to the server over a pooled connection
+        :param data: A dict containing the request definition.
+        :return: Returns the response as a dict.
+        """
+        responses = self.send_pipelined([data])
+        return responses[0] if responses else None
+
+    def send_pipelined(self, requests):
+        """
+        Send several requests on one connection without waiting for
+        each response. Responses are matched to requests by request ID.
+        :param requests: A list of request dicts. They are not changed.
+        :return: A list of response dicts in the same order as requests
+        """
+        # The request ID goes on a copy so the caller can reuse its requests
+        requests = [dict(request, **{"request-id": self._next_request_id()}) for request in requests]
+        ids = [request["request-id"] for request in requests]
+
+        # The pool skips connections the server dropped while idle. If sending
+        # the first request on a reused connection still fails, the server never
+        # saw any of the requests and they are sent once more on a fresh
+        # connection. Once a request has been sent, it is never sent again
+        # because the server may have run it.
+        for attempt in range(2):
+            try:
+                conn = self.pool.acquire()
+            except Exception as ex:
+                print("Unable to connect to server:", self.host, self.port)
+                print(str(ex))
+                return None
+
+            reused = conn.requests_sent > 0
+            sent = 0
+            by_id = {}
+            try:
+                for request in requests:
+                    print("Sending request:", request["request"])
+                    if self.verbose:
+                        print(json.dumps(request, indent=2))
+                    conn.send(request)
+                    sent += 1
+
+                # One response for each request
+                for i in range(len(ids)):
+                    response = conn.receive()
+                    request_id = response.get("request-id")
+                    if request_id not in ids or request_id in by_id:
+                        raise ValueError("Response does not match a request: request-id {0}".format(request_id))
+                    by_id[request_id] = response
+                self.pool.release(conn)
+            except Exception as ex:
+                self.pool.release(conn, reuse=False)
+                if reused and sent == 0 and attempt == 0:
+                    continue
+                print(str(ex))
+                return None
+
+            responses = [by_id.get(request_id) for request_id in ids]
+            for response in responses:
+                if response is not None:
+                    self._display_response(json.dumps(response))
+            return responses
+
+        return None
+
+    def close(self):
+        """
+        Close all pooled connections
+        :return: None
+        """
+        self.pool.close()
@@ -26,9 +26,9 @@ def RunAction(command, device_id, device_mfg, device_name, device_address, devic
         driver = DeviceDriverManager.get_driver(device_mfg)
         # Cases for command
         if command == "on":
-            driver.set_brightness(device_mfg, device_name, device_address, device_channel, brightness)
-            driver.set_color(device_mfg, device_name, device_address, device_channel, color)
-            driver.device_on(device_mfg, device_name, device_address, device_channel)
+            # Brightness, color and on in one driver request
+            driver.apply_state(device_mfg, device_name, device_address, device_channel,
+                               brightness=brightness, hex_color=color)
         elif command == "off":
             driver.device_off(device_mfg, device_name, device_address, device_channel)
         elif command == "dim":
@@ -16,10 +16,12 @@
 
 import commands.ServerCommand as ServerCommand
 import drivers.X10ControllerAdapter
+from commands.command_registry import register_command
 
 
 #######################################################################
 # Command handler for bright command
+@register_command("bright")
 class DeviceBright(ServerCommand.ServerCommand):
 
     #######################################################################
@@ -17,10 +17,12 @@
 import commands.ServerCommand as ServerCommand
 import drivers.X10ControllerAdapter
 import datetime
+from commands.command_registry import register_command
 
 
 #######################################################################
 # Command handler for on command
+@register_command("dim")
 class DeviceDim(ServerCommand.ServerCommand):
 
     #######################################################################
@@ -15,10 +15,12 @@
 #
 
 import commands.ServerCommand as ServerCommand
+from commands.command_registry import register_command
 
 
 #######################################################################
 # Command handler for off command
+@register_command("deviceoff", "off")
 class DeviceOff(ServerCommand.ServerCommand):
 
     #######################################################################
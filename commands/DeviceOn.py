@@ -10,10 +10,12 @@
 #
 
 from commands.ServerCommand import ServerCommand
+from commands.command_registry import register_command
 
 
 #######################################################################
 # Command handler for on command
+@register_command("deviceon", "on")
 class DeviceOn(ServerCommand):
 
     #######################################################################
@@ -64,9 +66,9 @@ class DeviceOn(ServerCommand):
 
         r = self.CreateResponse(request["request"])
         try:
-            driver.set_brightness(device_mfg, device_name, device_address, device_channel, device_brightness)
-            driver.set_color(device_mfg, device_name, device_address, device_channel, device_color)
-            result = driver.device_on(device_mfg, device_name, device_address, device_channel)
+            # Brightness, color and on in one driver request
+            result = driver.apply_state(device_mfg, device_name, device_address, device_channel,
+                                        brightness=device_brightness, hex_color=device_color)
             if result:
                 r['result-code'] = ServerCommand.SUCCESS
                 r['message'] = ServerCommand.MSG_SUCCESS
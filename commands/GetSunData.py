@@ -15,11 +15,13 @@
 
 import commands.ServerCommand as ServerCommand
 import datetime
-from helpers.sun_data import get_sunrise, get_sunset
+from helpers.sun_data import get_sunrise, get_sunset, get_sun_data_range
+from commands.command_registry import register_command
 
 
 #######################################################################
 # Command handler for GetSunData command
+@register_command("getsundata")
 class GetSunData(ServerCommand.ServerCommand):
 
     #######################################################################
@@ -29,18 +31,29 @@ class GetSunData(ServerCommand.ServerCommand):
         r = GetSunData.CreateResponse("GetSunData")
         r['data'] = {}
 
-        # Date should be in ISO format: YYYY-MM-DD
-        for_date_str = request["args"]["date"]
-        for_datetime = datetime.datetime.strptime(for_date_str, "%Y-%m-%d")
-
-        # The sun_data functions expect a date type, so we convert to date here
-        for_date = datetime.date(for_datetime.year, for_datetime.month, for_datetime.day)
-
-        sunset_dt = get_sunset(for_date)
-        sunrise_dt = get_sunrise(for_date)
-
-        r['data']['sunset'] = sunset_dt.isoformat()
-        r['data']['sunrise'] = sunrise_dt.isoformat()
+        # Dates should be in ISO format: YYYY-MM-DD
+        try:
+            for_datetime = datetime.datetime.strptime(request["args"]["date"], "%Y-%m-%d")
+            # The sun_data functions expect a date type, so we convert to date here
+            for_date = datetime.date(for_datetime.year, for_datetime.month, for_datetime.day)
+
+            # Optional date range: sun data for every date from date through end-date
+            end_date = None
+            if "end-date" in request["args"]:
+                end_date = datetime.datetime.strptime(request["args"]["end-date"], "%Y-%m-%d").date()
+
+            sunset_dt = get_sunset(for_date)
+            sunrise_dt = get_sunrise(for_date)
+
+            r['data']['sunset'] = sunset_dt.isoformat()
+            r['data']['sunrise'] = sunrise_dt.isoformat()
+
+            if end_date is not None:
+                r['data']['days'] = get_sun_data_range(for_date, end_date)
+        except (TypeError, ValueError) as ex:
+            r['result-code'] = GetSunData.BAD_REQUEST
+            r['message'] = str(ex)
+            return r
 
         # Success
         r['result-code'] = 0
@@ -17,11 +17,13 @@
 import commands.ServerCommand as ServerCommand
 import drivers.X10ControllerAdapter
 import datetime
+from commands.command_registry import register_command
 
 
 #######################################################################
 # Command handler for GetTime command
 # Since this is the controller, we simply return the local time
+@register_command("gettime")
 class GetTime(ServerCommand.ServerCommand):
 
     #######################################################################
@@ -33,6 +33,7 @@ class ServerCommand:
     COMMAND_NOT_FOUND = HTTPStatus.NOT_FOUND
     SERVER_ERROR = HTTPStatus.INTERNAL_SERVER_ERROR
     NOT_IMPLEMENTED = HTTPStatus.NOT_IMPLEMENTED
+    SERVICE_UNAVAILABLE = HTTPStatus.SERVICE_UNAVAILABLE
     # Messages
     MSG_SUCCESS = "Success"
     MSG_BAD_REQUEST = "Incomplete/invalid request"
@@ -15,12 +15,14 @@
 #
 
 import commands.ServerCommand as ServerCommand
+from commands.command_registry import register_command
 
 
 #######################################################################
 # Command handler for GetTime command
 # We always use the host machine time. Therefor, we don't do
 # anything for this command
+@register_command("settime")
 class SetTime(ServerCommand.ServerCommand):
 
     #######################################################################
@@ -11,9 +11,14 @@
 
 import commands.ServerCommand as ServerCommand
 import datetime
+from drivers.device_driver_manager import DeviceDriverManager
+from database.table_cache import TableCache
+from commands.command_registry import register_command, CommandRegistry
+from CommandHandler import CommandHandler
 #import drivers.X10ControllerAdapter
 
 # Command handler for controller status request
+@register_command("statusrequest")
 class StatusRequest(ServerCommand.ServerCommand):
   
   # Execute the status request command.
@@ -30,5 +35,9 @@ class StatusRequest(ServerCommand.ServerCommand):
       r['day-of-week'] = str(tod.weekday())
       r['firmware-revision'] = '0.0.0.0'
       r['message'] = "Success"
+      r['admission'] = CommandHandler.get_admission().get_stats()
+      r['command-stats'] = CommandRegistry.get_stats()
+      r['drivers'] = DeviceDriverManager.get_driver_status()
+      r['db-cache'] = TableCache.get_stats()
 
       return r
\ No newline at end of file
@@ -11,26 +11,27 @@
 
 import commands.ServerCommand as ServerCommand
 from database.managed_devices import ManagedDevices
+from commands.device_fan_out import DeviceFanOut
+from commands.command_registry import register_command
 
 
+@register_command("alldevicesoff")
 class AllDevicesOff(ServerCommand.ServerCommand):
     """
     Command handler for turning on all selected devices
     """
     def Execute(self, request):
         # All defined devices
-        devices = ManagedDevices.get_all_devices()
+        devices = ManagedDevices().get_all_devices()
 
-        device_count = 0
-        for device in devices:
-            device_count += 1
-            driver = self.get_driver_for_id(device["id"])
-            result = driver.device_off(device["mfg"], device["name"], device["address"], device["channel"])
-            if result:
-                device_count -= 1
+        # All devices are turned off concurrently
+        results = DeviceFanOut.run(devices,
+                                   lambda driver, d: driver.device_off(d["mfg"], d["name"], d["address"], d["channel"]))
+        device_count, last_failure = DeviceFanOut.count_failures(results)
 
         # Generate a successful response
         r = self.CreateResponse(request["request"])
+        r['devices'] = results
 
         if device_count == 0:
             r['result-code'] = 0
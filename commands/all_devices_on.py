@@ -11,30 +11,26 @@
 
 import commands.ServerCommand as ServerCommand
 from database.managed_devices import ManagedDevices
+from commands.device_fan_out import DeviceFanOut
+from commands.command_registry import register_command
 
 
+@register_command("alldeviceson")
 class AllDevicesOn(ServerCommand.ServerCommand):
     """
     Command handler for turning on all selected devices
     """
     def Execute(self, request):
         # All defined devices
-        devices = ManagedDevices.get_all_devices()
-
-        device_count = 0
-        for device in devices:
-            device_count += 1
-            driver = self.get_driver_for_id(device["id"])
-            # Before turning on device, set its brightness and color
-            driver.set_brightness(device["mfg"], device["name"], device["address"], device["channel"],
-                                  device["brightness"])
-            driver.set_color(device["mfg"], device["name"], device["address"], device["channel"], device["color"])
-            result = driver.device_on(device["mfg"], device["name"], device["address"], device["channel"])
-            if result:
-                device_count -= 1
+        devices = ManagedDevices().get_all_devices()
+
+        # All devices are turned on concurrently
+        results = DeviceFanOut.run(devices, AllDevicesOn._device_on)
+        device_count, last_failure = DeviceFanOut.count_failures(results)
 
         # Generate a successful response
         r = self.CreateResponse(request["request"])
+        r['devices'] = results
 
         if device_count == 0:
             r['result-code'] = 0
@@ -46,3 +42,9 @@ class AllDevicesOn(ServerCommand.ServerCommand):
             r['message'] = "{0} devices failed to turn on".format(device_count)
 
         return r
+
+    @staticmethod
+    def _device_on(driver, device):
+        # Brightness, color and on in one driver request
+        return driver.apply_state(device["mfg"], device["name"], device["address"], device["channel"],
+                                  brightness=device["brightness"], hex_color=device["color"])
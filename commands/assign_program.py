@@ -11,8 +11,10 @@
 
 from commands.ServerCommand import ServerCommand
 from database.program_assignments import ProgramAssignments
+from commands.command_registry import register_command
 
 
+@register_command("assignprogram")
 class AssignProgram(ServerCommand):
     """
     Command handler for assigning a program to a device
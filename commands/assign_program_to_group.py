@@ -12,8 +12,10 @@
 from commands.ServerCommand import ServerCommand
 from database.program_assignments import ProgramAssignments
 from database.action_group_devices import ActionGroupDevices
+from commands.command_registry import register_command
 
 
+@register_command("assignprogramtogroup")
 class AssignProgramToGroup(ServerCommand):
     """
     Command handler for assigning a program to a device
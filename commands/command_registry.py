@@ -0,0 +1,198 @@
+#
+# AtHomePowerlineServer - networked server for various controllers
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Registry of command handlers.
+# A command handler class registers itself with the @register_command decorator,
+# naming the API command(s) it handles. Command handlers are stateless, so a
+# single instance of each handler class is shared by all requests.
+#
+# The registry also keeps per command call counts and a latency histogram.
+#
+
+import threading
+import os
+import re
+import logging
+from helpers.startup_timer import StartupTimer
+
+logger = logging.getLogger("server")
+
+
+class CommandStats:
+    """
+    Call count and latency histogram for a command handler class
+    """
+    # Upper bound (in ms) of each histogram bucket. The last bucket is unbounded.
+    LATENCY_BUCKETS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000, 10000]
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * (len(CommandStats.LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed, error=False):
+        self.calls += 1
+        if error:
+            self.errors += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        elapsed_ms = elapsed * 1000.0
+        for i, bound in enumerate(CommandStats.LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def to_dict(self):
+        buckets = {"<={0}ms".format(bound): self.histogram[i]
+                   for i, bound in enumerate(CommandStats.LATENCY_BUCKETS_MS)}
+        buckets[">{0}ms".format(CommandStats.LATENCY_BUCKETS_MS[-1])] = self.histogram[-1]
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "average-ms": round((self.total_time / self.calls) * 1000.0, 3) if self.calls else 0.0,
+            "max-ms": round(self.max_time * 1000.0, 3),
+            "histogram": buckets
+        }
+
+
+class CommandRegistry:
+    # Lower case command name -> shared handler instance
+    _handlers = {}
+    # Handler class name -> CommandStats
+    _stats = {}
+    # Lower case command name -> module that registers its handler
+    _index = {}
+    _lock = threading.Lock()
+
+    # Matches a decorator like @register_command("deviceon", "on")
+    _DECORATOR_RE = re.compile(r"^@register_command\(([^)]*)\)", re.MULTILINE)
+    _NAME_RE = re.compile(r"[\"']([^\"']+)[\"']")
+
+    @classmethod
+    def register(cls, handler_class, command_names):
+        """
+        Register a command handler class
+        :param handler_class: Class derived from ServerCommand
+        :param command_names: The API command names handled by the class
+        :return: None
+        """
+        handler = handler_class()
+        with cls._lock:
+            for name in command_names:
+                key = name.lower()
+                existing = cls._handlers.get(key)
+                if existing is not None and type(existing) is not handler_class:
+                    logger.error("Command %s is already registered to %s", key, type(existing).__name__)
+                    continue
+                cls._handlers[key] = handler
+            cls._stats.setdefault(handler_class.__name__, CommandStats())
+
+    @classmethod
+    def build_index(cls):
+        """
+        Scan the commands package for registered commands without importing
+        any of the command modules
+        :return: None
+        """
+        package_path = os.path.dirname(__file__)
+        index = {}
+        with StartupTimer.measure("scan commands package"):
+            for file_name in sorted(os.listdir(package_path)):
+                if not file_name.endswith(".py") or file_name.startswith("_"):
+                    continue
+                with open(os.path.join(package_path, file_name), "r", encoding="utf-8") as f:
+                    source = f.read()
+                module_name = "commands." + file_name[:-3]
+                for decorator_args in cls._DECORATOR_RE.findall(source):
+                    for name in cls._NAME_RE.findall(decorator_args):
+                        index[name.lower()] = module_name
+        with cls._lock:
+            cls._index = index
+        logger.debug("%d commands found", len(index))
+
+    @classmethod
+    def load_all(cls):
+        """
+        Import every indexed command module so that all handlers are registered
+        :return: None
+        """
+        for module_name in sorted(set(cls._index.values())):
+            StartupTimer.import_module(module_name)
+
+    @classmethod
+    def get_handler(cls, command):
+        """
+        Return the shared handler instance for a command
+        :param command: API command (case insensitive)
+        :return: Handler instance or None if the command is not registered
+        """
+        key = command.lower()
+        handler = cls._handlers.get(key)
+        if handler is None and key in cls._index:
+            # First use of the command. Importing the module registers the handler.
+            StartupTimer.import_module(cls._index[key])
+            handler = cls._handlers.get(key)
+        return handler
+
+    @classmethod
+    def get_handler_class(cls, command):
+        """
+        Return the handler class for a command
+        :param command: API command (case insensitive)
+        :return: Handler class or None if the command is not registered
+        """
+        handler = cls.get_handler(command)
+        return type(handler) if handler is not None else None
+
+    @classmethod
+    def commands(cls):
+        """
+        Return the names of all known commands, whether or not they have been loaded
+        """
+        return sorted(set(cls._index.keys()) | set(cls._handlers.keys()))
+
+    @classmethod
+    def record_call(cls, handler_class_name, elapsed, error=False):
+        """
+        Record a completed call to a command handler
+        :param handler_class_name: Name of the handler class
+        :param elapsed: Execution time in seconds
+        :param error: True if the command returned an error result
+        :return: None
+        """
+        with cls._lock:
+            cls._stats[handler_class_name].record(elapsed, error=error)
+
+    @classmethod
+    def get_stats(cls):
+        """
+        Return call counts and latency histograms for all commands that have been called
+        :return: dict keyed by handler class name
+        """
+        with cls._lock:
+            return {name: stats.to_dict() for name, stats in sorted(cls._stats.items()) if stats.calls}
+
+
+def register_command(*command_names):
+    """
+    Class decorator that registers a command handler
+    :param command_names: The API command names handled by the class
+    :return: The decorator
+    """
+    def decorator(handler_class):
+        CommandRegistry.register(handler_class, command_names)
+        return handler_class
+    return decorator
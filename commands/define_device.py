@@ -11,8 +11,10 @@
 
 import commands.ServerCommand as ServerCommand
 from database.managed_devices import ManagedDevices
+from commands.command_registry import register_command
 
 
+@register_command("definedevice")
 class DefineDevice(ServerCommand.ServerCommand):
     """
     Command handler for defining a new device
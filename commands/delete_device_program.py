@@ -11,8 +11,10 @@
 
 from commands.ServerCommand import ServerCommand
 from database.program_assignments import ProgramAssignments
+from commands.command_registry import register_command
 
 
+@register_command("deletedeviceprogram")
 class DeleteDeviceProgram(ServerCommand):
     """
     Command handler for deleting a device timer program
@@ -11,8 +11,10 @@
 
 from commands.ServerCommand import ServerCommand
 from database.programs import Programs
+from commands.command_registry import register_command
 
 
+@register_command("deleteprogram")
 class DeleteProgram(ServerCommand):
     """
     Command handler for deleting a program and its associated uses
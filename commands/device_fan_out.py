@@ -0,0 +1,140 @@
+#
+# Run a device operation on many devices concurrently
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+# Used by the group and all devices commands. Devices are grouped by
+# driver (mfg) and each driver gets at most DriverParallelism operations
+# in flight at a time, across all concurrent fan outs. The result of
+# each device operation is reported individually.
+#
+
+import threading
+import time
+import logging
+from drivers.device_driver_manager import DeviceDriverManager
+from Configuration import Configuration
+
+logger = logging.getLogger("server")
+
+
+class DeviceFanOut:
+    """
+    Singleton class that runs device operations in parallel
+    """
+    # mfg -> BoundedSemaphore limiting in flight operations for the driver
+    _driver_limits = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_driver_limit(cls, mfg):
+        """
+        Returns the (limit, semaphore) for a driver
+        """
+        with cls._lock:
+            if mfg not in cls._driver_limits:
+                parallelism = Configuration.DriverParallelism()
+                limit = max(1, int(parallelism.get(mfg, parallelism.get("default", 4))))
+                cls._driver_limits[mfg] = (limit, threading.BoundedSemaphore(limit))
+            return cls._driver_limits[mfg]
+
+    @classmethod
+    def run(cls, devices, operation):
+        """
+        Run an operation on every device. Blocks until all devices are done.
+        :param devices: List of device records (id, name, mfg, address, channel, ...)
+        :param operation: Callable(driver, device) returning True or False.
+        It runs on a fan out thread.
+        :return: List of per device results in the order of devices
+        """
+        results = [None] * len(devices)
+
+        # Work list per driver
+        by_mfg = {}
+        for index, device in enumerate(devices):
+            by_mfg.setdefault(device["mfg"].lower(), []).append(index)
+
+        threads = []
+        for mfg, indexes in by_mfg.items():
+            limit, semaphore = cls._get_driver_limit(mfg)
+            work_lock = threading.Lock()
+            for i in range(min(limit, len(indexes))):
+                t = threading.Thread(target=cls._worker,
+                                     args=(devices, indexes, work_lock, semaphore, operation, results),
+                                     name="FanOut-{0}-{1}".format(mfg, i))
+                t.daemon = True
+                threads.append(t)
+                t.start()
+
+        # Each device operation is bounded by its driver's request timeout
+        for t in threads:
+            t.join()
+
+        return results
+
+    @classmethod
+    def _worker(cls, devices, indexes, work_lock, semaphore, operation, results):
+        """
+        Take devices off the driver's work list until it is empty
+        """
+        while True:
+            with work_lock:
+                if not indexes:
+                    return
+                index = indexes.pop(0)
+            with semaphore:
+                results[index] = cls._run_one(devices[index], operation)
+
+    @classmethod
+    def _run_one(cls, device, operation):
+        """
+        Run the operation on one device and capture the result
+        :return: A dict describing the device result
+        """
+        device_result = {
+            # Group device records also carry the group assignment id
+            "id": device.get("device_id", device["id"]),
+            "name": device["name"],
+            "mfg": device["mfg"],
+            "address": device["address"],
+            "channel": device["channel"]
+        }
+        start = time.monotonic()
+        driver = DeviceDriverManager.get_driver(device["mfg"])
+        try:
+            if driver is None:
+                result = False
+                error_code = 1
+                error = "No driver for {0}".format(device["mfg"])
+            else:
+                result = operation(driver, device)
+                error_code = driver.last_error_code
+                error = driver.last_error
+        except Exception as ex:
+            logger.error("%s operation failed for device %s: %s", device["mfg"], device["name"], str(ex))
+            result = False
+            error_code = 1
+            error = str(ex)
+        device_result["elapsed-ms"] = round((time.monotonic() - start) * 1000.0, 3)
+
+        if result:
+            device_result["result-code"] = 0
+            device_result["message"] = "Success"
+        else:
+            # Some drivers leave the error code at 0 on failure
+            device_result["result-code"] = error_code if error_code else 1
+            device_result["message"] = error if error else "Device operation failed"
+        return device_result
+
+    @classmethod
+    def count_failures(cls, results):
+        """
+        Returns the number of failed devices and the last failure result (or None)
+        """
+        failures = [r for r in results if r["result-code"] != 0]
+        return len(failures), failures[-1] if failures else None
@@ -11,9 +11,11 @@
 
 from commands.ServerCommand import ServerCommand
 from drivers.device_driver_manager import DeviceDriverManager
+from commands.command_registry import register_command
 
 
 # Command handler for discover devices request
+@register_command("discoverdevices")
 class DiscoverDevices(ServerCommand):
 
     # Execute the status request command.
@@ -12,10 +12,13 @@
 
 from commands.ServerCommand import ServerCommand
 from database.action_group_devices import ActionGroupDevices
+from commands.device_fan_out import DeviceFanOut
+from commands.command_registry import register_command
 
 
 #######################################################################
 # Command handler for group off command
+@register_command("groupoff")
 class GroupOff(ServerCommand):
 
     #######################################################################
@@ -32,14 +35,18 @@ class GroupOff(ServerCommand):
             r['message'] = agd.last_error
             return r
 
-        for group_device in group_devices:
-            driver = self.get_driver_for_id(group_device["id"])
-            result = driver.device_off(group_device["mfg"], group_device["name"], group_device["address"], group_device["channel"])
+        # All devices are turned off concurrently
+        results = DeviceFanOut.run(group_devices,
+                                   lambda driver, d: driver.device_off(d["mfg"], d["name"], d["address"], d["channel"]))
+        r['devices'] = results
 
-        r['result-code'] = driver.last_error_code
-        if result:
+        failure_count, last_failure = DeviceFanOut.count_failures(results)
+        if failure_count == 0:
+            r['result-code'] = ServerCommand.SUCCESS
             r['message'] = ServerCommand.MSG_SUCCESS
         else:
-            r['message'] = driver.last_error
+            # Report the last error back to the client
+            r['result-code'] = last_failure["result-code"]
+            r['message'] = last_failure["message"]
 
         return r
@@ -11,10 +11,13 @@
 
 from commands.ServerCommand import ServerCommand
 from database.action_group_devices import ActionGroupDevices
+from commands.device_fan_out import DeviceFanOut
+from commands.command_registry import register_command
 
 
 #######################################################################
 # Command handler for group on command
+@register_command("groupon")
 class GroupOn(ServerCommand):
 
     #######################################################################
@@ -30,22 +33,18 @@ class GroupOn(ServerCommand):
             r['result-code'] = agd.last_error_code
             r['message'] = agd.last_error
             return r
-        on_count = 0
-        for group_device in group_devices:
-            driver = self.get_driver_for_id(group_device["id"])
-            result = driver.device_on(group_device["mfg"], group_device["name"], group_device["address"], group_device["channel"])
-            if request:
-                on_count += 1
-            else:
-                # Trap the last error so it can be reported back to the client
-                last_error = driver.last_error
-                last_error_code = driver.last_error_code
-
-        if on_count == len(group_devices):
+        # All devices are turned on concurrently
+        results = DeviceFanOut.run(group_devices,
+                                   lambda driver, d: driver.device_on(d["mfg"], d["name"], d["address"], d["channel"]))
+        r['devices'] = results
+
+        failure_count, last_failure = DeviceFanOut.count_failures(results)
+        if failure_count == 0:
             r['result-code'] = ServerCommand.SUCCESS
             r['message'] = ServerCommand.MSG_SUCCESS
         else:
-            r['result-code'] = last_error_code
-            r['message'] = last_error
+            # Report the last error back to the client
+            r['result-code'] = last_failure["result-code"]
+            r['message'] = last_failure["message"]
 
         return r
@@ -11,8 +11,10 @@
 
 from commands.ServerCommand import ServerCommand
 from database.action_group_devices import ActionGroupDevices
+from commands.command_registry import register_command
 
 
+@register_command("queryactiongroupdevices")
 class QueryActionGroupDevices(ServerCommand):
     """
     Command handler for querying for all devices
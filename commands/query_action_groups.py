@@ -11,8 +11,10 @@
 
 from commands.ServerCommand import ServerCommand
 from database.action_groups import ActionGroups
+from commands.command_registry import register_command
 
 
+@register_command("queryactiongroups")
 class QueryActionGroups(ServerCommand):
     """
     Command handler for querying for all devices
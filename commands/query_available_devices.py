@@ -11,7 +11,9 @@
 
 import commands.ServerCommand as ServerCommand
 from drivers.device_driver_manager import DeviceDriverManager
+from commands.command_registry import register_command
 
+@register_command("queryavailabledevices")
 class QueryAvailableDevices(ServerCommand.ServerCommand):
     """
     Command handler for querying for all available devices
@@ -11,8 +11,10 @@
 
 from commands.ServerCommand import ServerCommand
 from database.managed_devices import ManagedDevices
+from commands.command_registry import register_command
 
 
+@register_command("queryavailablegroupdevices")
 class QueryAvailableGroupDevices(ServerCommand):
     """
     Command handler for querying for all available group devices
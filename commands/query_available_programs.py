@@ -11,8 +11,10 @@
 
 from commands.ServerCommand import ServerCommand
 from database.programs import Programs
+from commands.command_registry import register_command
 
 
+@register_command("queryavailableprograms")
 class QueryAvailablePrograms(ServerCommand):
     """
     Command handler for querying for all devices
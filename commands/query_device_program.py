@@ -12,8 +12,10 @@
 from commands.ServerCommand import ServerCommand
 from database.programs import Programs
 import json
+from commands.command_registry import register_command
 
 
+@register_command("querydeviceprogram")
 class QueryDeviceProgram(ServerCommand):
     """
     Command handler for querying for all devices
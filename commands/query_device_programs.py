@@ -11,8 +11,10 @@
 
 from commands.ServerCommand import ServerCommand
 from database.programs import Programs
+from commands.command_registry import register_command
 
 
+@register_command("querydeviceprograms")
 class QueryDevicePrograms(ServerCommand):
     """
     Command handler for querying for all devices
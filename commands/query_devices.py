@@ -11,14 +11,19 @@
 
 import commands.ServerCommand as ServerCommand
 from database.managed_devices import ManagedDevices
+from commands.command_registry import register_command
+from commands.device_fan_out import DeviceFanOut
 
 
+@register_command("querydevices")
 class QueryDevices(ServerCommand.ServerCommand):
     """
     Command handler for querying for all devices
     """
     def Execute(self, request):
         args = request["args"]
+        # refresh=true asks every device for its state instead of using cached state
+        refresh = str(args.get("refresh", False)).lower() == "true"
 
         md = ManagedDevices()
         if "device-id" in args.keys():
@@ -26,18 +31,13 @@ class QueryDevices(ServerCommand.ServerCommand):
             result = md.get_device(int(device_id))
             if result:
                 # Add device specific properties to result (from driver)
-                driver = self.get_driver_for_id(device_id)
-                result["type"] = driver.get_device_type(result["address"], result["channel"])
-                result["on"] = driver.is_on(result["address"], result["channel"])
+                self._add_device_state([result], refresh)
             key = "device"
         else:
             result = md.get_all_devices()
             if result:
                 # Add device specific properties to each result (from driver)
-                for device in result:
-                    driver = self.get_driver_for_id(device["id"])
-                    device["type"] = driver.get_device_type(device["address"], device["channel"])
-                    device["on"] = driver.is_on(device["address"], device["channel"])
+                self._add_device_state(result, refresh)
             key = "devices"
 
         # Generate a successful response
@@ -53,3 +53,30 @@ class QueryDevices(ServerCommand.ServerCommand):
             r['message'] = md.last_error
 
         return r
+
+    def _add_device_state(self, devices, refresh):
+        """
+        Add the type and on/off state of each device. Cached state is used
+        when it is fresh. All other devices are asked in parallel.
+        :param devices: List of device records
+        :param refresh: True to ask every device
+        :return: None
+        """
+        poll_devices = []
+        for device in devices:
+            driver = self.get_driver_for_mfg(device["mfg"])
+            state = driver.get_cached_state(device["address"], device["channel"]) \
+                if driver is not None and not refresh else None
+            if state is not None:
+                device.update(state)
+            else:
+                poll_devices.append(device)
+
+        def poll(driver, device):
+            # Each device record is only touched by one fan out thread
+            device["type"] = driver.get_device_type(device["address"], device["channel"])
+            device["on"] = driver.is_on(device["address"], device["channel"], refresh=refresh)
+            return True
+
+        if poll_devices:
+            DeviceFanOut.run(poll_devices, poll)
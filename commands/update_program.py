@@ -14,10 +14,12 @@ from commands.ServerCommand import ServerCommand
 from database.programs import Programs
 import logging
 import json
+from commands.command_registry import register_command
 
 logger = logging.getLogger("server")
 
 
+@register_command("updateprogram")
 class UpdateProgram(ServerCommand):
     """
     Command handler for defining a new timer program
@@ -13,19 +13,150 @@
 #
 # AtHomePowerlineServer database
 #
+# Connections are pooled. Opening a connection and applying the
+# pragmas is done once per pooled connection instead of once per query.
+# The table classes use connections exactly as before: GetConnection()
+# to borrow one and conn.close() to return it to the pool.
+#
 
 import sqlite3
 import os.path
 import datetime
+import threading
 import logging
 import Configuration
+from database.table_cache import TableCache
 
 logger = logging.getLogger("server")
 
 
+#######################################################################
+class PooledConnection(sqlite3.Connection):
+    """
+    An SQLite connection that returns itself to its pool when closed
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        # Set by the first close of a borrow. Once released, the connection
+        # may already belong to the next borrower.
+        self.released = False
+
+    def close(self):
+        # A second close of the same borrow does nothing
+        if self.released:
+            return
+        self.released = True
+        if self.pool is None or not self.pool.release(self):
+            super().close()
+
+    def discard(self):
+        """
+        Really close the connection
+        """
+        self.pool = None
+        super().close()
+
+
+#######################################################################
+class ConnectionPool:
+    """
+    A thread safe pool of idle SQLite connections
+    """
+    # Applied once to every new connection
+    PRAGMAS = [
+        # Enforce foreign keys (cascading deletes)
+        "PRAGMA foreign_keys = ON",
+        # With WAL, NORMAL is safe from corruption and avoids a sync per commit
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA temp_store = MEMORY",
+    ]
+
+    def __init__(self, database_path, max_idle=8, busy_timeout=5.0):
+        """
+        Create a pool of connections for a database file
+        :param database_path: Full path to the database file
+        :param max_idle: Maximum number of idle connections kept open
+        :param busy_timeout: Seconds to wait for a lock held by another connection
+        """
+        self._database_path = database_path
+        self._max_idle = max_idle
+        self._busy_timeout = busy_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @property
+    def database_path(self):
+        return self._database_path
+
+    def acquire(self):
+        """
+        Borrow a connection from the pool
+        :return: A PooledConnection
+        """
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                conn = self._idle.pop()
+                conn.pool = self
+                conn.released = False
+                return conn
+            self.created += 1
+
+        # Pooled connections move between threads, but only one thread uses a connection at a time
+        conn = sqlite3.connect(self._database_path, timeout=self._busy_timeout,
+                               factory=PooledConnection, check_same_thread=False)
+        # We use the row factory to get named row columns. Makes handling row sets easier.
+        conn.row_factory = sqlite3.Row
+        # The default string type is unicode. This changes it to UTF-8.
+        conn.text_factory = str
+        for pragma in ConnectionPool.PRAGMAS:
+            conn.execute(pragma)
+        conn.commit()
+        conn.pool = self
+        return conn
+
+    def release(self, conn):
+        """
+        Return a connection to the pool
+        :param conn: A connection acquired from this pool
+        :return: True if the connection was kept, False if it should be closed
+        """
+        try:
+            # Do not carry an uncommitted transaction into the next borrower
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as ex:
+            logger.error("Discarding database connection: %s", str(ex))
+            return False
+
+        with self._lock:
+            if len(self._idle) < self._max_idle:
+                conn.pool = None
+                self._idle.append(conn)
+                return True
+        return False
+
+    def close_all(self):
+        """
+        Close all idle connections
+        :return: None
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for conn in idle:
+            conn.discard()
+
+
 #######################################################################
 class AtHomePowerlineServerDb:
     DatabaseFileName = "AtHomePowerlineServer.sqlite3"
+    # Created on first use
+    _pool = None
+    _pool_lock = threading.Lock()
 
     def __init__(self):
         pass
@@ -43,6 +174,13 @@ class AtHomePowerlineServerDb:
             logger.info("Created database file: %s",
                         Configuration.Configuration.GetDatabaseFilePath(cls.DatabaseFileName))
 
+        # WAL lets readers run while a write is in progress. The setting is
+        # stored in the database file, so it only needs to be set once.
+        conn = cls.GetConnection()
+        journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        conn.close()
+        logger.info("Database journal mode: %s", journal_mode)
+
     @classmethod
     def CreateDatabase(cls):
         """
@@ -113,18 +251,40 @@ class AtHomePowerlineServerDb:
         conn.close()
 
     #######################################################################
-    # Returns a database connection
+    # Returns a database connection. Closing the connection returns it to the pool.
     @classmethod
     def GetConnection(cls):
-        conn = sqlite3.connect(Configuration.Configuration.GetDatabaseFilePath(cls.DatabaseFileName))
-        # We use the row factory to get named row columns. Makes handling row sets easier.
-        conn.row_factory = sqlite3.Row
-        # The default string type is unicode. This changes it to UTF-8.
-        conn.text_factory = str
-        # Enable foreign keys for this connections
-        conn.execute("PRAGMA foreign_keys = ON")
-        conn.commit()
-        return conn
+        return cls.GetPool().acquire()
+
+    #######################################################################
+    @classmethod
+    def GetPool(cls):
+        """
+        Return the connection pool, creating it if necessary
+        :return: ConnectionPool instance
+        """
+        database_path = Configuration.Configuration.GetDatabaseFilePath(cls.DatabaseFileName)
+        with cls._pool_lock:
+            if cls._pool is None or cls._pool.database_path != database_path:
+                if cls._pool is not None:
+                    cls._pool.close_all()
+                    # Cached results came from the old database
+                    TableCache.clear()
+                cls._pool = ConnectionPool(database_path,
+                                           max_idle=Configuration.Configuration.DatabasePoolSize())
+            return cls._pool
+
+    #######################################################################
+    @classmethod
+    def ClosePool(cls):
+        """
+        Close all pooled connections (e.g. at shutdown)
+        :return: None
+        """
+        with cls._pool_lock:
+            if cls._pool is not None:
+                cls._pool.close_all()
+                cls._pool = None
 
     #######################################################################
     @classmethod
@@ -16,12 +16,14 @@
 
 from database.AtHomePowerlineServerDb import AtHomePowerlineServerDb
 from .base_table import BaseTable
+from .table_cache import cached_query, invalidates
 
 
 class ActionGroupDevices(BaseTable):
     def __init__(self):
         pass
 
+    @cached_query("ManagedDevices", "ActionGroupDevices")
     def get_group_devices(self, group_id):
         self.clear_last_error()
 
@@ -46,6 +48,7 @@ class ActionGroupDevices(BaseTable):
 
         return result
 
+    @invalidates("ActionGroupDevices")
     def insert_device(self, group_id, device_id):
         """
         Insert a group device record
@@ -77,6 +80,7 @@ class ActionGroupDevices(BaseTable):
 
         return id
 
+    @invalidates("ActionGroupDevices")
     def delete_device(self, group_id, device_id):
         self.clear_last_error()
 
@@ -90,7 +94,7 @@ class ActionGroupDevices(BaseTable):
                 {"group_id": group_id, "device_id": device_id}
             )
             conn.commit()
-            change_count = conn.total_changes
+            change_count = c.rowcount
         except Exception as ex:
             self.set_last_error(ActionGroupDevices.SERVER_ERROR, str(ex))
             change_count = 0
@@ -16,12 +16,14 @@
 
 from database.AtHomePowerlineServerDb import AtHomePowerlineServerDb
 from .base_table import BaseTable
+from .table_cache import cached_query, invalidates
 
 
 class ActionGroups(BaseTable):
     def __init__(self):
         pass
 
+    @cached_query("ActionGroups")
     def get_all_groups(self):
         self.clear_last_error()
 
@@ -67,6 +69,7 @@ class ActionGroups(BaseTable):
     #
     #     return result
 
+    @cached_query("ActionGroups")
     def get_group_by_id(self, id):
         self.clear_last_error()
 
@@ -89,6 +92,7 @@ class ActionGroups(BaseTable):
 
         return result
 
+    @invalidates("ActionGroups")
     def insert(self, group_name):
         """
         Insert a group record
@@ -118,6 +122,7 @@ class ActionGroups(BaseTable):
 
         return id
 
+    @invalidates("ActionGroups")
     def update(self, id, name):
         """
         Update a group record
@@ -136,7 +141,7 @@ class ActionGroups(BaseTable):
                 (name, id)
             )
             conn.commit()
-            change_count = conn.total_changes
+            change_count = c.rowcount
         except Exception as ex:
             self.set_last_error(ActionGroups.SERVER_ERROR, str(ex))
             change_count = 0
@@ -147,6 +152,7 @@ class ActionGroups(BaseTable):
 
         return change_count
 
+    @invalidates("ActionGroups", "ActionGroupDevices")
     def delete(self, id):
         """
         Delete a record by its ID
@@ -165,7 +171,7 @@ class ActionGroups(BaseTable):
                 {"id": id}
             )
             conn.commit()
-            change_count = conn.total_changes
+            change_count = c.rowcount
         except Exception as ex:
             self.set_last_error(ActionGroups.SERVER_ERROR, str(ex))
             change_count = 0
@@ -11,6 +11,7 @@
 
 from database.AtHomePowerlineServerDb import AtHomePowerlineServerDb
 from .base_table import BaseTable
+from .table_cache import cached_query, invalidates
 import datetime
 import logging
 
@@ -51,6 +52,7 @@ class ManagedDevices(BaseTable):
     #######################################################################
     # Empty all records from the Devices table
     @classmethod
+    @invalidates("ManagedDevices", "ProgramAssignments", "ActionGroupDevices")
     def delete_all(cls):
         conn = AtHomePowerlineServerDb.GetConnection()
         c = AtHomePowerlineServerDb.GetCursor(conn)
@@ -58,6 +60,7 @@ class ManagedDevices(BaseTable):
         conn.commit()
         conn.close()
 
+    @cached_query("ManagedDevices")
     def get_all_devices(self):
         self.clear_last_error()
 
@@ -79,6 +82,7 @@ class ManagedDevices(BaseTable):
 
         return result
 
+    @cached_query("ManagedDevices")
     def get_devices_for_mfg(self, mfg):
         """
         Query DB for all managed devices of a specific manufacturer (tplink or meross)
@@ -104,6 +108,7 @@ class ManagedDevices(BaseTable):
 
         return result
 
+    @cached_query("ManagedDevices")
     def get_device(self, device_id):
         self.clear_last_error()
 
@@ -124,6 +129,7 @@ class ManagedDevices(BaseTable):
 
         return result
 
+    @invalidates("ManagedDevices")
     def insert(self, device_name, device_location, device_mfg, device_address, device_channel,
                device_color, device_brightness):
         """
@@ -166,6 +172,7 @@ class ManagedDevices(BaseTable):
         # Return new record ID
         return id
 
+    @invalidates("ManagedDevices")
     def update(self, device_id, device_name, device_location, device_mfg, device_address, device_channel,
                device_color, device_brightness):
         """
@@ -198,7 +205,7 @@ class ManagedDevices(BaseTable):
                          device_color, device_brightness, datetime.datetime.now(), device_id)
                       )
             conn.commit()
-            change_count = conn.total_changes
+            change_count = c.rowcount
         except Exception as ex:
             self.last_error_code = ManagedDevices.SERVER_ERROR
             self.last_error = str(ex)
@@ -210,6 +217,7 @@ class ManagedDevices(BaseTable):
 
         return change_count
 
+    @invalidates("ManagedDevices", "ProgramAssignments", "ActionGroupDevices")
     def delete_device(self, device_id):
         self.clear_last_error()
 
@@ -219,7 +227,7 @@ class ManagedDevices(BaseTable):
             c = AtHomePowerlineServerDb.GetCursor(conn)
             c.execute("DELETE FROM ManagedDevices WHERE id=:deviceid", {"deviceid": device_id})
             conn.commit()
-            change_count = conn.total_changes
+            change_count = c.rowcount
         except Exception as ex:
             self.last_error_code = ManagedDevices.SERVER_ERROR
             self.last_error = str(ex)
@@ -231,6 +239,7 @@ class ManagedDevices(BaseTable):
 
         return change_count
 
+    @cached_query("ManagedDevices")
     def get_device_by_id(self, device_id):
         """
         Return the dvice record for a given device
@@ -256,6 +265,7 @@ class ManagedDevices(BaseTable):
 
         return result
 
+    @cached_query("ManagedDevices", "ProgramAssignments")
     def get_devices_for_program(self, program_id):
         self.clear_last_error()
 
@@ -278,6 +288,7 @@ class ManagedDevices(BaseTable):
 
         return result
 
+    @cached_query("ManagedDevices", "ActionGroupDevices")
     def get_all_available_group_devices(self, group_id):
         self.clear_last_error()
 
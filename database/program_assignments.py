@@ -16,12 +16,14 @@
 
 from database.AtHomePowerlineServerDb import AtHomePowerlineServerDb
 from .base_table import BaseTable
+from .table_cache import cached_query, invalidates
 
 
 class ProgramAssignments(BaseTable):
     def __init__(self):
         pass
 
+    @invalidates("ProgramAssignments")
     def insert(self, device_id, program_id):
         """
         Insert a program assignment record
@@ -53,6 +55,7 @@ class ProgramAssignments(BaseTable):
 
         return id
 
+    @invalidates("ProgramAssignments")
     def delete(self, device_id, program_id):
         self.clear_last_error()
 
@@ -66,7 +69,7 @@ class ProgramAssignments(BaseTable):
                 {"device_id": device_id, "program_id": program_id}
             )
             conn.commit()
-            change_count = conn.total_changes
+            change_count = c.rowcount
         except Exception as ex:
             self.set_last_error(ProgramAssignments.SERVER_ERROR, str(ex))
             change_count = 0
@@ -77,6 +80,7 @@ class ProgramAssignments(BaseTable):
 
         return change_count
 
+    @cached_query("ProgramAssignments")
     def is_assigned(self, device_id, program_id):
         """
         Answers the question: Is this program assigned to the given device?
@@ -97,7 +101,6 @@ class ProgramAssignments(BaseTable):
                 {"device_id": device_id, "program_id": program_id}
             )
             program_is_assigned = rset.fetchone() is not None
-            conn.close()
         except Exception as ex:
             self.set_last_error(ProgramAssignments.SERVER_ERROR, str(ex))
             program_is_assigned = None
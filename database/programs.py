@@ -16,6 +16,7 @@
 
 from database.AtHomePowerlineServerDb import AtHomePowerlineServerDb
 from .base_table import BaseTable
+from .table_cache import cached_query, invalidates
 import datetime
 
 
@@ -29,6 +30,7 @@ class Programs(BaseTable):
     #######################################################################
     # Empty all records from the Programs table
     @classmethod
+    @invalidates("Programs", "ProgramAssignments")
     def DeleteAll(cls):
         conn = AtHomePowerlineServerDb.GetConnection()
         c = AtHomePowerlineServerDb.GetCursor(conn)
@@ -37,6 +39,7 @@ class Programs(BaseTable):
         conn.close()
         return True
 
+    @cached_query("Programs")
     def get_all_programs(self):
         """
         Return the set of all records in the Programs table
@@ -63,6 +66,7 @@ class Programs(BaseTable):
 
         return result
 
+    @cached_query("Programs")
     def get_all_active_programs(self):
         """
         Return the set of all records where the program command is not none
@@ -89,6 +93,7 @@ class Programs(BaseTable):
 
         return result
 
+    @cached_query("Programs", "ProgramAssignments")
     def get_all_device_programs(self, device_id):
         """
         Return the set of programs for a given device
@@ -118,6 +123,7 @@ class Programs(BaseTable):
 
         return result
 
+    @cached_query("Programs", "ProgramAssignments")
     def get_all_available_programs(self, device_id):
         """
         Return all programs that ARE NOT assigned to a device
@@ -148,6 +154,7 @@ class Programs(BaseTable):
 
         return result
 
+    @cached_query("Programs")
     def get_program_by_id(self, programid):
         """
         Return a specific Programs record
@@ -176,6 +183,7 @@ class Programs(BaseTable):
 
         return result
 
+    @invalidates("Programs")
     def insert(self, name, day_mask,
                trigger_method, program_time, offset, randomize, randomize_amount,
                action, color, brightness):
@@ -220,6 +228,7 @@ class Programs(BaseTable):
 
         return id
 
+    @invalidates("Programs")
     def update(self, id, name, day_mask,
                trigger_method, program_time, offset, randomize, randomize_amount,
                action, color, brightness):
@@ -252,7 +261,7 @@ class Programs(BaseTable):
                  action, color, brightness, datetime.datetime.now(), id)
             )
             conn.commit()
-            change_count = conn.total_changes
+            change_count = c.rowcount
         except Exception as ex:
             self.set_last_error(Programs.SERVER_ERROR, str(ex))
             change_count = 0
@@ -263,6 +272,7 @@ class Programs(BaseTable):
 
         return change_count
 
+    @invalidates("Programs", "ProgramAssignments")
     def delete(self, id):
         """
         Delete a given program record
@@ -280,7 +290,7 @@ class Programs(BaseTable):
                 "DELETE FROM Programs WHERE id=:id", {"id": id}
             )
             conn.commit()
-            change_count = conn.total_changes
+            change_count = c.rowcount
         except Exception as ex:
             self.set_last_error(Programs.SERVER_ERROR, str(ex))
             change_count = 0
@@ -0,0 +1,211 @@
+#
+# Write-through cache of database query results
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# The table classes mark their query methods with @cached_query, naming the
+# tables each query reads, and their insert/update/delete methods with
+# @invalidates, naming the tables each write changes (including tables changed
+# by cascading deletes). A write drops every cached result that depends on
+# one of the changed tables.
+#
+# Callers frequently modify the rows they are given (e.g. QueryDevices adds
+# the device's on/off state), so the cache always hands out copies.
+#
+
+import functools
+import threading
+import logging
+
+logger = logging.getLogger("server")
+
+
+def _copy_result(result):
+    """
+    Copy a query result. Results are rows (dicts of column values),
+    lists of rows or scalars. Column values are immutable, so copying
+    each row is enough.
+    """
+    if isinstance(result, list):
+        return [dict(row) if isinstance(row, dict) else row for row in result]
+    if isinstance(result, dict):
+        return dict(result)
+    return result
+
+
+class TableCache:
+    """
+    Singleton, process wide cache of query results
+    """
+    # key -> (tables, result)
+    _entries = {}
+    # table name -> generation number, bumped by every write to the table
+    _generations = {}
+    _lock = threading.Lock()
+    # (tables, callback) called after a write to any of the tables
+    _listeners = []
+    hits = 0
+    misses = 0
+    invalidations = 0
+
+    @classmethod
+    def lookup(cls, key):
+        """
+        Look up a cached result
+        :param key: Hashable query key
+        :return: A tuple (found, copy of the result)
+        """
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None:
+                cls.misses += 1
+                return False, None
+            cls.hits += 1
+            result = entry[1]
+        return True, _copy_result(result)
+
+    @classmethod
+    def generation(cls, tables):
+        """
+        Snapshot the generation of a set of tables before running a query
+        :param tables: Table names
+        :return: Opaque generation snapshot for store()
+        """
+        with cls._lock:
+            return tuple(cls._generations.get(t, 0) for t in tables)
+
+    @classmethod
+    def store(cls, key, tables, result, generation):
+        """
+        Cache a query result unless one of its tables changed while the query ran
+        :param key: Hashable query key
+        :param tables: Table names the query reads
+        :param result: The query result
+        :param generation: Snapshot from generation() taken before the query
+        :return: None
+        """
+        result = _copy_result(result)
+        with cls._lock:
+            if tuple(cls._generations.get(t, 0) for t in tables) == generation:
+                cls._entries[key] = (tables, result)
+
+    @classmethod
+    def invalidate(cls, *tables):
+        """
+        Drop all cached results that depend on any of the given tables
+        :param tables: Table names
+        :return: None
+        """
+        with cls._lock:
+            for t in tables:
+                cls._generations[t] = cls._generations.get(t, 0) + 1
+            stale = [key for key, entry in cls._entries.items() if not entry[0].isdisjoint(tables)]
+            for key in stale:
+                del cls._entries[key]
+            cls.invalidations += 1
+            listeners = [callback for listen_tables, callback in cls._listeners
+                         if not listen_tables.isdisjoint(tables)]
+        logger.debug("Cache invalidated for %s (%d entries)", ", ".join(tables), len(stale))
+
+        for callback in listeners:
+            try:
+                callback()
+            except Exception as ex:
+                logger.error("Table change listener failed: %s", str(ex))
+
+    @classmethod
+    def add_listener(cls, tables, callback):
+        """
+        Register a callback to be called (with no arguments) after any write to the given tables
+        :param tables: List of table names
+        :param callback: Callable
+        :return: None
+        """
+        with cls._lock:
+            cls._listeners.append((frozenset(tables), callback))
+
+    @classmethod
+    def remove_listener(cls, callback):
+        """
+        Remove a callback registered with add_listener
+        :param callback: Callable
+        :return: None
+        """
+        with cls._lock:
+            cls._listeners = [entry for entry in cls._listeners if entry[1] != callback]
+
+    @classmethod
+    def clear(cls):
+        """
+        Drop all cached results
+        :return: None
+        """
+        with cls._lock:
+            cls._entries = {}
+            cls.invalidations += 1
+
+    @classmethod
+    def get_stats(cls):
+        """
+        Return the cache counters
+        :return: dict
+        """
+        with cls._lock:
+            return {
+                "entries": len(cls._entries),
+                "hits": cls.hits,
+                "misses": cls.misses,
+                "invalidations": cls.invalidations
+            }
+
+
+def cached_query(*tables):
+    """
+    Decorator for a table class query method. The result is cached
+    until one of the named tables is changed.
+    :param tables: The tables the query reads
+    :return: The decorator
+    """
+    table_set = frozenset(tables)
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = (type(self).__name__, method.__name__, args, tuple(sorted(kwargs.items())))
+            found, result = TableCache.lookup(key)
+            if found:
+                self.clear_last_error()
+                return result
+
+            generation = TableCache.generation(table_set)
+            result = method(self, *args, **kwargs)
+            # Errors are not cached
+            if result is not None and not self.last_error_code:
+                TableCache.store(key, table_set, result, generation)
+            return result
+        return wrapper
+    return decorator
+
+
+def invalidates(*tables):
+    """
+    Decorator for a table class method that changes the named tables
+    :param tables: The tables changed by the method, including cascading deletes
+    :return: The decorator
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                TableCache.invalidate(*tables)
+        return wrapper
+    return decorator
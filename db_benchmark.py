@@ -0,0 +1,113 @@
+#
+# AtHomePowerlineServer - database benchmark
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Times the querydevices command and the timer service (building the daily
+# TimerSchedule, looking up due events and running one program's actions)
+# against a scratch database. Device actions go to the dummy driver so only
+# database and server overhead is measured.
+#
+# Usage: python db_benchmark.py [devices] [programs] [iterations]
+#
+
+import sys
+import time
+import datetime
+import tempfile
+import shutil
+import logging
+from Configuration import Configuration
+
+
+def populate(device_count, program_count):
+    from database.AtHomePowerlineServerDb import AtHomePowerlineServerDb
+    from database.managed_devices import ManagedDevices
+    from database.programs import Programs
+    from database.program_assignments import ProgramAssignments
+
+    AtHomePowerlineServerDb.Initialize()
+    md = ManagedDevices()
+    device_ids = []
+    for i in range(device_count):
+        device_ids.append(md.insert("Device {0}".format(i), "Room {0}".format(i % 5), "tplink",
+                                    "192.168.1.{0}".format(i + 10), 0, "#FFFFFF", 100))
+
+    # Half of the programs trigger in the current minute and the rest one hour later
+    now = datetime.datetime.now()
+    pd = Programs()
+    pa = ProgramAssignments()
+    for i in range(program_count):
+        program_time = now if i % 2 == 0 else now + datetime.timedelta(hours=1)
+        program_id = pd.insert("Program {0}".format(i), "MTWTFSS", "clock-time",
+                               program_time.strftime("%Y-%m-%d %H:%M:00"), 0, 0, 0, "on", "#FFFFFF", 100)
+        for device_id in device_ids[i % 4::4]:
+            pa.insert(device_id, program_id)
+
+
+def benchmark(name, func, iterations):
+    # One untimed call to warm up imports and caches
+    func()
+    start = time.perf_counter()
+    for i in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    print("{0:20s} {1:6d} calls {2:10.4f} ms/call".format(name, iterations, (elapsed / iterations) * 1000.0))
+
+
+def main():
+    device_count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    program_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    logging.getLogger("server").setLevel(logging.CRITICAL)
+
+    db_dir = tempfile.mkdtemp()
+    try:
+        Configuration.ActiveConfig = {
+            "DatabasePath": db_dir,
+            "EnabledDrivers": ["dummy"],
+        }
+        populate(device_count, program_count)
+
+        from drivers.device_driver_manager import DeviceDriverManager
+        from drivers.Dummy import Dummy
+        from CommandHandler import CommandHandler
+        from services.TimerServiceThread import TimerServiceThread
+        from services.timer_schedule import TimerSchedule
+        from database.programs import Programs
+
+        # The benchmark devices are tplink devices handled by the dummy driver
+        DeviceDriverManager.driver_list["tplink"] = Dummy()
+
+        print("{0} devices, {1} programs".format(device_count, program_count))
+        benchmark("querydevices",
+                  lambda: CommandHandler.Execute({"request": "querydevices", "args": {}}),
+                  iterations)
+
+        # Done at startup, at midnight and whenever a program changes
+        today = datetime.date.today()
+        benchmark("schedule build", lambda: TimerSchedule.build(today), iterations)
+        # Done at every timer service wake up. Nothing is due at the start of
+        # the day, so the schedule is not used up.
+        schedule = TimerSchedule.build(today)
+        start_of_day = datetime.datetime.combine(today, datetime.time())
+        benchmark("schedule lookup", lambda: (schedule.pop_due(start_of_day), schedule.next_fire_time),
+                  iterations * 1000)
+        # Done for every event that is due (assigned devices and device commands)
+        timer_thread = TimerServiceThread(1, "Benchmark")
+        program = Programs().get_all_active_programs()[0]
+        benchmark("timer action", lambda: timer_thread.RunTimerAction(program), iterations)
+    finally:
+        shutil.rmtree(db_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -37,12 +37,13 @@
 #
 
 from drivers.base_driver_interface import BaseDriverInterface
+from drivers.x10_command_queue import X10CommandQueue
+from drivers.xtb232_serial import XTB232Serial
 import Configuration
 import serial
-import datetime
+import threading
+import concurrent.futures
 import logging
-import binascii
-import time
 
 logger = logging.getLogger("server")
 
@@ -53,11 +54,11 @@ class XTB232(BaseDriverInterface):
     """
 
     # XTB232/CM11A constants. See CM11a Protocol.txt spec for these values.
-    InterfaceAck = 0x00
-    InterfaceReady = 0x55
-    InterfacePoll = 0x5A
-    InterfacePollAck = 0xC3
-    InterfaceTimeRequest = 0xA5
+    InterfaceAck = XTB232Serial.InterfaceAck
+    InterfaceReady = XTB232Serial.InterfaceReady
+    InterfacePoll = XTB232Serial.InterfacePoll
+    InterfacePollAck = XTB232Serial.InterfacePollAck
+    InterfaceTimeRequest = XTB232Serial.InterfaceTimeRequest
     SelectFunction = 0x04
 
     # Device functions
@@ -75,29 +76,57 @@ class XTB232(BaseDriverInterface):
     HdrAlwaysOne = 0x04
 
     # Error codes
-    Success = 0
-    ChecksumTimeout = 1
-    InterfaceReadyTimeout = 2
+    Success = XTB232Serial.Success
+    ChecksumTimeout = XTB232Serial.ChecksumTimeout
+    InterfaceReadyTimeout = XTB232Serial.InterfaceReadyTimeout
     AckNotReceived = 3
     PortNotAvailable = 4
     AccessException = 5
-    ChecksumError = 6
+    ChecksumError = XTB232Serial.ChecksumError
 
     # ************************************************************************
     def __init__(self):
         super().__init__()
+        self.port = None
+        # Serial reader/sender threads
+        self._serial = None
+        self.LastErrorCode = XTB232.Success
+        self.LastError = None
+        # Batches on/off/dim commands into multi-address transmissions
+        self._command_queue = None
+        # Keeps an address selection and its function together
+        self._transmit_lock = threading.RLock()
+        # Serial round trip time accumulated by the calling thread
+        self._serial_time = threading.local()
 
     # ************************************************************************
     # Open the device
     def open(self, kwargs=None):
-        self.InitializeController()
+        if not self.InitializeController():
+            return False
+        gather_window = Configuration.Configuration.X10GatherWindow()
+        if gather_window > 0.0:
+            self._command_queue = X10CommandQueue(self._send_batch, gather_window)
+            logger.info("X10 command gather window is %f sec", gather_window)
+        return True
 
     # ************************************************************************
     # Close the device
     def close(self):
         logger.info("Closing XTB232 controller")
+        if self._command_queue is not None:
+            self._command_queue.close()
+            self._command_queue = None
+        if self._serial is not None:
+            stats = self._serial.get_stats()
+            logger.info("XTB232 sent %d transmissions, round trip avg %f ms, max %f ms",
+                        stats["transmissions"], stats["avg-round-trip-ms"], stats["max-round-trip-ms"])
+            self._serial.close()
+            self._serial = None
         if self.port is not None:
             self.port.close()
+            self.port = None
+        return True
 
     # ************************************************************************
     # Turn a device on
@@ -176,15 +205,41 @@ class XTB232(BaseDriverInterface):
 
     # Common function for sending a complete function to the controller.
     # The device function code is treated as a data value.
+    # With a command queue, the function may be sent together with
+    # other commands for the same house code and function.
     def ExecuteFunction(self, house_device_code, dim_amount, device_function):
         logger.debug("Executing function: %s", self.GetFunctionName(device_function))
-        # First part of two step sequence. Select the specific device that is the command target.
-        if not self.SelectAddress(house_device_code):
-            logger.error("SelectAddress failed")
-            return False
+        if self._command_queue is None:
+            return self.ExecuteMultiAddressFunction(house_device_code[0:1], [house_device_code],
+                                                    dim_amount, device_function)
 
-        # Second part, send the command for all devices selected for the house code.
-        return self.SendStandardCommand(house_device_code[0:1], dim_amount, device_function)
+        command = self._command_queue.submit(house_device_code, dim_amount, device_function)
+        # The error belongs to the calling thread
+        self.last_error_code = command.last_error_code
+        self.last_error = command.last_error
+        self._add_serial_time(command.round_trip_time)
+        return command.result
+
+    # ************************************************************************
+    # Select one or more devices on a house code, then send one function
+    # that applies to all of them.
+    def ExecuteMultiAddressFunction(self, house_code, house_device_codes, dim_amount, device_function):
+        with self._transmit_lock:
+            # First part of two step sequence. Select the specific devices that are the command target.
+            for house_device_code in house_device_codes:
+                if not self.SelectAddress(house_device_code):
+                    logger.error("SelectAddress failed")
+                    return False
+
+            # Second part, send the command for all devices selected for the house code.
+            return self.SendStandardCommand(house_code, dim_amount, device_function)
+
+    # ************************************************************************
+    # Called by the command queue on its sender thread
+    def _send_batch(self, house_code, house_device_codes, dim_amount, device_function):
+        self.clear_last_error()
+        result = self.ExecuteMultiAddressFunction(house_code, house_device_codes, dim_amount, device_function)
+        return result, self.last_error_code, self.last_error
 
     # ************************************************************************
     def SendStandardCommand(self, house_code, dim_amount, device_function):
@@ -197,7 +252,8 @@ class XTB232(BaseDriverInterface):
 
         logger.info(self.FormatStandardTransmission(Xfunction))
 
-        return self.SendCommand(Xfunction)
+        with self._transmit_lock:
+            return self.SendCommand(Xfunction)
 
     # ************************************************************************
     # Return a datetime type
@@ -234,110 +290,30 @@ class XTB232(BaseDriverInterface):
         logger.info("Initializing XTB232 controller...")
         # Open the COM port
         self.com_port = Configuration.Configuration.ComPort()
+        if not self.com_port:
+            self._set_port_error("ComPort is not configured")
+            return False
         try:
             # self.port = serial.Serial(self.com_port, baudrate=4800, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=2)
-            self.port = serial.Serial(self.com_port, 4800, timeout=2)
+            # The short timeout lets the reader thread notice when it is closed
+            self.port = serial.Serial(self.com_port, 4800, timeout=XTB232Serial.READ_TIMEOUT)
             logger.info("XTB232 controller on COM port: %s", self.com_port)
         except Exception as ex:
             self.port = None
-            logger.error("Unable to open COM port: %s", self.com_port)
-            logger.error(str(ex))
-            return
-
-        # Handshake with controller. Usually the controller wants
-        # the current time.
-        self.ResetController()
-
-    # ************************************************************************
-    def ResetController(self, interface_response=None):
-        logger.info("Resetting controller to a known state")
-        # Handshake with controller. Usually the controller wants
-        # the current time.
-        if interface_response is None:
-            response = self.ReadSerialByte()
-        else:
-            response = interface_response
-
-        reset_complete = False
-        while not reset_complete:
-            if (response is not None) and (response != 0):
-                logger.info("ResetController byte received: %x", response)
-                # Does the controller want the time?
-                if response == XTB232.InterfaceTimeRequest:
-                    logger.info("ResetController received InterfaceTimeRequest. Setting interface time now.")
-                    self.SetInterfaceTime(datetime.datetime.now())
-                    time.sleep(0.2)
-                    response = self.ReadSerialByte()
-                    logger.info("ResetController response from SetInterfaceTime was %x", response)
-                    # Regardless of the response, we'll send and ACK
-                    self.SendAck()
-                # Is this an interface ready signal?
-                elif response == XTB232.InterfaceReady:
-                    logger.info("ResetController received interface ready")
-                    # response = self.ReadSerialByte()
-                    reset_complete = True
-                elif response == XTB232.InterfacePoll:
-                    logger.info("ResetController received interface poll")
-                    count = self.receive_data()
-                    if count:
-                        reset_complete = True
-                else:
-                    logger.info("ResetController unexpected byte %x", response)
-                    # Read another byte from the controller and hope for something better
-                    response = self.ReadSerialByte()
-            else:
-                # If the controller did not provide another byte, give up.
-                # Empirically, the XTB-232 seems to be in sync when this happens.
-                logger.info("ResetController received None or 0")
-                reset_complete = True
-
-        logger.info("ResetController arrived at a known state")
-
-    def receive_data(self):
-        """
-        Receive data from an interface poll request.
-        The data is effectively ignored.
-        :return:
-        """
-        # Send poll ack
-        ack = bytearray(1)
-        ack[0] = XTB232.InterfacePollAck
-        self.port.write(ack)
-
-        # Receive data.
-        # Note that the serial read returns bytes
-        count = ord(self.port.read(1))
-        # The maximum count is 9 (see CM11a Protocol spec)
-        for i in range(count):
-            b = ord(self.port.read(1))
-
-        logger.debug("Read %d bytes from interface", count)
-        return count
+            self._set_port_error("Unable to open COM port: {0}: {1}".format(self.com_port, str(ex)))
+            return False
 
+        # The reader thread handles the handshake with the controller.
+        # Usually the controller wants the current time.
+        self._serial = XTB232Serial(self.port, self.CreateSetTimeCommand)
+        self._serial.start()
+        return True
 
     # ************************************************************************
-    def SetInterfaceTime(self, time_value):
-        """
-        Send a time value to the controller. Usually the time is the current time.
-        time_value should be a datetime.
-        Note that the XTB232 ignores the time value. But, this is kept for CM11A compatibility.
-        See section 8 of the spec.
-        NOTE: This method CANNOT call another method that would result in recursion.
-        Specifically, that means it cannot call SendCommand.
-        """
-        self.clear_last_error()
-
-        # The set time command is 7 bytes long
-        TimeData = self.CreateSetTimeCommand(time_value)
-
-        # Send the time to the controller
-        self.port.write(TimeData)
-        logger.info("Sending empty set time command: %s", binascii.hexlify(TimeData))
-
-        # Ordinarily, the controller responds to a command with a checksum.
-        # However, by observation the XTB-232 never seems to return a valid checksum.
-        # Therefore, we don't bother to read the checksum. We let the caller
-        # handle the response from the controller.
+    # Record why the controller could not be opened
+    def _set_port_error(self, error):
+        self._set_error(XTB232.PortNotAvailable, error)
+        logger.error(error)
 
     # ************************************************************************
     def CreateSetTimeCommand(self, time_value):
@@ -383,128 +359,47 @@ class XTB232(BaseDriverInterface):
         return self.SendCommand(TimeData)
 
     # ************************************************************************
-    def SendAck(self):
-        ack = bytearray(1)
-        ack[0] = XTB232.InterfaceAck
-        self.port.write(ack)
-        logger.info("Sent ACK.")
+    # Send a multi-byte command to the interface. The exchange runs on
+    # the serial sender thread. See XTB232Serial for the protocol.
+    def SendCommand(self, cmd):
+        result = False
+        if self._serial is None:
+            self._set_error(XTB232.PortNotAvailable, "XTB232 controller is not open")
+            logger.error("XTB232 controller is not open")
+        else:
+            try:
+                transmission = self._serial.submit(cmd).result(timeout=XTB232Serial.RESULT_TIMEOUT)
+                result = transmission.result
+                self._set_error(transmission.error_code, transmission.error)
+                self._add_serial_time(transmission.round_trip_time)
+            except concurrent.futures.TimeoutError:
+                error = "XTB232 transmission did not complete in {0} sec".format(XTB232Serial.RESULT_TIMEOUT)
+                self._set_error(XTB232Serial.TransmissionTimeout, error)
+                logger.error(error)
+        return result
 
     # ************************************************************************
-    #
-    # Send a multi-byte command to the interface
-    #
-    # PC                               Interface
-    # --------------------              --------------------------
-    # Bytes of command     ->
-    #                      <-          Checksum
-    # 0x00 commit          ->
-    #                      <-          Interface ready
-    #
-    # ************************************************************************
-    def SendCommand(self, cmd):
-        expected_checksum = XTB232.CalculateChecksum(cmd)
-
-        good_checksum = False
-        retry_count = 0
-
-        # There are only three ways out of this loop
-        # 1. We successfully send time
-        # 2. We fail to read any more data from the serial port
-        # 3. We exhaust the retry count
-        while (not good_checksum) and (retry_count < 3):
-            # TODO This is OK for now, but it would be better if we had
-            # decent formatting on the cmd string.
-            logger.info("Sending command: %s", binascii.hexlify(cmd))
-            # Send the command bytes
-            self.port.write(cmd)
-            # Read the response - it should be the actual checksum from the controller
-            response = self.ReadSerialByte()
-            # Does the expected checksum match the actual checksum?
-            if expected_checksum == response:
-                good_checksum = True
-                logger.info("Good checksum received")
-                # Send commit byte (must be an array type)
-                self.SendAck()
-                # Wait for interface ready signal. The retry time is arbitrary.
-                start_time = datetime.datetime.now()
-                elapsed_time = datetime.timedelta()
-                max_elapsed_time = datetime.timedelta(seconds=2)
-                while elapsed_time < max_elapsed_time:
-                    response = self.ReadSerialByte()
-                    if response == XTB232.InterfaceReady:
-                        break
-                # If we got an interface ready signal, the command was successfully transmitted.
-                if response == XTB232.InterfaceReady:
-                    self.LastErrorCode = XTB232.Success
-                    self.LastError = ""
-                    logger.info("Interface ready received")
-                    # Command successful
-                    return True
-                else:
-                    self.LastErrorCode = XTB232.InterfaceReadyTimeout
-                    self.LastError = "Expected interface ready signal, but received {0}".format(
-                        response if not None else "None")
-                    logger.warning(self.LastError)
-                    # At this point, we have received a good checksum and sent the ACK (committed the command).
-                    # However, we did not receive an interface ready. It's 50-50 as to whether everything
-                    # is OK. We'll assume it is.
-                    return True
-            elif response == XTB232.InterfaceReady:
-                # Here's a guess. We expected a checksum, but we receive 0x55 instead.
-                # Looks like we got an interface ready, so we'll move on.
-                self.LastErrorCode = XTB232.Success
-                self.LastError = "SendCommand expected a checksum, but has received an interface ready"
-                logger.warning(self.LastError)
-                return True
-            elif response == XTB232.InterfaceTimeRequest:
-                # We received an interface timer request. This likely means that the
-                # power line controller was reset and is now waiting for the current time.
-                # We'll reset the controller and retry the command.
-                logger.warning("Expected checksum, but received an InterfaceTimeRequest. Resetting controller.")
-                self.ResetController(response)
-                retry_count += 1
-            elif response == XTB232.InterfacePoll:
-                logger.debug("Received interface poll")
-                count = self.receive_data()
-            elif (response == '') or (response is None):
-                self.LastErrorCode = XTB232.ChecksumTimeout
-                self.LastError = "Timeout waiting for checksum from controller"
-                logger.error(self.LastError)
-                return False
-            else:
-                logger.error("Checksum error. Exp: %x Act: %x", expected_checksum, response)
-                self.LastErrorCode = XTB232.ChecksumError
-                self.LastError = "Expected checksum {0}, but received {1}".format(expected_checksum,
-                                                                                  response if not None else "None")
-                retry_count += 1
-
-        # If we have fallen to here, the command transmission failed.
-        self.LastErrorCode = XTB232.ChecksumError
-        self.LastError = "Checksum error attempting to transmit command"
-        return False
+    # Record an outcome for the calling thread. Worker threads share this
+    # instance, so last_error_code/last_error (kept per thread) are the ones
+    # to report. LastErrorCode/LastError only keep the most recent outcome
+    # from any thread for backward compatibility.
+    def _set_error(self, error_code, error):
+        self.last_error_code = error_code
+        self.last_error = error
+        self.LastErrorCode = error_code
+        self.LastError = error
 
     # ************************************************************************
-    # Calculate the simple checksum of an iterable list of bytes
-    @staticmethod
-    def CalculateChecksum(data):
-        checksum = 0
-        for b in data:
-            checksum += b
-            checksum &= 0xFF
-        return checksum
+    def _add_serial_time(self, seconds):
+        self._serial_time.total = getattr(self._serial_time, "total", 0.0) + seconds
 
     # ************************************************************************
-    def ReadSerialByte(self):
-        """
-        Read a byte from the serial port
-        Returns an integer
-        """
-        # Note that the serial read returns bytes
-        b = self.port.read(1)
-        logger.debug("ReadSerialByte: 0x%X", ord(b) if len(b) > 0 else 0)
-        if len(b) == 1:
-            return ord(b)
-        return None
+    # Returns the serial round trip time (in seconds) of the calling thread's
+    # commands since the last call
+    def pop_serial_time(self):
+        total = getattr(self._serial_time, "total", 0.0)
+        self._serial_time.total = 0.0
+        return total
 
     #####################
     # X10 common methods
@@ -10,11 +10,15 @@
 #
 
 import threading
+import time
 
 
 class AdapterRequest:
     """
-    Basically a container for passing a request to the adapter thread
+    Basically a container for passing a request to the adapter thread.
+    Each driver call gets its own instance, which holds the result, error
+    and timing of the call. It is safe to read from the calling thread once
+    the request is complete.
     """
     # Requests
     OPEN = "open"
@@ -23,6 +27,8 @@ class AdapterRequest:
     DEVICE_OFF = "deviceoff"
     SET_COLOR = "setcolor"
     SET_BRIGHTNESS = "setbrightness"
+    # Brightness, color and on/off in one request
+    APPLY_STATE = "applystate"
     GET_AVAILABLE_DEVICES = "getavailabledevices"
     DISCOVER_DEVICES = "discoverdevices"
     GET_DEVICE_TYPE = "getdevicetype"
@@ -39,17 +45,30 @@ class AdapterRequest:
         self._complete_event = threading.Event()
         self.result = None
 
+        # Timing (time.monotonic values)
+        self.queued_time = None
+        self.start_time = None
+        self.end_time = None
+        # Seconds spent talking to the device, for adapters that measure it (e.g. X10 serial round trips)
+        self.device_time = None
+
         # Last error for this request
         self._last_error_code = 0
         self._last_error = None
 
+        # Set when the caller stopped waiting for the request
+        self._lock = threading.Lock()
+        self._abandoned = False
+
     @property
     def last_error_code(self):
         return self._last_error_code
 
     @last_error_code.setter
     def last_error_code(self, v):
-        self._last_error_code = v
+        # Once abandoned, the caller's timeout error stands
+        if not self._abandoned:
+            self._last_error_code = v
 
     @property
     def last_error(self):
@@ -57,7 +76,67 @@ class AdapterRequest:
 
     @last_error.setter
     def last_error(self, v):
-        self._last_error = v
+        if not self._abandoned:
+            self._last_error = v
+
+    @property
+    def wait_time(self):
+        """
+        Seconds the request waited on the adapter thread before it started
+        """
+        if self.queued_time is None or self.start_time is None:
+            return None
+        return self.start_time - self.queued_time
+
+    @property
+    def run_time(self):
+        """
+        Seconds the request took to run on the adapter thread
+        """
+        if self.start_time is None or self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    @property
+    def elapsed_time(self):
+        """
+        Seconds from queuing the request to its completion
+        """
+        if self.queued_time is None or self.end_time is None:
+            return None
+        return self.end_time - self.queued_time
+
+    def set_queued(self):
+        """
+        Record the time the request was queued
+        :return: None
+        """
+        self.queued_time = time.monotonic()
+
+    def set_started(self):
+        """
+        Record the time the request started running
+        :return: None
+        """
+        self.start_time = time.monotonic()
+
+    def to_dict(self):
+        """
+        The result, error and timing of the request
+        :return: dict
+        """
+        def ms(t):
+            return round(t * 1000.0, 3) if t is not None else None
+        return {
+            "request": self.request,
+            "complete": self.is_complete(),
+            "result-code": self.last_error_code,
+            "message": self.last_error,
+            "wait-ms": ms(self.wait_time),
+            "run-ms": ms(self.run_time),
+            "elapsed-ms": ms(self.elapsed_time),
+            "device-ms": ms(self.device_time)
+        }
 
     def wait(self, timeout=60.0):
         """
@@ -80,5 +159,25 @@ class AdapterRequest:
         :param result: The result to be posted
         :return: None
         """
-        self.result = result
-        self._complete_event.set()
+        with self._lock:
+            # The result of an abandoned request is not reported to the caller
+            if not self._abandoned:
+                self.result = result
+                self.end_time = time.monotonic()
+            self._complete_event.set()
+
+    def abandon(self, error_code, error):
+        """
+        Called by the caller when it stops waiting for the request (e.g. timeout).
+        The request keeps the given error even if it completes later.
+        :param error_code: Error code reported to the caller
+        :param error: Error message reported to the caller
+        :return: True if the request was abandoned, False if it had already completed
+        """
+        with self._lock:
+            if self._complete_event.is_set():
+                return False
+            self._last_error_code = error_code
+            self._last_error = error
+            self._abandoned = True
+            return True
@@ -26,21 +26,27 @@
 # This means that all Meross-iot code must be isolated to a single thread.
 # Otherwise, asyncio will throw thread related exceptions when least expected.
 #
-# This adapter is inherently thread safe. The request queue (a Queue) is used as the
-# synchronization method. A Queue is thread safe (see Queue.put and Queue.get).
-# The adapter takes/gets one request at a time from the request queue making it
-# thread safe.
+# This adapter is inherently thread safe. Requests are handed to the adapter's
+# event loop with loop.call_soon_threadsafe and go through an asyncio.Queue.
+# The event loop runs permanently on the adapter thread and starts each request
+# as its own task, so requests for different devices overlap. Requests for the
+# same device address are serialized. Requests that work on the whole device
+# inventory (open, close, discover) run alone, after all in-flight requests
+# have finished.
 #
 
 import threading
-import queue
 import asyncio
+import contextvars
 import logging
-import datetime
 import colorsys
+from .adapter_request import AdapterRequest
 
 logger = logging.getLogger("server")
 
+# The request being run by the current asyncio task
+_current_request = contextvars.ContextVar("adapter_current_request", default=None)
+
 
 class AdapterThread(threading.Thread):
     # Error codes
@@ -57,32 +63,57 @@ class AdapterThread(threading.Thread):
     DEVICE_TYPE_DIMMER = "dimmer"
     DEVICE_TYPE_UNKNOWN = "unknown"
 
+    # Requests that must run with no other request in flight
+    EXCLUSIVE_REQUESTS = [AdapterRequest.OPEN, AdapterRequest.CLOSE, AdapterRequest.DISCOVER_DEVICES]
+
     def __init__(self, name="AdapterThread"):
         super().__init__(name=name)
-        self._request = None
-        self._loop = None
         self.adapter_name = name
 
         # For terminating the adapter thread
         self._terminate_event = threading.Event()
-        # For sending requests to the thread
-        self._request_queue = queue.Queue()
+        # The loop is created here so requests can be queued before the thread runs.
+        # It is only ever run on the adapter thread.
+        self._loop = asyncio.new_event_loop()
+        # For sending requests to the thread. Created on the adapter thread.
+        self._request_queue = None
+        # Device address -> asyncio.Lock serializing requests for the device
+        self._device_locks = {}
+        # In-flight request tasks
+        self._tasks = set()
+        # The driver's DeviceStateCache. Set by the driver.
+        self.state_cache = None
+
+    @property
+    def _request(self):
+        """
+        The request being run by the current task
+        """
+        return _current_request.get()
+
+    @_request.setter
+    def _request(self, v):
+        _current_request.set(v)
+
+    # Background tasks have no request. Their errors are only logged.
 
     @property
     def last_error_code(self):
-        return self._request.last_error_code
+        return self._request.last_error_code if self._request is not None else AdapterThread.UNDEFINED
 
     @last_error_code.setter
     def last_error_code(self, v):
-        self._request.last_error_code = v
+        if self._request is not None:
+            self._request.last_error_code = v
 
     @property
     def last_error(self):
-        return self._request.last_error
+        return self._request.last_error if self._request is not None else None
 
     @last_error.setter
     def last_error(self, v):
-        self._request.last_error = v
+        if self._request is not None:
+            self._request.last_error = v
 
     def clear_last_error(self):
         """
@@ -99,57 +130,124 @@ class AdapterThread(threading.Thread):
         The server terminates when the close request is received.
         :return:
         """
+        asyncio.set_event_loop(self._loop)
+        # Created on the adapter thread before any queued request can be delivered
+        self._request_queue = asyncio.Queue()
+        try:
+            self._loop.run_until_complete(self.async_run())
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+        finally:
+            # Thread clean up
+            self._loop.close()
 
-        # This loop can only be used by this thread
-        self._loop = asyncio.new_event_loop()
-
+    async def async_run(self):
+        """
+        Take requests from the request queue and run them until the
+        adapter is closed
+        :return: None
+        """
         # Note that the close method sets the terminate event
         while not self._terminate_event.is_set():
-            # This is a blocking call. The adapter thread will wait here
-            # until a request arrives.
+            # The adapter thread waits here until a request arrives.
             # Termination occurs when the close() method is called and the terminate event is set.
-            self._request = self._request_queue.get()
-            start_time = datetime.datetime.now()
+            request = await self._request_queue.get()
 
-            # Cases for each request/command
-            result = self.dispatch_request()
+            if request.request in self.EXCLUSIVE_REQUESTS:
+                # Let everything in flight finish, then run the request by itself
+                if self._tasks:
+                    await asyncio.wait(list(self._tasks))
+                await self._run_request(request)
+            else:
+                task = self._loop.create_task(self._run_request(request))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
 
-            self._request.set_complete(result)
-            elapsed_time = datetime.datetime.now() - start_time
-            logger.debug("%s %s elapsed time: %f", self.adapter_name, self._request.request,
-                         elapsed_time.total_seconds())
+        # Requests that arrived after close will never run
+        while not self._request_queue.empty():
+            request = self._request_queue.get_nowait()
+            request.last_error_code = AdapterThread.UNDEFINED
+            request.last_error = "{0} is closed".format(self.adapter_name)
+            request.set_complete(False)
 
-            # We are finished with this request
-            self._request = None
+    async def _run_request(self, request):
+        """
+        Run a request, serialized with other requests for the same device
+        :param request: An AdapterRequest
+        :return: None
+        """
+        # Each task runs in its own context so this only sets the current task's request
+        self._request = request
+        request.set_started()
+        result = False
+        try:
+            device_address = request.kwargs.get("house_device_code", request.kwargs.get("device_address"))
+            if device_address is None:
+                result = await self.dispatch_request()
+            else:
+                async with self._get_device_lock(device_address):
+                    result = await self.dispatch_request()
+        except Exception as ex:
+            logger.error("%s %s failed: %s", self.adapter_name, request.request, str(ex))
+            request.last_error_code = AdapterThread.UNDEFINED
+            request.last_error = str(ex)
+        finally:
+            request.set_complete(result)
+            logger.debug("%s %s elapsed time: %f", self.adapter_name, request.request, request.run_time)
 
-        # Thread clean up
-        self._loop.stop()
-        self._loop.close()
-        self._loop = None
+    def _get_device_lock(self, device_address):
+        """
+        Return the lock that serializes work on a device. Only call on the adapter thread.
+        :param device_address: Device address or UUID
+        :return: asyncio.Lock
+        """
+        if device_address not in self._device_locks:
+            self._device_locks[device_address] = asyncio.Lock()
+        return self._device_locks[device_address]
 
-    def dispatch_request(self):
+    def _create_background_task(self, coroutine_function, *args):
         """
-        Dispatch a request to the device module. Must be implemented in a derived class.
-        :return:
+        Start a task on the adapter thread that is not part of any request
+        (e.g. a poller). Only call on the adapter thread.
+        :param coroutine_function: The async method to run
+        :param args: Arguments for the method
+        :return: The asyncio.Task
+        """
+        return self._loop.create_task(self._run_background_task(coroutine_function, *args))
+
+    async def _run_background_task(self, coroutine_function, *args):
+        # The task starts with a copy of the creating request's context
+        self._request = None
+        return await coroutine_function(*args)
+
+    async def dispatch_request(self):
+        """
+        Dispatch the current request (self._request) to the device module.
+        Must be implemented in a derived class.
+        :return: The result of the request
         """
         raise NotImplementedError
 
     def queue_request(self, request):
         """
-        Queue a request for execution on the Meross adapter thread.
-        If the adapter thread is waiting for a request, it will automatically
-        start running.
-        :param request:
-        :return:
+        Queue a request for execution on the adapter thread.
+        Thread safe.
+        :param request: An AdapterRequest
+        :return: None
         """
-        self._request_queue.put(request)
+        request.set_queued()
+        self._loop.call_soon_threadsafe(self._queue_request_on_loop, request)
+
+    def _queue_request_on_loop(self, request):
+        # Runs on the adapter thread
+        self._request_queue.put_nowait(request)
 
     def queued_requests(self):
         """
-        How many requests are queued up?
+        How many requests are queued up or running?
         :return: The number of queued requests
         """
-        return self._request_queue.qsize()
+        queued = self._request_queue.qsize() if self._request_queue is not None else 0
+        return queued + len(self._tasks)
 
     # TODO Refactor this code out of here
     def _hex_to_rgb(self, hex_str):
@@ -15,6 +15,7 @@
 
 import logging
 import colorsys
+import threading
 
 logger = logging.getLogger("server")
 
@@ -29,28 +30,31 @@ class BaseDriverInterface:
     DEVICE_TYPE_LIGHTSTRIP = "lightstrip"
     DEVICE_TYPE_DIMMER = "dimmer"
     DEVICE_TYPE_UNKNOWN = "unknown"
+    # Cloud based drivers are not opened until Internet access is verified
+    REQUIRES_INTERNET = False
 
     def __init__(self):
+        # The last error is kept per calling thread. A driver is shared
+        # by all of the socket server threads and the timer service.
+        self._error_state = threading.local()
         self.clear_last_error()
-        self._last_error = None
-        self._last_error_code = None
         logger.info("Device driver base class initialized")
 
     @property
     def last_error_code(self):
-        return self._last_error_code
+        return getattr(self._error_state, "last_error_code", BaseDriverInterface.SUCCESS)
 
     @last_error_code.setter
     def last_error_code(self, v):
-        self._last_error_code = v
+        self._error_state.last_error_code = v
 
     @property
     def last_error(self):
-        return self._last_error
+        return getattr(self._error_state, "last_error", None)
 
     @last_error.setter
     def last_error(self, v):
-        self._last_error = v
+        self._error_state.last_error = v
 
     # Reset the last error info
     def clear_last_error(self):
@@ -93,6 +97,28 @@ class BaseDriverInterface:
     def device_off(self, device_type, device_name_tag, house_device_code, channel):
         pass
 
+    def apply_state(self, device_type, device_name_tag, house_device_code, channel,
+                    brightness=None, hex_color=None, power_on=True):
+        """
+        Set brightness and color, then turn the device on (or off).
+        Drivers that can do this in one visit to the device override this method.
+        :param device_type: the device's type (e.g. x10, hs100, smartplug, etc.)
+        :param device_name_tag: human readable name of device
+        :param house_device_code: Device address or UUID
+        :param channel: 0-n
+        :param brightness: 0-100 percent or None to leave brightness as is
+        :param hex_color: Hex color #RRGGBB or None/empty to leave color as is
+        :param power_on: True to turn the device on, False to turn it off
+        :return: The result of turning the device on/off
+        """
+        if brightness is not None:
+            self.set_brightness(device_type, device_name_tag, house_device_code, channel, brightness)
+        if hex_color:
+            self.set_color(device_type, device_name_tag, house_device_code, channel, hex_color)
+        if power_on:
+            return self.device_on(device_type, device_name_tag, house_device_code, channel)
+        return self.device_off(device_type, device_name_tag, house_device_code, channel)
+
     def device_dim(self, device_type, device_name_tag, house_device_code, channel, dim_amount):
         pass
 
@@ -134,16 +160,26 @@ class BaseDriverInterface:
         """
         return BaseDriverInterface.DEVICE_TYPE_PLUG
 
-    def is_on(self, device_address, device_channel):
+    def is_on(self, device_address, device_channel, refresh=False):
         """
         Return the current on/off state
         :param device_address:
         :param device_channel:
+        :param refresh: True to ask the device instead of using a cached state
         :return:
         """
         # The on/off state is unknown
         return False
 
+    def get_cached_state(self, device_address, device_channel):
+        """
+        Return the cached type and on/off state of a device
+        :param device_address:
+        :param device_channel:
+        :return: A dict with type and on or None if the driver does not cache state
+        """
+        return None
+
     # TODO Consider defining this as SetCurrentTime taking no parameters.
     # Set the controller time to the current, local time.
     def set_time(self, time_value):
@@ -14,8 +14,11 @@
 
 from .base_driver_interface import BaseDriverInterface
 from .adapter_request import AdapterRequest
+from .device_state_cache import DeviceStateCache
+from Configuration import Configuration
 import logging
 import datetime
+import threading
 
 logger = logging.getLogger("server")
 
@@ -27,9 +30,14 @@ class BaseThreadDriver(BaseDriverInterface):
     def __init__(self, adapter_thread=None, request_wait_time=60.0):
         logger.info("BaseThreadDriver initialization started")
         self._adapter_thread = adapter_thread
-        # This is the current/last request
-        self._request = AdapterRequest()
+        # The last request is kept per calling thread so that concurrent
+        # callers (e.g. a group command) do not see each other's results and errors
+        self._local = threading.local()
         self._request_wait_time = request_wait_time
+        # Last known device types and on/off states. The adapter thread
+        # feeds it from device notifications.
+        self.state_cache = DeviceStateCache(Configuration.DeviceStateTTL())
+        self._adapter_thread.state_cache = self.state_cache
         super().__init__()
         logger.info("%s BaseThreadDriver initialized", self._adapter_thread.adapter_name)
 
@@ -37,6 +45,29 @@ class BaseThreadDriver(BaseDriverInterface):
         logger.debug("Starting %s", adapter_thread.adapter_name)
         self._adapter_thread.start()
 
+    @property
+    def _request(self):
+        """
+        The last request made by the calling thread
+        """
+        request = getattr(self._local, "request", None)
+        if request is None:
+            request = AdapterRequest()
+            self._local.request = request
+        return request
+
+    @_request.setter
+    def _request(self, v):
+        self._local.request = v
+
+    @property
+    def last_request(self):
+        """
+        The AdapterRequest of the calling thread's last driver call. It holds the
+        result, error code, error message and timing of the call.
+        """
+        return self._request
+
     @property
     def last_error_code(self):
         return self._request.last_error_code
@@ -60,17 +91,14 @@ class BaseThreadDriver(BaseDriverInterface):
         :param kwargs: Usually an email/ID and password
         :return: True or False
         """
-        # Queue an open request
-        self._request = AdapterRequest(request=AdapterRequest.OPEN, kwargs=kwargs)
-
-        # Run the request on the adapter thread
-        self._run_request(self._request)
-        if self._request.result:
+        # Run an open request on the adapter thread
+        request = self.execute(AdapterRequest.OPEN, kwargs=kwargs)
+        if request.result:
             logger.debug("%s opened", self._adapter_thread.adapter_name)
         else:
             logger.error("%s failed", self._adapter_thread.adapter_name)
 
-        return self._request.result
+        return request.result
 
     # Close the device
     def close(self):
@@ -78,10 +106,8 @@ class BaseThreadDriver(BaseDriverInterface):
                     self._adapter_thread.adapter_name,
                     self._adapter_thread.queued_requests())
 
-        self._request = AdapterRequest(request=AdapterRequest.CLOSE)
-
-        self._run_request(self._request)
-        if self._request.result:
+        request = self.execute(AdapterRequest.CLOSE)
+        if request.result:
             logger.debug("%s closed", self._adapter_thread.adapter_name)
         else:
             logger.error("%s close timed out", self._adapter_thread.adapter_name)
@@ -91,7 +117,7 @@ class BaseThreadDriver(BaseDriverInterface):
         self._adapter_thread.join()
         logger.debug("%s driver adapter thread ended", self._adapter_thread.adapter_name)
 
-        return self._request.result
+        return request.result
 
     def set_color(self, device_type, device_name_tag, house_device_code, channel, hex_color):
         """
@@ -113,10 +139,9 @@ class BaseThreadDriver(BaseDriverInterface):
         }
 
         # Queue a set color request
-        self._request = AdapterRequest(request=AdapterRequest.SET_COLOR, kwargs=kwargs)
-        self._run_request(self._request)
+        request = self.execute(AdapterRequest.SET_COLOR, kwargs=kwargs)
 
-        return self._request.result
+        return request.result
 
     def set_brightness(self, device_type, device_name_tag, house_device_code, channel, brightness):
         """
@@ -138,10 +163,9 @@ class BaseThreadDriver(BaseDriverInterface):
         }
 
         # Queue a set brightness request
-        self._request = AdapterRequest(request=AdapterRequest.SET_BRIGHTNESS, kwargs=kwargs)
-        self._run_request(self._request)
+        request = self.execute(AdapterRequest.SET_BRIGHTNESS, kwargs=kwargs)
 
-        return self._request.result
+        return request.result
 
     def device_on(self, device_type, device_name_tag, house_device_code, channel):
         """
@@ -161,15 +185,15 @@ class BaseThreadDriver(BaseDriverInterface):
         }
 
         # Queue a device on request
-        self._request = AdapterRequest(request=AdapterRequest.DEVICE_ON, kwargs=kwargs)
-        self._run_request(self._request)
+        request = self.execute(AdapterRequest.DEVICE_ON, kwargs=kwargs)
+        self._record_power(house_device_code, channel, True, request.result)
 
-        if self._request.result:
+        if request.result:
             logger.debug("%s DeviceOn for: %s %s", self._adapter_thread.adapter_name, house_device_code, channel)
         else:
             logger.error("%s DeviceOn failed", self._adapter_thread.adapter_name)
 
-        return self._request.result
+        return request.result
 
     def device_off(self, device_type, device_name_tag, house_device_code, channel):
         """
@@ -189,15 +213,50 @@ class BaseThreadDriver(BaseDriverInterface):
         }
 
         # Queue a device off request
-        self._request = AdapterRequest(request=AdapterRequest.DEVICE_OFF, kwargs=kwargs)
-        self._run_request(self._request)
+        request = self.execute(AdapterRequest.DEVICE_OFF, kwargs=kwargs)
+        self._record_power(house_device_code, channel, False, request.result)
 
-        if self._request.result:
+        if request.result:
             logger.debug("%s DeviceOff for: %s %s", self._adapter_thread.adapter_name, house_device_code, channel)
         else:
             logger.error("%s DeviceOff failed", self._adapter_thread.adapter_name)
 
-        return self._request.result
+        return request.result
+
+    def apply_state(self, device_type, device_name_tag, house_device_code, channel,
+                    brightness=None, hex_color=None, power_on=True):
+        """
+        Set brightness and color, then turn the device on (or off) in one adapter request
+        :param device_type: the device's type (e.g. x10, hs100, smartplug, etc.)
+        :param device_name_tag: human readable name of device
+        :param house_device_code: address of the device, depending on device type
+        :param channel: 0-n
+        :param brightness: 0-100 percent or None to leave brightness as is
+        :param hex_color: Hex color #RRGGBB or None/empty to leave color as is
+        :param power_on: True to turn the device on, False to turn it off
+        :return: The result of turning the device on/off
+        """
+
+        kwargs = {
+            "device_type": device_type,
+            "device_name_tag": device_name_tag,
+            "house_device_code": house_device_code,
+            "channel": channel,
+            "brightness": brightness,
+            "hex_color": hex_color,
+            "power_on": power_on
+        }
+
+        # Queue an apply state request
+        request = self.execute(AdapterRequest.APPLY_STATE, kwargs=kwargs)
+        self._record_power(house_device_code, channel, power_on, request.result)
+
+        if request.result:
+            logger.debug("%s ApplyState for: %s %s", self._adapter_thread.adapter_name, house_device_code, channel)
+        else:
+            logger.error("%s ApplyState failed", self._adapter_thread.adapter_name)
+
+        return request.result
 
     def device_dim(self, device_type, device_name_tag, house_device_code, channel, dim_amount):
         """
@@ -262,10 +321,9 @@ class BaseThreadDriver(BaseDriverInterface):
         """
 
         # Queue a get available devices request
-        self._request = AdapterRequest(request=AdapterRequest.GET_AVAILABLE_DEVICES)
-        self._run_request(self._request)
+        request = self.execute(AdapterRequest.GET_AVAILABLE_DEVICES)
 
-        return self._request.result
+        return request.result
 
     def discover_devices(self):
         """
@@ -274,10 +332,9 @@ class BaseThreadDriver(BaseDriverInterface):
         """
 
         # Queue a discover devices request
-        self._request = AdapterRequest(request=AdapterRequest.DISCOVER_DEVICES)
-        self._run_request(self._request)
+        request = self.execute(AdapterRequest.DISCOVER_DEVICES)
 
-        return self._request.result
+        return request.result
 
     def get_device_type(self, device_address, device_channel):
         """
@@ -292,34 +349,81 @@ class BaseThreadDriver(BaseDriverInterface):
             "device_channel": device_channel
         }
 
+        # The type of a device does not change
+        device_type = self.state_cache.get_type(device_address, device_channel)
+        if device_type is not None:
+            return device_type
+
         # Queue a get device type request
-        self._request = AdapterRequest(request=AdapterRequest.GET_DEVICE_TYPE, kwargs=kwargs)
-        self._run_request(self._request)
+        request = self.execute(AdapterRequest.GET_DEVICE_TYPE, kwargs=kwargs)
 
-        return self._request.result
+        if request.result is not None and request.result != BaseDriverInterface.DEVICE_TYPE_UNKNOWN:
+            self.state_cache.set_type(device_address, device_channel, request.result)
+        return request.result
 
-    def is_on(self, device_address, device_channel):
+    def is_on(self, device_address, device_channel, refresh=False):
         """
         Is it a device on?
         :param device_address:
         :param device_channel:
+        :param refresh: True to ask the device instead of using the cached state
         :return:
         """
+        if not refresh:
+            found, on = self.state_cache.get_on(device_address, device_channel)
+            if found:
+                return on
 
         kwargs = {
             "device_address": device_address,
-            "device_channel": device_channel
+            "device_channel": device_channel,
+            "refresh": refresh
         }
 
         # Queue a on/off status request
-        self._request = AdapterRequest(request=AdapterRequest.ON_OFF_STATUS, kwargs=kwargs)
-        self._run_request(self._request)
+        request = self.execute(AdapterRequest.ON_OFF_STATUS, kwargs=kwargs)
 
-        return self._request.result
+        # Only a state read without an error is remembered
+        if request.is_complete() and request.result is not None and request.last_error is None:
+            self.state_cache.set_on(device_address, device_channel, request.result)
+        return request.result
+
+    def get_cached_state(self, device_address, device_channel):
+        """
+        Return the cached type and on/off state of a device
+        :param device_address:
+        :param device_channel:
+        :return: A dict with type and on or None if the state is unknown or stale
+        """
+        return self.state_cache.get_state(device_address, device_channel)
+
+    def _record_power(self, house_device_code, channel, power_on, result):
+        """
+        Update the state cache with the result of an on/off command
+        """
+        if result:
+            self.state_cache.set_on(house_device_code, channel, power_on)
+        else:
+            # The device may or may not have changed state
+            self.state_cache.invalidate(house_device_code, channel)
+
+    def execute(self, request_type, kwargs=None):
+        """
+        Run a request on the adapter thread and wait for it to complete.
+        Safe to call from many threads at the same time.
+        :param request_type: One of the AdapterRequest request types
+        :param kwargs: The request arguments
+        :return: The completed (or timed out) AdapterRequest for this call
+        """
+        request = AdapterRequest(request=request_type, kwargs=kwargs)
+        # The calling thread's last request. This is where last_error comes from.
+        self._request = request
+        self._run_request(request)
+        return request
 
     def _run_request(self, request):
         """
-        Queue a Meross device request to run on the adapter thread
+        Queue a device request to run on the adapter thread
         :param request:
         :return:
         """
@@ -333,9 +437,13 @@ class BaseThreadDriver(BaseDriverInterface):
             logger.info("%s request ran: %s", self._adapter_thread.adapter_name, request.request)
         else:
             wait_time = datetime.datetime.now() - start_wait
-            logger.error("%s %s timed out after %f sec",
-                         self._adapter_thread.adapter_name,
-                         request.request,
-                         wait_time.total_seconds())
-            if request.kwargs is not None:
-                logger.error(f"request kwargs: {request.kwargs}")
+            if request.abandon(BaseThreadDriver.DRIVER_ERROR,
+                               "{0} {1} timed out after {2:.1f} sec".format(self._adapter_thread.adapter_name,
+                                                                            request.request,
+                                                                            wait_time.total_seconds())):
+                logger.error("%s %s timed out after %f sec",
+                             self._adapter_thread.adapter_name,
+                             request.request,
+                             wait_time.total_seconds())
+                if request.kwargs is not None:
+                    logger.error(f"request kwargs: {request.kwargs}")
@@ -10,10 +10,12 @@
 #
 
 import logging
-from drivers.Dummy import Dummy
-from drivers.py_kasa import PyKasaDriver
-from drivers.meross_v4 import MerossDriverV4
+import threading
+import time
 from Configuration import Configuration
+from helpers.startup_timer import StartupTimer
+from helpers.internet_utils import is_internet_up
+from drivers.initializing_driver import InitializingDriver
 
 logger = logging.getLogger("server")
 
@@ -25,44 +27,218 @@ class DeviceDriverManager:
     # device name to device driver look up table
     driver_list = {}
 
-    # Driver list mapping all driver names to driver class
+    # Driver list mapping all driver names to driver class.
+    # Drivers are imported only when enabled because their
+    # dependencies (e.g. kasa, meross_iot) are slow to load.
     DRIVER_LIST = {
-        "tplink": PyKasaDriver,
-        "meross": MerossDriverV4,
-        "dummy": Dummy
+        "tplink": "drivers.py_kasa:PyKasaDriver",
+        "meross": "drivers.meross_v4:MerossDriverV4",
+        "x10": "drivers.x10:X10Driver",
+        "dummy": "drivers.Dummy:Dummy"
     }
+    # Drivers that need hardware are not part of the default driver list
+    OPT_IN_DRIVERS = ["x10"]
 
-    @classmethod
-    def init(cls):
-        # Create driver instances for all supported manufacturers
-        # Note that only one instance of each driver is created making
-        # each driver a singleton.
+    # Driver states reported by get_driver_status
+    DRIVER_WAITING_FOR_INTERNET = "waiting-for-internet"
+    DRIVER_OPENING = "opening"
+    DRIVER_OPEN = "open"
+    DRIVER_FAILED = "failed"
+    DRIVER_TIMED_OUT = "timed-out"
 
+    # Opens drivers that need Internet access once it is available
+    _internet_thread = None
+    _stop_event = threading.Event()
+    # Threads opening drivers
+    _open_threads = []
+    # Driver name to open status
+    _driver_status = {}
+    _status_lock = threading.Lock()
+
+    @classmethod
+    def _enabled_drivers(cls):
+        """
+        Return the names of the configured drivers
+        :return: List of driver names
+        """
         enabled_drivers = Configuration.enabled_drivers()
 
         if enabled_drivers is None or len(enabled_drivers) == 0:
             # Default to all known devices
-            enabled_drivers = cls.DRIVER_LIST.keys()
+            enabled_drivers = [name for name in cls.DRIVER_LIST.keys() if name not in cls.OPT_IN_DRIVERS]
             logger.debug("Configuration file does not define enabled drivers")
             logger.debug("Defaulting to all known drivers")
+        return enabled_drivers
+
+    @classmethod
+    def install_placeholders(cls):
+        """
+        Put a placeholder in place for every enabled driver. This is called
+        before the socket server starts, so a request that arrives before
+        init() has created the drivers gets a "driver initializing" error.
+        :return: None
+        """
+        for name in cls._enabled_drivers():
+            if name in cls.DRIVER_LIST.keys() and name not in cls.driver_list:
+                cls.driver_list[name] = InitializingDriver(name)
+                cls._set_status(name, cls.DRIVER_OPENING)
 
+    @classmethod
+    def init(cls):
+        # Create driver instances for all supported manufacturers
+        # Note that only one instance of each driver is created making
+        # each driver a singleton.
+        # Drivers that require Internet access are opened in the background
+        # after Internet access is verified. Until a driver is open, requests
+        # for it get a "driver initializing" error.
+        cls.install_placeholders()
+        enabled_drivers = cls._enabled_drivers()
+
+        local_drivers = {}
+        internet_drivers = {}
         for name in enabled_drivers:
             if name in cls.DRIVER_LIST.keys():
-                # Create an instance of the driver
-                cls.driver_list[name] = cls.DRIVER_LIST[name]()
-                logger.info("Created driver for %s", name)
+                try:
+                    driver_class = StartupTimer.import_class(cls.DRIVER_LIST[name])
+                except ImportError as ex:
+                    logger.error("Unable to load driver %s", name)
+                    logger.error(str(ex))
+                    cls.driver_list[name] = InitializingDriver(name, reason="driver failed to load")
+                    cls._set_status(name, cls.DRIVER_FAILED, str(ex))
+                    continue
+                if driver_class.REQUIRES_INTERNET:
+                    internet_drivers[name] = driver_class
+                    cls._set_status(name, cls.DRIVER_WAITING_FOR_INTERNET, "Waiting for Internet access")
+                else:
+                    local_drivers[name] = driver_class
             else:
                 logger.error("%s is not a recognized driver", name)
 
-        # Open all used drivers
-        for dn, driver in cls.driver_list.items():
-            if driver is not None:
-                driver.open()
+        # Local drivers are opened now
+        cls._open_drivers(local_drivers)
+
+        if internet_drivers:
+            cls._stop_event.clear()
+            cls._internet_thread = threading.Thread(target=cls._open_internet_drivers,
+                                                    args=(internet_drivers,),
+                                                    name="InternetDrivers")
+            cls._internet_thread.start()
+            logger.info("Drivers waiting for Internet access: %s", ", ".join(internet_drivers.keys()))
 
-        logger.debug("Driver instances created for all enabled drivers")
+        logger.debug("Driver instances created for all enabled local drivers")
+
+    @classmethod
+    def _set_status(cls, name, state, message=None, open_time=None):
+        with cls._status_lock:
+            cls._driver_status[name] = {
+                "state": state,
+                "message": message,
+                "open-time": round(open_time, 3) if open_time is not None else None
+            }
+
+    @classmethod
+    def get_driver_status(cls):
+        """
+        Return the open status of all enabled drivers
+        :return: dict of driver name to status
+        """
+        with cls._status_lock:
+            return {name: dict(status) for name, status in cls._driver_status.items()}
+
+    @classmethod
+    def _open_drivers(cls, drivers):
+        """
+        Open drivers concurrently, waiting at most DriverOpenTimeout for them.
+        A driver that has not finished opening by then keeps trying in the
+        background and becomes available if it eventually opens.
+        :param drivers: dict of driver name to driver class
+        :return: None
+        """
+        timeout = Configuration.DriverOpenTimeout()
+        threads = []
+        for name, driver_class in drivers.items():
+            cls._set_status(name, cls.DRIVER_OPENING)
+            # Daemon threads so a hung driver open cannot prevent shutdown
+            t = threading.Thread(target=cls._open_driver, args=(name, driver_class),
+                                 name="Open-" + name, daemon=True)
+            threads.append(t)
+            t.start()
+        cls._open_threads.extend(threads)
+
+        deadline = time.monotonic() + timeout
+        for t in threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+        with cls._status_lock:
+            for name in drivers.keys():
+                status = cls._driver_status[name]
+                # The open thread may finish at any time so test and set under the lock
+                if status["state"] == cls.DRIVER_OPENING:
+                    logger.error("Driver %s did not open within %f sec", name, timeout)
+                    status["state"] = cls.DRIVER_TIMED_OUT
+                    status["message"] = "Not open after {0} sec, still trying".format(timeout)
+
+    @classmethod
+    def _open_driver(cls, name, driver_class):
+        """
+        Create and open a driver, replacing its placeholder.
+        Runs on its own thread.
+        :param name: Driver name
+        :param driver_class: Driver class
+        :return: None
+        """
+        start = time.monotonic()
+        try:
+            # Create an instance of the driver
+            with StartupTimer.measure("create driver " + name):
+                driver = driver_class()
+            logger.info("Created driver for %s", name)
+            with StartupTimer.measure("open driver " + name):
+                result = driver.open()
+        except Exception as ex:
+            logger.error("Unable to open driver %s", name)
+            logger.error(str(ex))
+            cls.driver_list[name] = InitializingDriver(name, reason="driver failed to open")
+            cls._set_status(name, cls.DRIVER_FAILED, str(ex), time.monotonic() - start)
+            return
+
+        # As before, a driver that reports an open failure is still used.
+        # It may be able to recover (e.g. reconnect) on its own.
+        cls.driver_list[name] = driver
+        if result is False:
+            cls._set_status(name, cls.DRIVER_FAILED, driver.last_error, time.monotonic() - start)
+        else:
+            cls._set_status(name, cls.DRIVER_OPEN, None, time.monotonic() - start)
+
+    @classmethod
+    def _open_internet_drivers(cls, internet_drivers):
+        """
+        Background thread. Waits for Internet access, then opens the drivers that need it.
+        :param internet_drivers: dict of driver name to driver class
+        :return: None
+        """
+        with StartupTimer.measure("Internet verification"):
+            internet_up = is_internet_up(stop_event=cls._stop_event)
+        if not internet_up:
+            # Shutting down before the Internet was reachable
+            return
+
+        cls._open_drivers(internet_drivers)
 
     @classmethod
     def close_drivers(cls):
+        # Stop waiting for Internet access
+        cls._stop_event.set()
+        if cls._internet_thread is not None:
+            cls._internet_thread.join()
+            cls._internet_thread = None
+
+        # Give drivers that are still opening a chance to finish so they can be closed
+        deadline = time.monotonic() + Configuration.DriverOpenTimeout()
+        for t in cls._open_threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        cls._open_threads = []
+
         # Call each driver's close method
         for dn, driver in cls.driver_list.items():
             if driver:
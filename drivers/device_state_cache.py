@@ -0,0 +1,109 @@
+#
+# Device state cache
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+# Each thread based driver keeps the last known state of its devices.
+# The cache is fed by the results of device commands and queries and by
+# device push notifications (Meross). The device type does not change
+# and never expires. The on/off state expires after DeviceStateTTL seconds.
+#
+
+import threading
+import time
+import logging
+
+logger = logging.getLogger("server")
+
+
+class DeviceStateCache:
+    def __init__(self, ttl):
+        """
+        Create an empty cache
+        :param ttl: Seconds an on/off state stays fresh. Zero or less disables the cache.
+        """
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        # (address, channel) -> device type
+        self._types = {}
+        # (address, channel) -> (on, time.monotonic() when recorded)
+        self._states = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(device_address, device_channel):
+        return str(device_address), int(device_channel)
+
+    def get_type(self, device_address, device_channel):
+        """
+        Return the cached device type or None
+        """
+        with self._lock:
+            return self._types.get(self._key(device_address, device_channel))
+
+    def set_type(self, device_address, device_channel, device_type):
+        with self._lock:
+            self._types[self._key(device_address, device_channel)] = device_type
+
+    def get_on(self, device_address, device_channel):
+        """
+        Return the cached on/off state if it is still fresh
+        :return: A tuple (found, on)
+        """
+        key = self._key(device_address, device_channel)
+        with self._lock:
+            entry = self._states.get(key)
+            if entry is None or self._ttl <= 0 or (time.monotonic() - entry[1]) > self._ttl:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry[0]
+
+    def set_on(self, device_address, device_channel, on):
+        """
+        Record the on/off state of a device
+        """
+        with self._lock:
+            self._states[self._key(device_address, device_channel)] = (bool(on), time.monotonic())
+
+    def invalidate(self, device_address, device_channel=None):
+        """
+        Forget the on/off state of a device
+        :param device_address: Device address or UUID
+        :param device_channel: Channel or None for all channels of the device
+        :return: None
+        """
+        with self._lock:
+            if device_channel is not None:
+                self._states.pop(self._key(device_address, device_channel), None)
+            else:
+                for key in [k for k in self._states.keys() if k[0] == str(device_address)]:
+                    del self._states[key]
+
+    def get_state(self, device_address, device_channel):
+        """
+        Return the cached type and on/off state, if both are known and fresh
+        :return: A dict with type and on or None
+        """
+        device_type = self.get_type(device_address, device_channel)
+        if device_type is None:
+            return None
+        found, on = self.get_on(device_address, device_channel)
+        if not found:
+            return None
+        return {"type": device_type, "on": on}
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "devices": len(self._types),
+                "states": len(self._states),
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,95 @@
+#
+# Placeholder for a device driver that has not finished opening
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# While a driver is being opened (e.g. a cloud driver waiting for
+# Internet access) the DeviceDriverManager hands out an instance of
+# this class. Every device operation fails with a "driver initializing"
+# error so clients get a clear answer instead of waiting on the driver.
+#
+
+from http import HTTPStatus
+from .base_driver_interface import BaseDriverInterface
+import logging
+
+logger = logging.getLogger("server")
+
+
+class InitializingDriver(BaseDriverInterface):
+    INITIALIZING = HTTPStatus.SERVICE_UNAVAILABLE
+
+    def __init__(self, driver_name, reason="driver initializing"):
+        """
+        Create a placeholder for a driver
+        :param driver_name: Name of the driver (e.g. meross)
+        :param reason: Why the driver is not available
+        """
+        super().__init__()
+        self._driver_name = driver_name
+        self._reason = reason
+        self._set_initializing_error()
+
+    @property
+    def driver_name(self):
+        return self._driver_name
+
+    def _set_initializing_error(self):
+        self.last_error_code = InitializingDriver.INITIALIZING
+        self.last_error = "{0} {1}".format(self._driver_name, self._reason)
+
+    def _not_available(self, operation):
+        logger.warning("%s rejected: %s %s", operation, self._driver_name, self._reason)
+        self._set_initializing_error()
+        return False
+
+    # Resetting the error would hide the reason for the failure
+    def clear_last_error(self):
+        pass
+
+    def set_color(self, device_type, device_name_tag, house_device_code, channel, hex_color):
+        return self._not_available("set_color")
+
+    def set_brightness(self, device_type, device_name_tag, house_device_code, channel, brightness):
+        return self._not_available("set_brightness")
+
+    def device_on(self, device_type, device_name_tag, house_device_code, channel):
+        return self._not_available("device_on")
+
+    def device_off(self, device_type, device_name_tag, house_device_code, channel):
+        return self._not_available("device_off")
+
+    def device_dim(self, device_type, device_name_tag, house_device_code, channel, dim_amount):
+        return self._not_available("device_dim")
+
+    def device_bright(self, device_type, device_name_tag, house_device_code, channel, bright_amount):
+        return self._not_available("device_bright")
+
+    def device_all_units_off(self, house_code):
+        return self._not_available("device_all_units_off")
+
+    def device_all_lights_off(self, house_code):
+        return self._not_available("device_all_lights_off")
+
+    def device_all_lights_on(self, house_code):
+        return self._not_available("device_all_lights_on")
+
+    def get_available_devices(self):
+        self._not_available("get_available_devices")
+        return {}
+
+    def discover_devices(self):
+        return self._not_available("discover_devices")
+
+    def get_device_type(self, device_address, device_channel):
+        return BaseDriverInterface.DEVICE_TYPE_UNKNOWN
+
+    def set_time(self, time_value):
+        return self._not_available("set_time")
@@ -26,10 +26,10 @@
 # This means that all Meross-iot code must be isolated to a single thread.
 # Otherwise, asyncio will throw thread related exceptions when least expected.
 #
-# This adapter is inherently thread safe. The request queue (a Queue) is used as the
-# synchronization method. A Queue is thread safe (see Queue.put and Queue.get).
-# The adapter takes/gets one request at a time from the request queue making it
-# thread safe.
+# This adapter is inherently thread safe. The base class runs the adapter's
+# event loop permanently on the adapter thread, so every meross-iot call
+# (including push notifications) happens on that one thread. Each request runs
+# as its own task and requests for different devices overlap.
 #
 
 import asyncio
@@ -57,12 +57,17 @@ class MerossAdapterThread(AdapterThread):
     RETRY_COUNT = 5
 
     # Device list entry keys
-    # device_list = {"uuid-n": {"base_device": device, "last_update": datetime}}
+    # device_list = {"uuid-n": {"base_device": device, "last_update": datetime, "unreachable": bool}}
     BASE_DEVICE = "base_device" # As known by the Meross module
     LAST_UPDATE = "last_update" # Time of last device update
+    UNREACHABLE = "unreachable" # True if the device could not be updated after discovery
     UPDATE_LIFETIME = 60.0 * 10.0 # default to 10 minutes
     ASYNC_UPDATE_TIMEOUT = 5.0 # 5 seconds
     COMMAND_TIMEOUT = 5.0 # 5 seconds
+    # Post discovery updates
+    DISCOVER_UPDATE_CONCURRENCY = 8 # Devices updated at the same time
+    DISCOVER_UPDATE_DEADLINE = 15.0 # Time allowed for updating one device, including retries
+    UNREACHABLE_RETRY_INTERVAL = 60.0 # Time between background retries of unreachable devices
 
     def __init__(self, name="MerossAdapterThread"):
         super().__init__(name=name)
@@ -92,11 +97,13 @@ class MerossAdapterThread(AdapterThread):
         # It is keyed by device uuid.
         # Each device uuid entry contains a base_device and updated indicator.
         self._all_devices = {}
+        # Background task retrying devices that were unreachable at discovery
+        self._retry_task = None
 
-    def dispatch_request(self):
+    async def dispatch_request(self):
         """
         Dispatch an adapter request.
-        This method is called on the new thread by the base class run method.
+        This method is called on the adapter thread's event loop by the base class.
         The server terminates when the close request is received.
         :return: Returns the result from running the request.
         """
@@ -106,17 +113,19 @@ class MerossAdapterThread(AdapterThread):
 
         # Cases for each request/command
         if self._request.request == AdapterRequest.DEVICE_ON:
-            result = self._loop.run_until_complete(self.device_on(**self._request.kwargs))
+            result = await self.device_on(**self._request.kwargs)
         elif self._request.request == AdapterRequest.DEVICE_OFF:
-            result = self._loop.run_until_complete(self.device_off(**self._request.kwargs))
+            result = await self.device_off(**self._request.kwargs)
         elif self._request.request == AdapterRequest.SET_BRIGHTNESS:
-            result = self._loop.run_until_complete(self.set_brightness(**self._request.kwargs))
+            result = await self.set_brightness(**self._request.kwargs)
         elif self._request.request == AdapterRequest.SET_COLOR:
-            result = self._loop.run_until_complete(self.set_color(**self._request.kwargs))
+            result = await self.set_color(**self._request.kwargs)
+        elif self._request.request == AdapterRequest.APPLY_STATE:
+            result = await self.apply_state(**self._request.kwargs)
         elif self._request.request == AdapterRequest.OPEN:
-            result = self._loop.run_until_complete(self.open(**self._request.kwargs))
+            result = await self.open(**self._request.kwargs)
         elif self._request.request == AdapterRequest.CLOSE:
-            result = self._loop.run_until_complete(self.close())
+            result = await self.close()
         elif self._request.request == AdapterRequest.GET_DEVICE_TYPE:
             # NOT an asyncio method
             result = self.get_device_type(**self._request.kwargs)
@@ -124,9 +133,9 @@ class MerossAdapterThread(AdapterThread):
             # NOT an asyncio method
             result = self.get_available_devices()
         elif self._request.request == AdapterRequest.DISCOVER_DEVICES:
-            result = self._loop.run_until_complete(self.discover_devices())
+            result = await self.discover_devices()
         elif self._request.request == AdapterRequest.ON_OFF_STATUS:
-            result = self._loop.run_until_complete(self.is_on(**self._request.kwargs))
+            result = await self.is_on(**self._request.kwargs)
         else:
             logger.error("Unrecognized request: %s", self._request.request)
             result = False
@@ -213,6 +222,10 @@ class MerossAdapterThread(AdapterThread):
         self.clear_last_error()
         result = False
         try:
+            if self._retry_task is not None:
+                self._retry_task.cancel()
+                await asyncio.wait([self._retry_task])
+                self._retry_task = None
             if self._manager:
                 logger.debug("Closing meross-iot manager instance")
                 self._manager.unregister_push_notification_handler_coroutine(self._notification_handler)
@@ -367,6 +380,57 @@ class MerossAdapterThread(AdapterThread):
 
         return result
 
+    async def apply_state(self, device_type, device_name_tag, house_device_code, channel,
+                          brightness=None, hex_color=None, power_on=True):
+        """
+        Set brightness and color, then turn the device on (or off). The device is
+        looked up and updated once and brightness and color go in one light command.
+        Brightness and color are skipped for devices that do not support them.
+        :param device_type: the device's type (e.g. x10, hs100, smartplug, etc.)
+        :param device_name_tag: human readable name of device
+        :param house_device_code: the UUID of the Meross device
+        :param channel: 0-n
+        :param brightness: 0-100 percent or None
+        :param hex_color: Hex color #RRGGBB or None/empty
+        :param power_on: True to turn the device on, False to turn it off
+        :return: The result of turning the device on/off
+        """
+        self.clear_last_error()
+        light_done = False
+        for retry in range(MerossAdapterThread.RETRY_COUNT):
+            try:
+                device_entry = self._get_device(house_device_code)
+                if device_entry is None:
+                    continue
+                device = device_entry[MerossAdapterThread.BASE_DEVICE]
+                await self._update_device(device.uuid)
+
+                # A retry does not repeat a light command that succeeded
+                if not light_done:
+                    light_kwargs = {}
+                    if brightness is not None and self._supports_brightness(device):
+                        light_kwargs["luminance"] = brightness
+                    if hex_color and self._supports_color(device):
+                        light_kwargs["rgb"] = self._hex_to_rgb(hex_color)
+                    if light_kwargs:
+                        await device.async_set_light_color(channel=channel,
+                                                           timeout=MerossAdapterThread.COMMAND_TIMEOUT,
+                                                           **light_kwargs)
+                    light_done = True
+
+                if power_on:
+                    await device.async_turn_on(channel, timeout=MerossAdapterThread.COMMAND_TIMEOUT)
+                else:
+                    await device.async_turn_off(channel, timeout=MerossAdapterThread.COMMAND_TIMEOUT)
+                logger.debug("ApplyState for: %s (%s %s) brightness=%s color=%s on=%s",
+                             device_name_tag, house_device_code, channel, brightness, hex_color, power_on)
+                return True
+            except Exception as ex:
+                msg = f"Exception during apply_state for: {device_name_tag} ({house_device_code} {channel})"
+                self._handle_exception(ex, msg)
+
+        return False
+
     def get_available_devices(self):
         """
         Get all known available devices for supported types.
@@ -412,17 +476,94 @@ class MerossAdapterThread(AdapterThread):
             for device in discovered_devices:
                 self._all_devices[device.uuid] = {
                     MerossAdapterThread.BASE_DEVICE: device,
-                    MerossAdapterThread.LAST_UPDATE: None
+                    MerossAdapterThread.LAST_UPDATE: None,
+                    MerossAdapterThread.UNREACHABLE: False
                 }
-                await self._update_device(device.uuid)
-            logger.debug("All discovered Meross devices have been updated")
+            # One unreachable device must not hold up the others
+            start_time = datetime.now()
+            await self._update_devices(list(self._all_devices.keys()))
+            elapsed_time = datetime.now() - start_time
+            logger.debug("All discovered Meross devices have been updated in %f sec", elapsed_time.total_seconds())
         except Exception as ex:
             msg = "Unhandled exception from async_update"
             self._handle_exception(ex, msg)
             return False
 
+        unreachable = self._unreachable_devices()
+        if unreachable:
+            logger.warning("%d Meross devices are unreachable and will be retried in the background", len(unreachable))
+            if self._retry_task is None:
+                self._retry_task = self._create_background_task(self._retry_unreachable_devices)
+
         return True
 
+    async def _update_devices(self, device_uuids):
+        """
+        Update a list of devices concurrently, DISCOVER_UPDATE_CONCURRENCY at a time.
+        Devices that can not be updated are marked unreachable.
+        :param device_uuids: List of device uuids
+        :return: None
+        """
+        batch = asyncio.Semaphore(MerossAdapterThread.DISCOVER_UPDATE_CONCURRENCY)
+        await asyncio.gather(*[self._update_discovered_device(device_uuid, batch) for device_uuid in device_uuids])
+
+    async def _update_discovered_device(self, device_uuid, batch):
+        """
+        Update one device within the discovery deadline
+        :param device_uuid: uuid of device to be updated
+        :param batch: Semaphore limiting concurrent updates
+        :return: None
+        """
+        async with batch:
+            # Requests for the device may be running
+            async with self._get_device_lock(device_uuid):
+                # Discovery may have dropped the device
+                if device_uuid not in self._all_devices:
+                    return
+                try:
+                    success = await asyncio.wait_for(self._update_device(device_uuid),
+                                                     MerossAdapterThread.DISCOVER_UPDATE_DEADLINE)
+                except asyncio.TimeoutError:
+                    logger.error("Update of Meross device %s did not finish in %f sec",
+                                 device_uuid, MerossAdapterThread.DISCOVER_UPDATE_DEADLINE)
+                    success = False
+                device_entry = self._all_devices.get(device_uuid)
+                if device_entry is None:
+                    return
+                device_entry[MerossAdapterThread.UNREACHABLE] = not success
+                if success:
+                    self._record_device_state(device_entry[MerossAdapterThread.BASE_DEVICE])
+
+    def _unreachable_devices(self):
+        """
+        Returns the uuids of all devices marked unreachable
+        """
+        return [device_uuid for device_uuid, device_entry in self._all_devices.items()
+                if device_entry.get(MerossAdapterThread.UNREACHABLE, False)]
+
+    async def _retry_unreachable_devices(self):
+        """
+        Background task that retries unreachable devices until all of them have been updated
+        :return: None
+        """
+        try:
+            while not self._terminate_event.is_set():
+                await asyncio.sleep(MerossAdapterThread.UNREACHABLE_RETRY_INTERVAL)
+                unreachable = self._unreachable_devices()
+                if not unreachable:
+                    break
+                logger.debug("Retrying %d unreachable Meross devices", len(unreachable))
+                await self._update_devices(unreachable)
+                for device_uuid in unreachable:
+                    device_entry = self._all_devices.get(device_uuid)
+                    if device_entry is not None and not device_entry[MerossAdapterThread.UNREACHABLE]:
+                        logger.info("Meross device %s is now reachable", device_uuid)
+            logger.debug("All Meross devices are reachable")
+        except asyncio.CancelledError:
+            logger.debug("Meross unreachable device retry stopped")
+        finally:
+            self._retry_task = None
+
     def get_device_type(self, device_address, device_channel):
         """
         Determine the type of a given device
@@ -439,11 +580,12 @@ class MerossAdapterThread(AdapterThread):
         # The default
         return MerossAdapterThread.DEVICE_TYPE_PLUG
 
-    async def is_on(self, device_address, device_channel):
+    async def is_on(self, device_address, device_channel, refresh=False):
         """
         Determine the on/off status of a device
         :param device_address:
         :param device_channel: 0-n
+        :param refresh: True to update the device even if its last update has not expired
         :return: True if the device is on.
         """
         device_entry = self._get_device(device_address)
@@ -451,7 +593,10 @@ class MerossAdapterThread(AdapterThread):
             return False
         device = device_entry[MerossAdapterThread.BASE_DEVICE]
         if device is not None and hasattr(device, "is_on"):
-            await self._update_device(device.uuid)
+            if not await self._update_device(device.uuid, force=refresh) and refresh:
+                # The last known state is returned, but the error keeps it out of the state cache
+                self.last_error_code = MerossAdapterThread.MEROSS_ERROR
+                self.last_error = f"Update of Meross device {device_address} failed"
             logger.debug("Calling is_on for Meross device %s", device.uuid)
             try:
                 return device.is_on()
@@ -485,7 +630,8 @@ class MerossAdapterThread(AdapterThread):
                 # Add to dict of all known devices
                 self._all_devices[device_uuid] = {
                     MerossAdapterThread.BASE_DEVICE: device,
-                    MerossAdapterThread.LAST_UPDATE: None
+                    MerossAdapterThread.LAST_UPDATE: None,
+                    MerossAdapterThread.UNREACHABLE: False
                 }
                 return self._all_devices[device_uuid]
             except Exception as ex:
@@ -562,14 +708,15 @@ class MerossAdapterThread(AdapterThread):
             supports_luminance = device.get_supports_luminance()
         return supports_luminance
 
-    async def _update_device(self, device_uuid):
+    async def _update_device(self, device_uuid, force=False):
         """
         Optimally update the state of a device
         :param device_uuid: uuid of device to be updated
+        :param force: True to update the device even if its last update has not expired
         :return: None
         """
         # An update is required if one has not been done OR the last update has expired
-        update_required = self._all_devices[device_uuid][MerossAdapterThread.LAST_UPDATE] is None
+        update_required = force or self._all_devices[device_uuid][MerossAdapterThread.LAST_UPDATE] is None
         if not update_required and MerossAdapterThread.UPDATE_LIFETIME > 0.0:
             elapsed = datetime.now() - self._all_devices[device_uuid][MerossAdapterThread.LAST_UPDATE]
             update_required = elapsed.total_seconds() > MerossAdapterThread.UPDATE_LIFETIME
@@ -583,6 +730,7 @@ class MerossAdapterThread(AdapterThread):
                     await self._all_devices[device_uuid][MerossAdapterThread.BASE_DEVICE].async_update(
                         timeout=MerossAdapterThread.ASYNC_UPDATE_TIMEOUT)
                     self._all_devices[device_uuid][MerossAdapterThread.LAST_UPDATE] = datetime.now()
+                    self._all_devices[device_uuid][MerossAdapterThread.UNREACHABLE] = False
                     logger.debug("async_update successful for Meross device %s after %d tries", device_uuid, retry + 1)
                     success = True
                 except CommandTimeoutError as ex:
@@ -630,14 +778,36 @@ class MerossAdapterThread(AdapterThread):
                 else:
                     # Status on or off?
                     logger.debug("No handling for device %s status %d", device.uuid, status)
+                # The on/off state of a device that went offline (or came back) is not known
+                if status != OnlineStatus.ONLINE and self.state_cache is not None:
+                    self.state_cache.invalidate(device.uuid)
             elif isinstance(push_notification, GenericPushNotification):
                 # onoff==0 appears to be ON and onoff==1 is OFF
                 logger.debug("GenericPushNotification raw_data: %s", json.dumps(push_notification.raw_data, indent=4))
+                # meross-iot applies the notification to the device before
+                # calling this handler, so the device holds the new state
+                self._record_device_state(device)
             else:
                 logger.debug("Unhandled notification %s for device %s",
                              type(push_notification), device.uuid)
                 logger.debug(json.dumps(push_notification.raw_data, indent=4))
 
+    def _record_device_state(self, device):
+        """
+        Record the on/off state of every channel of a device in the driver's state cache
+        :param device: Meross device
+        :return: None
+        """
+        if self.state_cache is None or not hasattr(device, "is_on"):
+            return
+        try:
+            for channel in range(max(1, len(device.channels))):
+                on = device.is_on(channel=channel)
+                if on is not None:
+                    self.state_cache.set_on(device.uuid, channel, on)
+        except Exception as ex:
+            logger.error("Unable to record state of Meross device %s: %s", device.uuid, str(ex))
+
     @staticmethod
     def _str_online_status(online_status):
         """
@@ -25,6 +25,8 @@ class MerossDriverV4(BaseThreadDriver):
     """
     MEROSS_ERROR = 7
     RETRY_COUNT = 5
+    # Meross devices are controlled through the Meross cloud
+    REQUIRES_INTERNET = True
 
     def __init__(self, request_wait_time=60.0):
         logger.info("Meross adapter thread initialization started")
@@ -42,7 +42,8 @@ class PyKasaDriver(BaseThreadDriver):
         :return:
         """
         kwargs = {
-            "discover_target": Configuration.PyKasaDiscoverTarget()
+            "discover_target": Configuration.PyKasaDiscoverTarget(),
+            "poll_interval": Configuration.PyKasaPollInterval()
         }
 
         # Run the request on the adapter thread
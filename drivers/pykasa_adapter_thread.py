@@ -12,6 +12,11 @@
 # The whole point of this design is to make sure that the asyncio based code
 # always runs on the same thread.
 #
+# When PyKasaPollInterval is set, a background task on the adapter thread
+# refreshes all devices every poll interval. It keeps the driver's state
+# cache current, notices devices switched by hand and saves on/off commands
+# from refreshing the device themselves.
+#
 import asyncio
 import logging
 import datetime
@@ -31,6 +36,16 @@ class PyKasaAdapterThread(AdapterThread):
     RETRY_COUNT = 5
     # Default discover target that limits scan to local network
     DISCOVER_TARGET = "192.168.1.255"
+    # Background state polling: devices updated at the same time and the time allowed for each update
+    POLL_BATCH_SIZE = 8
+    POLL_UPDATE_TIMEOUT = 5.0
+    # Discovery: devices updated at the same time and the time allowed for each update
+    DISCOVER_UPDATE_CONCURRENCY = 8
+    DISCOVER_UPDATE_TIMEOUT = 10.0
+    # Time allowed for a unicast lookup of a single device
+    DISCOVER_SINGLE_TIMEOUT = 5.0
+    # A known device is dropped after missing this many discoveries in a row
+    DISCOVER_MISS_LIMIT = 3
 
     def __init__(self, name="PyKasaAdapterThread"):
         """
@@ -39,42 +54,20 @@ class PyKasaAdapterThread(AdapterThread):
         super().__init__(name=name)
         self._all_devices = None
         self._discover_target = PyKasaAdapterThread.DISCOVER_TARGET
+        # Background state poller
+        self._poll_interval = 0.0
+        self._poll_task = None
+        # device_id -> last known on/off state and the time it last changed
+        self._last_state = {}
+        self._state_changed_at = {}
+        # device_id -> last known IP address, for targeted lookups
+        self._device_hosts = {}
+        # device_id -> number of discoveries in a row the device did not answer
+        self._discover_misses = {}
+        # device_id -> in-flight lookup task, shared by concurrent requests
+        self._lookups = {}
         logger.info("PyKasa driver initialized")
 
-    def run(self):
-        """
-        Run the driver in async mode
-        :return: None
-        """
-        asyncio.run(self.async_run())
-
-    async def async_run(self):
-        """
-        Run the realtime request server.
-        This method is called on the new thread by the Thread class.
-        The server terminates when the close request is received.
-        :return: None
-        """
-
-        # Note that the close method sets the terminate event
-        while not self._terminate_event.is_set():
-            # This is a blocking call. The adapter thread will wait here
-            # until a request arrives.
-            # Termination occurs when the close() method is called and the terminate event is set.
-            self._request = self._request_queue.get()
-            start_time = datetime.datetime.now()
-
-            # Cases for each request/command
-            result = await self.dispatch_request()
-
-            self._request.set_complete(result)
-            elapsed_time = datetime.datetime.now() - start_time
-            logger.debug("%s %s elapsed time: %f", self.adapter_name, self._request.request,
-                         elapsed_time.total_seconds())
-
-            # We are finished with this request
-            self._request = None
-
     async def dispatch_request(self):
         """
         Dispatch an adapter request.
@@ -85,10 +78,6 @@ class PyKasaAdapterThread(AdapterThread):
         result = None
 
         # Cases for each request/command
-        # Unlike the meross-iot module, none of the python-kasa methods are async
-
-        # TODO Make all of the requests async
-
         if self._request.request == AdapterRequest.DEVICE_ON:
             result = await self.device_on(**self._request.kwargs)
         elif self._request.request == AdapterRequest.DEVICE_OFF:
@@ -97,6 +86,8 @@ class PyKasaAdapterThread(AdapterThread):
             result = await self.set_brightness(**self._request.kwargs)
         elif self._request.request == AdapterRequest.SET_COLOR:
             result = await self.set_color(**self._request.kwargs)
+        elif self._request.request == AdapterRequest.APPLY_STATE:
+            result = await self.apply_state(**self._request.kwargs)
         elif self._request.request == AdapterRequest.OPEN:
             result = await self.open(**self._request.kwargs)
         elif self._request.request == AdapterRequest.CLOSE:
@@ -115,10 +106,11 @@ class PyKasaAdapterThread(AdapterThread):
 
         return result
 
-    async def open(self, discover_target):
+    async def open(self, discover_target, poll_interval=0.0):
         """
         Open the driver. Discovers all TPlink/Kasa devices.
         :param discover_target: Broadcast address to be used for discovering devices
+        :param poll_interval: Seconds between background device state refreshes. 0 for none.
         :return:
         """
         # Discover all devices
@@ -126,6 +118,13 @@ class PyKasaAdapterThread(AdapterThread):
             self._discover_target = discover_target
         logger.debug("PyKasa discover target: %s", self._discover_target)
         await self.discover_devices()
+
+        # Keep device state fresh in the background
+        if poll_interval is not None and float(poll_interval) > 0.0 and self._poll_task is None:
+            self._poll_interval = float(poll_interval)
+            self._poll_task = self._create_background_task(self._poll_devices)
+            logger.info("PyKasa polling device state every %f sec", self._poll_interval)
+
         logger.debug("PyKasa driver opened")
         return True
 
@@ -134,6 +133,10 @@ class PyKasaAdapterThread(AdapterThread):
         Close the driver. Does nothing for TPLink/Kasa devices.
         :return:
         """
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            await asyncio.wait([self._poll_task])
+            self._poll_task = None
         # Unconditionally, the adapter thread will terminate
         self._terminate_event.set()
         logger.debug("PyKasaAdapterThread closed")
@@ -238,7 +241,7 @@ class PyKasaAdapterThread(AdapterThread):
         dev = await self._get_device(house_device_code)
         if dev is not None:
             result = await self._exec_device_function(dev, dev.turn_on)
-            await dev.update()
+            await self._after_power_change(house_device_code, dev, result, True)
         else:
             result = False
         return result
@@ -256,11 +259,130 @@ class PyKasaAdapterThread(AdapterThread):
         dev = await self._get_device(house_device_code)
         if dev is not None:
             result = await self._exec_device_function(dev, dev.turn_off)
-            await dev.update()
+            await self._after_power_change(house_device_code, dev, result, False)
         else:
             result = False
         return result
 
+    async def apply_state(self, device_type, device_name_tag, house_device_code, channel,
+                          brightness=None, hex_color=None, power_on=True):
+        """
+        Set brightness and color, then turn the device on (or off). The device is
+        looked up and updated once. Brightness and color are skipped for devices
+        that do not support them.
+        :param device_type: the device's type (e.g. x10, hs100, smartplug, etc.)
+        :param device_name_tag: human readable name of device
+        :param house_device_code: Smart device IP address
+        :param channel: 0 to n
+        :param brightness: 0-100 percent or None
+        :param hex_color: Hex color #RRGGBB or None/empty
+        :param power_on: True to turn the device on, False to turn it off
+        :return: The result of turning the device on/off
+        """
+        logger.debug("ApplyState for: %s %s %s %s", device_type, device_name_tag, house_device_code, channel)
+        dev = await self._get_device(house_device_code)
+        if dev is None:
+            logger.error("Device %s was not found", device_name_tag)
+            return False
+
+        if Module.Light in dev.modules:
+            light = dev.modules[Module.Light]
+            if brightness is not None:
+                await self._exec_device_function(dev, lambda: light.set_brightness(brightness))
+            if hex_color and light.is_color:
+                hsv = self._hex_to_hsv(hex_color)
+                await self._exec_device_function(dev, lambda: light.set_hsv(int(hsv[0]), int(hsv[1]), int(hsv[2])))
+
+        # The result is the result of the on/off
+        result = await self._exec_device_function(dev, dev.turn_on if power_on else dev.turn_off)
+        await self._after_power_change(house_device_code, dev, result, power_on)
+        return result
+
+    async def _after_power_change(self, device_id, dev, result, power_on):
+        """
+        Bring the device's state up to date after turning it on or off
+        :param device_id: Device ID (address) of the device
+        :param dev: The device object
+        :param result: The result of the on/off command
+        :param power_on: True if the device was turned on
+        :return: None
+        """
+        if self._poll_task is None:
+            # Without the poller, the device object is only updated here
+            await dev.update()
+        elif result:
+            # The poller refreshes the device object. Until then, the command
+            # result is the state. This also keeps the poller from reporting
+            # the command as a manual change.
+            self._last_state[device_id] = power_on
+
+    async def _poll_devices(self):
+        """
+        Background task that refreshes the state of all devices every poll interval
+        :return: None
+        """
+        try:
+            while not self._terminate_event.is_set():
+                await asyncio.sleep(self._poll_interval)
+                start_time = datetime.datetime.now()
+                await self._poll_all_devices()
+                elapsed_time = datetime.datetime.now() - start_time
+                logger.debug("PyKasa polled %d devices in %f sec", len(self._all_devices or {}),
+                             elapsed_time.total_seconds())
+        except asyncio.CancelledError:
+            logger.debug("PyKasa device state poller stopped")
+
+    async def _poll_all_devices(self):
+        """
+        Refresh all devices, POLL_BATCH_SIZE at a time
+        :return: None
+        """
+        if not self._all_devices:
+            return
+        batch = asyncio.Semaphore(PyKasaAdapterThread.POLL_BATCH_SIZE)
+        # Discovery may replace the device dict while the poll is running
+        devices = list(self._all_devices.items())
+        await asyncio.gather(*[self._poll_device(device_id, dev, batch) for device_id, dev in devices])
+
+    async def _poll_device(self, device_id, dev, batch):
+        """
+        Refresh one device and record its state
+        :return: None
+        """
+        async with batch:
+            # Commands for the device take priority over the poll. The lock is
+            # first come, first served, so a busy device is skipped until the
+            # next poll instead of waiting in line ahead of later commands.
+            lock = self._get_device_lock(device_id)
+            if lock.locked():
+                logger.debug("PyKasa poll of %s (%s) skipped, device is busy", dev.alias, dev.host)
+                return
+            async with lock:
+                try:
+                    await asyncio.wait_for(dev.update(), PyKasaAdapterThread.POLL_UPDATE_TIMEOUT)
+                except Exception as ex:
+                    logger.warning("PyKasa poll of %s (%s) failed: %s", dev.alias, dev.host, str(ex) or type(ex).__name__)
+                    if self.state_cache is not None:
+                        self.state_cache.invalidate(device_id)
+                    return
+                self._record_state(device_id, dev)
+
+    def _record_state(self, device_id, dev):
+        """
+        Record the on/off state of a freshly updated device
+        :param device_id: Device ID (address) of the device
+        :param dev: The device object
+        :return: None
+        """
+        on = dev.is_on
+        previous = self._last_state.get(device_id)
+        if previous is not None and previous != on:
+            self._state_changed_at[device_id] = datetime.datetime.now()
+            logger.info("TPLink/Kasa device %s (%s) changed to %s", dev.alias, dev.host, "on" if on else "off")
+        self._last_state[device_id] = on
+        if self.state_cache is not None:
+            self.state_cache.set_on(device_id, 0, on)
+
     async def get_available_devices(self):
         """
         Get all known available TPLink/Kasa devices.
@@ -282,20 +404,90 @@ class PyKasaAdapterThread(AdapterThread):
     async def discover_devices(self):
         """
         Discover all TPLink/Kasa devices. This is
-        equivalent to rescan for all devices.
+        equivalent to rescan for all devices. The discovered devices are
+        merged into the known devices and updated concurrently. A known device
+        is dropped only after it misses DISCOVER_MISS_LIMIT discoveries in a row.
         :return:
         """
         # Discover all devices
         logger.debug("Discovering TPLink/Kasa devices")
+        start_time = datetime.datetime.now()
         # The returned dict is keyed by IP address. Change to device_id.
         devices = await Discover.discover(target=self._discover_target)
-        self._all_devices = {}
+
+        known_devices = self._all_devices if self._all_devices is not None else {}
+        # Known devices stay in the inventory. A device can miss a broadcast.
+        all_devices = dict(known_devices)
+        answered = {}
+        appeared = []
+        moved = []
         for ip, dev in devices.items():
-            self._all_devices[dev.device_id] = dev
-            await dev.update()
-        
+            device_id = dev.device_id
+            known_dev = known_devices.get(device_id)
+            if known_dev is None:
+                appeared.append(dev)
+                answered[device_id] = dev
+            elif known_dev.host != ip:
+                logger.info("TPLink/Kasa device %s moved from %s to %s", dev.alias, known_dev.host, ip)
+                moved.append(dev)
+                answered[device_id] = dev
+            else:
+                # Keep the device object that is already warmed up
+                answered[device_id] = known_dev
+            self._device_hosts[device_id] = ip
+            self._discover_misses.pop(device_id, None)
+        all_devices.update(answered)
+
+        # A device that has not answered DISCOVER_MISS_LIMIT discoveries in a row is
+        # dropped. Its last known IP address is kept so a later request can find it
+        # without a broadcast.
+        disappeared = []
+        for device_id, dev in known_devices.items():
+            if device_id in answered:
+                continue
+            misses = self._discover_misses.get(device_id, 0) + 1
+            if misses < PyKasaAdapterThread.DISCOVER_MISS_LIMIT:
+                self._discover_misses[device_id] = misses
+                logger.debug("TPLink/Kasa device %s at %s did not answer discovery (%d)", dev.alias, dev.host, misses)
+            else:
+                self._discover_misses.pop(device_id, None)
+                del all_devices[device_id]
+                disappeared.append(dev)
+
+        # On the first discovery every device is new
+        if known_devices:
+            for dev in appeared:
+                logger.info("TPLink/Kasa device %s appeared at %s", dev.alias, dev.host)
+        for dev in disappeared:
+            logger.info("TPLink/Kasa device %s at %s disappeared", dev.alias, dev.host)
+            if self.state_cache is not None:
+                self.state_cache.invalidate(dev.device_id)
+
+        # Devices that did not answer are left to the poller and device requests
+        batch = asyncio.Semaphore(PyKasaAdapterThread.DISCOVER_UPDATE_CONCURRENCY)
+        await asyncio.gather(*[self._discover_update(device_id, dev, batch)
+                               for device_id, dev in answered.items()])
+        self._all_devices = all_devices
+
+        elapsed_time = datetime.datetime.now() - start_time
+        logger.info("Discovered %d TPLink/Kasa devices (%d new, %d moved, %d gone) in %f sec",
+                    len(all_devices), len(appeared), len(moved), len(disappeared), elapsed_time.total_seconds())
         return True
 
+    async def _discover_update(self, device_id, dev, batch):
+        """
+        Update a discovered device
+        :return: None
+        """
+        async with batch:
+            # The state poller may be working on the device
+            async with self._get_device_lock(device_id):
+                try:
+                    await asyncio.wait_for(dev.update(), PyKasaAdapterThread.DISCOVER_UPDATE_TIMEOUT)
+                except Exception as ex:
+                    logger.warning("Update of TPLink/Kasa device %s (%s) failed: %s",
+                                   dev.alias, dev.host, str(ex) or type(ex).__name__)
+
     async def get_device_type(self, device_address, device_channel):
         """
         Determine the type of a given device
@@ -306,15 +498,41 @@ class PyKasaAdapterThread(AdapterThread):
         device = await self._get_device(device_address)
         return self._get_device_type(device)
 
-    async def is_on(self, device_address, device_channel):
+    async def is_on(self, device_address, device_channel, refresh=False):
         """
         Determine the on/off status of a device
         :param device_address:
         :param device_channel: 0-n
+        :param refresh: True to ask the device instead of using the last known state
         :return: True if the device is on.
         """
         device = await self._get_device(device_address)
-        return device.is_on
+        if device is None:
+            return False
+        if refresh:
+            try:
+                await asyncio.wait_for(device.update(), PyKasaAdapterThread.POLL_UPDATE_TIMEOUT)
+                self._record_state(device_address, device)
+            except Exception as ex:
+                # The last known state is returned, but the error keeps it out of the state cache
+                self.last_error_code = 1
+                self.last_error = "Update of TPLink/Kasa device {0} failed: {1}".format(
+                    device_address, str(ex) or type(ex).__name__)
+                logger.warning(self.last_error)
+        return self._known_on(device_address, device)
+
+    def _known_on(self, device_id, dev):
+        """
+        The best known on/off state of a device
+        :param device_id: Device ID (address) of the device
+        :param dev: The device object
+        :return: True if the device is on
+        """
+        if self._poll_task is not None:
+            # The device object is only refreshed by the poller. A command sent
+            # since the last poll is only recorded in the last known state.
+            return self._last_state.get(device_id, dev.is_on)
+        return dev.is_on
 
     def _get_device_type(self, dev):
         """
@@ -354,7 +572,7 @@ class PyKasaAdapterThread(AdapterThread):
             # Note that this is the IP address of the device
             attrs["host"] =  dev.host
             # TODO This needs to be "by channel", but currently we only support single channel devices
-            attrs["on"] = dev.is_on
+            attrs["on"] = self._known_on(dev.device_id, dev)
             if isinstance(dev, SmartStrip) or isinstance(dev, SmartLightStrip):
                 attrs["channels"] = len(sys_info["children"])
         except Exception as ex:
@@ -386,36 +604,90 @@ class PyKasaAdapterThread(AdapterThread):
 
     async def _create_smart_device(self, address):
         """
-        Create a TPLink SmartDevice instance for the device at a
-        given IP address
+        Find a TPLink device by broadcast discovery
         :param address: The mac address (device_id) of interest
-        :return:
+        :return: The device or None if it was not found
         """
         device = None
         # Discover all devices. This will take some time...
-        device = None
         devices = await Discover.discover(target=self._discover_target)
         # Look for address in the discovered devices
         for ip, dev in devices.items():
-            if ip == address:
+            # The discovery also tells us where all the other devices are
+            self._device_hosts[dev.device_id] = ip
+            if dev.device_id == address:
                 device = dev
-                break
 
         return device
 
+    async def _find_device_at_host(self, address, host):
+        """
+        Look for a TPLink device at its last known IP address
+        :param address: The mac address (device_id) of interest
+        :param host: The IP address where the device was last seen
+        :return: The device or None if it is not there
+        """
+        try:
+            dev = await asyncio.wait_for(Discover.discover_single(host),
+                                         PyKasaAdapterThread.DISCOVER_SINGLE_TIMEOUT)
+        except Exception as ex:
+            logger.debug("TPLink/Kasa device %s not found at %s: %s", address, host, str(ex) or type(ex).__name__)
+            return None
+
+        if dev.device_id != address:
+            # The address was given to another device
+            logger.debug("TPLink/Kasa device at %s is now %s", host, dev.device_id)
+            self._device_hosts[dev.device_id] = host
+            return None
+        return dev
+
+    async def _lookup_device(self, address):
+        """
+        Find a device that is not in the device list. A unicast lookup at the
+        device's last known IP address is tried first. A broadcast discovery
+        is the fall back.
+        :param address: The mac address (device_id) of interest
+        :return: The updated device or None if it was not found
+        """
+        device = None
+        host = self._device_hosts.get(address)
+        if host is not None:
+            device = await self._find_device_at_host(address, host)
+        if device is None:
+            logger.debug("Looking for TPLink/Kasa device %s by broadcast", address)
+            device = await self._create_smart_device(address)
+        if device is not None:
+            await device.update()
+            self._device_hosts[address] = device.host
+            self._all_devices[address] = device
+        return device
+
     async def _get_device(self, device_address):
         """
         Get the python-kasa device instance for a given address
         :param device_address: The mac address of the device (the device_id)
         :return: A SmartDevice object, usually a SmartPlug or SmartBulb.
+        None if the device could not be found.
         """
         if device_address in self._all_devices.keys():
-            device = self._all_devices[device_address]
-        else:
-            device = self._create_smart_device(device_address)
-            await device.update()
-            self._all_devices[device_address] = device
-        # TODO Consider aging the the data in the device object
+            # TODO Consider aging the the data in the device object
+            return self._all_devices[device_address]
+
+        # Concurrent misses for the same device wait on the same lookup
+        lookup = self._lookups.get(device_address)
+        if lookup is None:
+            lookup = self._loop.create_task(self._lookup_device(device_address))
+            self._lookups[device_address] = lookup
+            lookup.add_done_callback(lambda t: self._lookups.pop(device_address, None))
+        try:
+            device = await asyncio.shield(lookup)
+        except Exception as ex:
+            logger.error("Lookup of TPLink/Kasa device %s failed: %s", device_address, str(ex))
+            device = None
+
+        if device is None:
+            self.last_error_code = 1
+            self.last_error = "TPLink/Kasa device {0} was not found".format(device_address)
         return device
 
     def _log_device_exception(self, dev, ex):
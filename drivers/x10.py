@@ -0,0 +1,31 @@
+#
+# X10 device driver for XTB232/CM11A controllers
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+from .base_thread_driver import BaseThreadDriver
+from .x10_adapter_thread import X10AdapterThread
+import logging
+
+logger = logging.getLogger("server")
+
+
+class X10Driver(BaseThreadDriver):
+    """
+    Driver for X10 devices through an XTB232/CM11A controller on a serial port
+    (see the ComPort configuration setting). The whole purpose of this class is to
+    relay requests to the thread where the actual driver is running.
+    """
+
+    def __init__(self):
+        """
+        Initialize an instance of the X10 driver
+        """
+        super().__init__(adapter_thread=X10AdapterThread())
+        logger.info("X10 driver initialized")
@@ -0,0 +1,140 @@
+#
+# X10 adapter thread for XTB232/CM11A controllers
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+# All X10 requests go through the adapter thread's request queue. The
+# XTB232 driver is blocking, so each request's controller call runs on a
+# small pool of worker threads. Requests for the same device are serialized
+# by the base class. The XTB232 command queue and serial engine put every
+# transmission on the serial port in order, and commands that are in flight
+# at the same time can share a multi-address transmission.
+#
+
+import concurrent.futures
+import functools
+import logging
+from .adapter_thread import AdapterThread
+from .adapter_request import AdapterRequest
+from .XTB232 import XTB232
+
+logger = logging.getLogger("server")
+
+
+class X10AdapterThread(AdapterThread):
+    # Error codes
+    X10_ERROR = 8
+    # Controller calls that can be in flight at the same time
+    WORKERS = 8
+
+    def __init__(self, name="X10AdapterThread"):
+        super().__init__(name=name)
+        self._controller = XTB232()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=X10AdapterThread.WORKERS,
+                                                               thread_name_prefix="X10Worker")
+        # X10 modules can not be asked for their state. This is the
+        # last on/off state sent to each device address.
+        self._commanded_state = {}
+
+    async def dispatch_request(self):
+        """
+        Dispatch an adapter request.
+        This method is called on the adapter thread's event loop by the base class.
+        :return: Returns the result from running the request.
+        """
+        request = self._request.request
+        kwargs = self._request.kwargs
+
+        if request == AdapterRequest.DEVICE_ON:
+            result = await self._power(kwargs, True)
+        elif request == AdapterRequest.DEVICE_OFF:
+            result = await self._power(kwargs, False)
+        elif request == AdapterRequest.APPLY_STATE:
+            # X10 modules have no color and no absolute brightness
+            result = await self._power(kwargs, kwargs.get("power_on", True))
+        elif request in [AdapterRequest.SET_BRIGHTNESS, AdapterRequest.SET_COLOR]:
+            self.last_error_code = X10AdapterThread.X10_ERROR
+            self.last_error = "X10 devices do not support {0}".format(request)
+            result = False
+        elif request == AdapterRequest.OPEN:
+            result = await self._call_controller(self._controller.open)
+            if result:
+                logger.info("X10 adapter opened")
+        elif request == AdapterRequest.CLOSE:
+            result = await self.close()
+        elif request == AdapterRequest.GET_DEVICE_TYPE:
+            # There is no way to tell a lamp module from an appliance module
+            result = X10AdapterThread.DEVICE_TYPE_PLUG
+        elif request == AdapterRequest.GET_AVAILABLE_DEVICES:
+            # X10 devices can not be enumerated
+            result = {}
+        elif request == AdapterRequest.DISCOVER_DEVICES:
+            result = True
+        elif request == AdapterRequest.ON_OFF_STATUS:
+            result = self._commanded_state.get(kwargs["device_address"].upper(), False)
+        else:
+            logger.error("Unrecognized request: %s", request)
+            result = False
+
+        return result
+
+    async def close(self):
+        """
+        Close the controller. The adapter thread terminates.
+        :return: True
+        """
+        try:
+            await self._call_controller(self._controller.close)
+            logger.info("X10 adapter closed")
+        finally:
+            self._executor.shutdown(wait=False)
+            # Unconditionally, the adapter thread will terminate
+            self._terminate_event.set()
+        return True
+
+    async def _power(self, kwargs, power_on):
+        """
+        Turn a device on or off
+        :param kwargs: The request arguments (device_type, device_name_tag, house_device_code, channel)
+        :param power_on: True for on
+        :return: The result of the controller call
+        """
+        controller_function = self._controller.device_on if power_on else self._controller.device_off
+        result = await self._call_controller(controller_function,
+                                             device_type=kwargs["device_type"],
+                                             device_name_tag=kwargs["device_name_tag"],
+                                             house_device_code=kwargs["house_device_code"],
+                                             channel=kwargs["channel"])
+        if result:
+            self._commanded_state[kwargs["house_device_code"].upper()] = power_on
+        return result
+
+    async def _call_controller(self, controller_function, **kwargs):
+        """
+        Run a blocking controller call on a worker thread. The call's error
+        info and serial round trip time are recorded on the current request.
+        :param controller_function: An XTB232 method
+        :param kwargs: Arguments for the method
+        :return: The result of the method
+        """
+        result, error_code, error, serial_time = await self._loop.run_in_executor(
+            self._executor, functools.partial(self._run_controller_function, controller_function, kwargs))
+        self.last_error_code = error_code
+        self.last_error = error
+        if self._request is not None:
+            self._request.device_time = serial_time
+        logger.debug("X10 %s serial round trip time %f sec", controller_function.__name__, serial_time)
+        return result
+
+    def _run_controller_function(self, controller_function, kwargs):
+        # Runs on a worker thread. The controller keeps error info and serial time per thread.
+        self._controller.clear_last_error()
+        self._controller.pop_serial_time()
+        result = controller_function(**kwargs)
+        return result, self._controller.last_error_code, self._controller.last_error, \
+            self._controller.pop_serial_time()
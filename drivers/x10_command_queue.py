@@ -0,0 +1,181 @@
+#
+# X10 command queue
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+# The CM11a protocol allows several addresses on one house code to be
+# selected before a single function is sent. The function then applies to
+# all of the selected units. This queue holds each command for a short
+# gather window. Commands that arrive in the window with the same house
+# code, function and dim amount go out as one multi-address transmission.
+#
+
+import threading
+import time
+import logging
+
+logger = logging.getLogger("server")
+
+
+class X10Command:
+    """
+    A command waiting in the X10 command queue
+    """
+    def __init__(self, house_device_code, dim_amount, device_function):
+        self.house_device_code = house_device_code.upper()
+        self.dim_amount = dim_amount
+        self.device_function = device_function
+        self.queued_time = time.monotonic()
+        self.result = False
+        self.last_error_code = 0
+        self.last_error = None
+        # Seconds taken by the transmission that carried the command
+        self.round_trip_time = 0.0
+        self.done = threading.Event()
+
+    @property
+    def batch_key(self):
+        """
+        Commands with the same key can share one function transmission
+        """
+        return self.house_device_code[0:1], self.device_function, self.dim_amount
+
+
+class X10CommandQueue:
+    """
+    Batches X10 commands into multi-address transmissions
+    """
+    def __init__(self, send_batch, gather_window):
+        """
+        Create the queue and start its sender thread
+        :param send_batch: Callable(house_code, house_device_codes, dim_amount, device_function)
+        returning a tuple (result, error code, error message). It is only called on the sender thread.
+        :param gather_window: Seconds a command waits for others to join its transmission
+        """
+        self._send_batch = send_batch
+        self._gather_window = gather_window
+        self._pending = []
+        self._condition = threading.Condition()
+        self._terminate = False
+        self._thread = threading.Thread(target=self._run, name="X10CommandQueue")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, house_device_code, dim_amount, device_function):
+        """
+        Queue a command and wait for it to be transmitted
+        :param house_device_code: Ex. 'A1'
+        :param dim_amount: Device dim units 0-22
+        :param device_function: X10 function code
+        :return: The transmitted X10Command. It carries the result and error info.
+        """
+        command = X10Command(house_device_code, dim_amount, device_function)
+        with self._condition:
+            if self._terminate:
+                command.last_error_code = 1
+                command.last_error = "X10 command queue is closed"
+                return command
+            self._pending.append(command)
+            self._condition.notify()
+        command.done.wait()
+        return command
+
+    def close(self):
+        """
+        Stop the sender thread. Commands still waiting fail.
+        :return: None
+        """
+        with self._condition:
+            self._terminate = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        """
+        Sender thread
+        """
+        while True:
+            with self._condition:
+                while not self._pending and not self._terminate:
+                    self._condition.wait()
+                if self._terminate:
+                    break
+                first = self._pending[0]
+
+            # Give other commands a chance to join the transmission
+            wait_time = first.queued_time + self._gather_window - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+
+            with self._condition:
+                batch = self._take_batch(first.batch_key)
+
+            self._send(batch)
+
+        # Whatever is left will never be sent
+        with self._condition:
+            pending = self._pending
+            self._pending = []
+        for command in pending:
+            command.last_error_code = 1
+            command.last_error = "X10 command queue is closed"
+            command.done.set()
+
+    def _take_batch(self, batch_key):
+        """
+        Remove the commands that can share a transmission from the pending list.
+        Commands for the same unit stay in the order they were submitted.
+        Call with the condition held.
+        :param batch_key: The batch key of the first pending command
+        :return: List of X10Command
+        """
+        batch = []
+        # Units in the batch and units with an earlier command left waiting
+        batch_codes = set()
+        skipped_codes = set()
+        for command in self._pending:
+            if command.batch_key == batch_key and command.house_device_code not in skipped_codes:
+                batch.append(command)
+                batch_codes.add(command.house_device_code)
+            elif command.house_device_code in batch_codes:
+                # This command must go out after the batch. So must everything behind it.
+                break
+            else:
+                skipped_codes.add(command.house_device_code)
+        self._pending = [c for c in self._pending if c not in batch]
+        return batch
+
+    def _send(self, batch):
+        """
+        Send one multi-address transmission for a batch of commands
+        :param batch: List of X10Command with the same batch key
+        :return: None
+        """
+        house_code, device_function, dim_amount = batch[0].batch_key
+        # A unit only needs to be addressed once
+        house_device_codes = []
+        for command in batch:
+            if command.house_device_code not in house_device_codes:
+                house_device_codes.append(command.house_device_code)
+
+        if len(batch) > 1:
+            logger.debug("Sending %d X10 commands for %s as one transmission", len(batch), ",".join(house_device_codes))
+        start_time = time.monotonic()
+        try:
+            result, error_code, error = self._send_batch(house_code, house_device_codes, dim_amount, device_function)
+        except Exception as ex:
+            logger.error("X10 transmission failed: %s", str(ex))
+            result, error_code, error = False, 1, str(ex)
+        round_trip_time = time.monotonic() - start_time
+
+        for command in batch:
+            command.result = result
+            command.last_error_code = error_code
+            command.last_error = error
+            command.round_trip_time = round_trip_time
+            command.done.set()
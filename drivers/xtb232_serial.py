@@ -0,0 +1,454 @@
+#
+# XTB232/CM11A serial I/O engine
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+# References:
+#   http://jvde.us/info/CM11A_protocol.txt
+#
+# All bytes from the controller are read by a dedicated reader thread.
+# A small state machine decides what each byte means:
+#   idle            poll (0x5A) is serviced, time request (0xA5) is handed
+#                   to the sender, anything else is logged and dropped
+#   await-checksum  the next byte answers the command just sent
+#   await-ready     waiting for interface ready (0x55) after the commit ACK
+# Commands are submitted to a sender thread and return a Future. The sender
+# runs one exchange at a time and waits for each response with a real deadline.
+#
+
+import threading
+import queue
+import collections
+import concurrent.futures
+import datetime
+import time
+import binascii
+import logging
+
+logger = logging.getLogger("server")
+
+
+class SerialTransmission:
+    """
+    One command sent to the controller and its outcome
+    """
+    def __init__(self, command):
+        self.command = bytes(command)
+        self.result = False
+        self.error_code = XTB232Serial.Success
+        self.error = None
+        self.queued_time = time.monotonic()
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def wait_time(self):
+        """
+        Seconds the command waited for the sender
+        """
+        return (self.start_time or self.queued_time) - self.queued_time
+
+    @property
+    def round_trip_time(self):
+        """
+        Seconds from sending the command to interface ready (or failure)
+        """
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+
+class XTB232Serial:
+    """
+    Serial reader and sender threads for an XTB232/CM11A controller
+    """
+    # Protocol bytes. See CM11a Protocol.txt spec for these values.
+    InterfaceAck = 0x00
+    InterfaceReady = 0x55
+    InterfacePoll = 0x5A
+    InterfacePollAck = 0xC3
+    InterfaceTimeRequest = 0xA5
+    # The most data bytes an interface poll can deliver
+    MaxPollData = 9
+
+    # Error codes
+    Success = 0
+    ChecksumTimeout = 1
+    InterfaceReadyTimeout = 2
+    ChecksumError = 6
+    Closed = 7
+    TransmissionTimeout = 8
+
+    # Deadlines (seconds)
+    READ_TIMEOUT = 0.5
+    CHECKSUM_TIMEOUT = 2.0
+    READY_TIMEOUT = 2.0
+    RETRY_COUNT = 3
+    # Longest a caller waits for a submitted transmission, including time in the queue
+    RESULT_TIMEOUT = 30.0
+
+    # Reader states
+    IDLE = "idle"
+    AWAIT_CHECKSUM = "await-checksum"
+    AWAIT_READY = "await-ready"
+
+    # Events passed from the reader to the sender
+    EVENT_CHECKSUM = "checksum"
+    EVENT_READY = "ready"
+    EVENT_POLL = "poll"
+    EVENT_TIME_REQUEST = "time-request"
+    EVENT_UNEXPECTED = "unexpected"
+
+    def __init__(self, port, create_set_time_command):
+        """
+        :param port: An open serial port. Its read timeout should be short (READ_TIMEOUT).
+        :param create_set_time_command: Callable(datetime) returning the set time command bytes
+        """
+        self._port = port
+        self._create_set_time_command = create_set_time_command
+        self._terminate = threading.Event()
+        # Keeps submit from queuing a transmission after close
+        self._submit_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        # Reader state, set by the sender before it writes
+        self._state_lock = threading.Lock()
+        self._state = XTB232Serial.IDLE
+        self._expected_checksum = None
+        # Responses to the exchange in progress
+        self._responses = queue.Queue()
+        # Submitted transmissions and time requests that arrive while idle
+        self._work = queue.Queue()
+        # Data received from interface polls (the most recent ones)
+        self.poll_data = collections.deque(maxlen=16)
+
+        self._stats_lock = threading.Lock()
+        self._count = 0
+        self._total_round_trip = 0.0
+        self._max_round_trip = 0.0
+
+        self._reader = threading.Thread(target=self._run_reader, name="XTB232Reader")
+        self._reader.daemon = True
+        self._sender = threading.Thread(target=self._run_sender, name="XTB232Sender")
+        self._sender.daemon = True
+
+    def start(self):
+        self._reader.start()
+        self._sender.start()
+
+    def close(self):
+        """
+        Stop both threads. Transmissions that have not been sent fail.
+        :return: None
+        """
+        with self._submit_lock:
+            self._terminate.set()
+        self._work.put(None)
+        self._sender.join()
+        self._reader.join()
+
+    def submit(self, command):
+        """
+        Queue a command for transmission
+        :param command: Command bytes
+        :return: A concurrent.futures.Future. Its result is a SerialTransmission.
+        """
+        future = concurrent.futures.Future()
+        transmission = SerialTransmission(command)
+        with self._submit_lock:
+            if not self._terminate.is_set():
+                self._work.put((future, transmission))
+                return future
+        self._fail(future, transmission)
+        return future
+
+    def get_stats(self):
+        """
+        Transmission count and round trip times in milliseconds
+        """
+        with self._stats_lock:
+            return {
+                "transmissions": self._count,
+                "avg-round-trip-ms": round(self._total_round_trip / self._count * 1000.0, 3) if self._count else 0.0,
+                "max-round-trip-ms": round(self._max_round_trip * 1000.0, 3)
+            }
+
+    ########################################################################
+    # Reader thread
+    def _run_reader(self):
+        while not self._terminate.is_set():
+            b = self._read_byte()
+            if b is None:
+                continue
+            with self._state_lock:
+                state = self._state
+                expected_checksum = self._expected_checksum
+            if state == XTB232Serial.AWAIT_CHECKSUM:
+                self._on_checksum_byte(b, expected_checksum)
+            elif state == XTB232Serial.AWAIT_READY:
+                self._on_ready_byte(b)
+            else:
+                self._on_idle_byte(b)
+        logger.debug("XTB232 serial reader stopped")
+
+    def _on_checksum_byte(self, b, expected_checksum):
+        self._set_state(XTB232Serial.IDLE)
+        # An expected checksum of None accepts any byte (the XTB232 answers
+        # set time with a checksum that is never valid)
+        if expected_checksum is None or b == expected_checksum:
+            self._responses.put((XTB232Serial.EVENT_CHECKSUM, b))
+        elif b == XTB232Serial.InterfaceReady:
+            self._responses.put((XTB232Serial.EVENT_READY, b))
+        elif b == XTB232Serial.InterfaceTimeRequest:
+            self._responses.put((XTB232Serial.EVENT_TIME_REQUEST, b))
+        elif b == XTB232Serial.InterfacePoll:
+            # The interface ignores commands until the poll is serviced
+            self._service_poll()
+            self._responses.put((XTB232Serial.EVENT_POLL, b))
+        else:
+            self._responses.put((XTB232Serial.EVENT_UNEXPECTED, b))
+
+    def _on_ready_byte(self, b):
+        if b == XTB232Serial.InterfaceReady:
+            self._set_state(XTB232Serial.IDLE)
+            self._responses.put((XTB232Serial.EVENT_READY, b))
+        elif b == XTB232Serial.InterfacePoll:
+            # Keep waiting for ready after the poll
+            self._service_poll()
+        elif b == XTB232Serial.InterfaceTimeRequest:
+            self._set_state(XTB232Serial.IDLE)
+            self._responses.put((XTB232Serial.EVENT_TIME_REQUEST, b))
+        else:
+            logger.debug("XTB232 expected interface ready, received 0x%X", b)
+
+    def _on_idle_byte(self, b):
+        if b == XTB232Serial.InterfacePoll:
+            self._service_poll()
+        elif b == XTB232Serial.InterfaceTimeRequest:
+            # Answered by the sender so it does not interleave with a command
+            logger.info("XTB232 interface time request received")
+            self._work.put(XTB232Serial.EVENT_TIME_REQUEST)
+        elif b == XTB232Serial.InterfaceReady:
+            logger.debug("XTB232 interface ready received while idle")
+        else:
+            logger.debug("XTB232 unexpected byte 0x%X received while idle", b)
+
+    def _service_poll(self):
+        """
+        Acknowledge an interface poll and read its data. The data is kept in poll_data.
+        Runs on the reader thread.
+        """
+        self._write(bytes([XTB232Serial.InterfacePollAck]))
+        count = self._read_byte()
+        if count is None:
+            logger.warning("XTB232 interface poll did not send a data count")
+            return
+        if count > XTB232Serial.MaxPollData:
+            logger.warning("XTB232 interface poll data count %d is invalid", count)
+            return
+        data = bytearray()
+        for i in range(count):
+            b = self._read_byte()
+            if b is None:
+                logger.warning("XTB232 interface poll data ended after %d of %d bytes", i, count)
+                break
+            data.append(b)
+        self.poll_data.append(bytes(data))
+        logger.debug("Read %d bytes from interface poll: %s", len(data), binascii.hexlify(data))
+
+    def _read_byte(self):
+        """
+        Read a byte from the serial port. Returns an integer or None on timeout.
+        """
+        try:
+            # Note that the serial read returns bytes
+            b = self._port.read(1)
+        except Exception as ex:
+            if not self._terminate.is_set():
+                logger.error("XTB232 serial read failed: %s", str(ex))
+                # Do not spin on a broken port
+                time.sleep(XTB232Serial.READ_TIMEOUT)
+            return None
+        if len(b) == 1:
+            return b[0]
+        return None
+
+    ########################################################################
+    # Sender thread
+    def _run_sender(self):
+        while True:
+            item = self._work.get()
+            if item is None or self._terminate.is_set():
+                if isinstance(item, tuple):
+                    self._fail(*item)
+                break
+            if item == XTB232Serial.EVENT_TIME_REQUEST:
+                self._set_interface_time()
+                continue
+
+            future, transmission = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            transmission.start_time = time.monotonic()
+            try:
+                self._transmit(transmission)
+            except Exception as ex:
+                logger.error("XTB232 transmission failed: %s", str(ex))
+                transmission.result = False
+                transmission.error_code = XTB232Serial.ChecksumError
+                transmission.error = str(ex)
+            transmission.end_time = time.monotonic()
+            self._record(transmission)
+            future.set_result(transmission)
+
+        # Whatever is left will never be sent
+        while not self._work.empty():
+            item = self._work.get_nowait()
+            if isinstance(item, tuple):
+                self._fail(*item)
+        logger.debug("XTB232 serial sender stopped")
+
+    def _transmit(self, transmission):
+        """
+        Send a multi-byte command to the interface
+
+        PC                               Interface
+        --------------------              --------------------------
+        Bytes of command     ->
+                             <-          Checksum
+        0x00 commit          ->
+                             <-          Interface ready
+        """
+        cmd = transmission.command
+        expected_checksum = XTB232Serial.CalculateChecksum(cmd)
+
+        retry_count = 0
+        while retry_count < XTB232Serial.RETRY_COUNT:
+            logger.info("Sending command: %s", binascii.hexlify(cmd))
+            event, value = self._exchange(cmd, XTB232Serial.AWAIT_CHECKSUM, expected_checksum,
+                                          XTB232Serial.CHECKSUM_TIMEOUT)
+            if event == XTB232Serial.EVENT_CHECKSUM:
+                logger.info("Good checksum received")
+                # Commit the command and wait for the interface ready signal
+                event, value = self._exchange(bytes([XTB232Serial.InterfaceAck]), XTB232Serial.AWAIT_READY, None,
+                                              XTB232Serial.READY_TIMEOUT)
+                if event == XTB232Serial.EVENT_READY:
+                    logger.info("Interface ready received")
+                    self._set_outcome(transmission, True, XTB232Serial.Success, "")
+                else:
+                    # The command was committed, but no interface ready arrived. It's 50-50 as to
+                    # whether everything is OK. We'll assume it is.
+                    self._set_outcome(transmission, True, XTB232Serial.InterfaceReadyTimeout,
+                                      "Expected interface ready signal, but received {0}".format(
+                                          "0x{0:X}".format(value) if value is not None else "None"))
+                    logger.warning(transmission.error)
+                    if event == XTB232Serial.EVENT_TIME_REQUEST:
+                        self._set_interface_time()
+                return
+            elif event == XTB232Serial.EVENT_READY:
+                # We expected a checksum, but received an interface ready. We'll move on.
+                self._set_outcome(transmission, True, XTB232Serial.Success,
+                                  "SendCommand expected a checksum, but has received an interface ready")
+                logger.warning(transmission.error)
+                return
+            elif event == XTB232Serial.EVENT_TIME_REQUEST:
+                # The power line controller was likely reset and is waiting for the current time.
+                logger.warning("Expected checksum, but received an InterfaceTimeRequest. Setting interface time.")
+                self._set_interface_time()
+                retry_count += 1
+            elif event == XTB232Serial.EVENT_POLL:
+                # The poll has been serviced. Send the command again.
+                logger.debug("Received interface poll, sending command again")
+                retry_count += 1
+            elif event is None:
+                self._set_outcome(transmission, False, XTB232Serial.ChecksumTimeout,
+                                  "Timeout waiting for checksum from controller")
+                logger.error(transmission.error)
+                return
+            else:
+                logger.error("Checksum error. Exp: %x Act: %x", expected_checksum, value)
+                retry_count += 1
+
+        # If we have fallen to here, the command transmission failed.
+        self._set_outcome(transmission, False, XTB232Serial.ChecksumError,
+                          "Checksum error attempting to transmit command")
+
+    def _set_interface_time(self):
+        """
+        Send the time to the controller. Note that the XTB232 ignores the time value.
+        But, this is kept for CM11A compatibility. See section 8 of the spec.
+        """
+        time_data = self._create_set_time_command(datetime.datetime.now())
+        logger.info("Sending set time command: %s", binascii.hexlify(time_data))
+        # By observation the XTB-232 never returns a valid checksum, so any byte will do
+        event, value = self._exchange(time_data, XTB232Serial.AWAIT_CHECKSUM, None, XTB232Serial.CHECKSUM_TIMEOUT)
+        logger.info("Response from set time was %s", "0x{0:X}".format(value) if value is not None else "None")
+        # Regardless of the response, we'll send an ACK
+        event, value = self._exchange(bytes([XTB232Serial.InterfaceAck]), XTB232Serial.AWAIT_READY, None,
+                                      XTB232Serial.READY_TIMEOUT)
+        if event == XTB232Serial.EVENT_READY:
+            logger.info("Interface time set")
+        else:
+            logger.warning("No interface ready after setting interface time")
+
+    def _exchange(self, data, state, expected_checksum, timeout):
+        """
+        Write data and wait for the reader to report the response
+        :return: A tuple (event, byte). The event is None if the deadline passed.
+        """
+        # Responses to an earlier exchange that timed out are stale
+        while not self._responses.empty():
+            self._responses.get_nowait()
+        # The state is set first so a fast response is not taken for an idle byte
+        self._set_state(state, expected_checksum)
+        self._write(data)
+        try:
+            return self._responses.get(timeout=timeout)
+        except queue.Empty:
+            self._set_state(XTB232Serial.IDLE)
+            return None, None
+
+    def _set_state(self, state, expected_checksum=None):
+        with self._state_lock:
+            self._state = state
+            self._expected_checksum = expected_checksum
+
+    def _write(self, data):
+        with self._write_lock:
+            self._port.write(data)
+
+    @staticmethod
+    def _set_outcome(transmission, result, error_code, error):
+        transmission.result = result
+        transmission.error_code = error_code
+        transmission.error = error
+
+    def _record(self, transmission):
+        round_trip = transmission.round_trip_time
+        logger.debug("XTB232 transmission %s waited %f sec, round trip %f sec",
+                     binascii.hexlify(transmission.command), transmission.wait_time, round_trip)
+        with self._stats_lock:
+            self._count += 1
+            self._total_round_trip += round_trip
+            self._max_round_trip = max(self._max_round_trip, round_trip)
+
+    @staticmethod
+    def _fail(future, transmission):
+        XTB232Serial._set_outcome(transmission, False, XTB232Serial.Closed, "XTB232 serial port is closed")
+        if future.set_running_or_notify_cancel():
+            future.set_result(transmission)
+
+    ########################################################################
+    # Calculate the simple checksum of an iterable list of bytes
+    @staticmethod
+    def CalculateChecksum(data):
+        checksum = 0
+        for b in data:
+            checksum += b
+            checksum &= 0xFF
+        return checksum
@@ -0,0 +1,151 @@
+#
+# Admission control for command execution
+# Copyright © 2026  Dave Hocker (email: AtHomeX10@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+# Limits the number of commands executing at the same time. There is a
+# limit on the total number of executing commands (the size of the worker
+# pool) and an optional, smaller limit per command class (for example,
+# discoverdevices). A request that cannot run immediately waits in a queue.
+# When the queue is full, the request is rejected so that a stalled
+# device (e.g. a Meross cloud call) cannot cause an unbounded pile up
+# of waiting handler threads.
+#
+
+import threading
+import time
+import logging
+
+logger = logging.getLogger("server")
+
+
+class ServerBusyError(Exception):
+    """
+    Raised when a request cannot be admitted because the queue is full
+    """
+    pass
+
+
+class _CommandClassStats:
+    """
+    Running counts for a command class
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.executing = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def to_dict(self):
+        return {
+            "limit": self.limit,
+            "executing": self.executing,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "average-wait-ms": round((self.total_wait / self.admitted) * 1000.0, 3) if self.admitted else 0.0,
+            "max-wait-ms": round(self.max_wait * 1000.0, 3)
+        }
+
+
+class CommandAdmission:
+    """
+    Bounded pool of execution slots with per command class limits
+    """
+    def __init__(self, max_workers=16, max_queue_depth=32, class_limits=None):
+        """
+        Create an admission controller
+        :param max_workers: Maximum number of commands executing at once
+        :param max_queue_depth: Maximum number of requests waiting for a slot.
+        A request arriving when the queue is full is rejected.
+        :param class_limits: dict of command class name to maximum concurrent executions
+        """
+        self._max_workers = max_workers
+        self._max_queue_depth = max_queue_depth
+        self._class_limits = dict(class_limits) if class_limits else {}
+        self._cond = threading.Condition()
+        self._executing = 0
+        self._waiting = 0
+        self._rejected = 0
+        self._classes = {}
+
+    def _class_stats(self, command_class):
+        stats = self._classes.get(command_class)
+        if stats is None:
+            stats = _CommandClassStats(self._class_limits.get(command_class))
+            self._classes[command_class] = stats
+        return stats
+
+    def _can_run(self, stats):
+        if self._executing >= self._max_workers:
+            return False
+        return stats.limit is None or stats.executing < stats.limit
+
+    def acquire(self, command_class):
+        """
+        Wait for an execution slot for a command class
+        :param command_class: Name of the command class (all aliases of a command share a class)
+        :return: Time spent waiting in seconds
+        """
+        start = time.monotonic()
+        with self._cond:
+            stats = self._class_stats(command_class)
+            if not self._can_run(stats):
+                if self._waiting >= self._max_queue_depth:
+                    self._rejected += 1
+                    stats.rejected += 1
+                    raise ServerBusyError("Server busy: {0} requests waiting".format(self._waiting))
+                self._waiting += 1
+                stats.waiting += 1
+                try:
+                    while not self._can_run(stats):
+                        self._cond.wait()
+                finally:
+                    self._waiting -= 1
+                    stats.waiting -= 1
+
+            self._executing += 1
+            stats.executing += 1
+            wait_time = time.monotonic() - start
+            stats.admitted += 1
+            stats.total_wait += wait_time
+            stats.max_wait = max(stats.max_wait, wait_time)
+
+        if wait_time > 1.0:
+            logger.warning("%s waited %f sec for an execution slot", command_class, wait_time)
+        return wait_time
+
+    def release(self, command_class):
+        """
+        Return an execution slot acquired for a command class
+        :param command_class: Name of the command class
+        :return: None
+        """
+        with self._cond:
+            self._executing -= 1
+            self._classes[command_class].executing -= 1
+            # Waiters are for different classes, so wake all of them to re-check
+            self._cond.notify_all()
+
+    def get_stats(self):
+        """
+        Return a snapshot of the admission state suitable for a response
+        :return: dict
+        """
+        with self._cond:
+            return {
+                "max-workers": self._max_workers,
+                "max-queue-depth": self._max_queue_depth,
+                "executing": self._executing,
+                "queue-depth": self._waiting,
+                "rejected": self._rejected,
+                "commands": {name: stats.to_dict() for name, stats in sorted(self._classes.items())}
+            }
@@ -23,19 +23,30 @@ import ntplib
 logger = logging.getLogger("server")
 
 
-def is_internet_up(ntp_server="time.nist.gov", max_time=0.0, wait_time=5.0):
+def is_internet_up(ntp_server="time.nist.gov", max_time=0.0, wait_time=5.0, stop_event=None):
     """
     Verify Internet access. This is required for Meross devices to work.
     This is mostly about recovering from power outages.
     :param ntp_server: An NTP server to contact.
     :param max_time: Maximum amount of time to consume. A value of 0.0 means "forever".
     :param wait_time: How long to wait between connection attempts
+    :param stop_event: Optional threading.Event. When set, the check is abandoned.
     :return: Returns True if internet is accessible
     """
+    def wait():
+        # Returns True if the check should be abandoned
+        if stop_event is not None:
+            return stop_event.wait(wait_time)
+        time.sleep(wait_time)
+        return False
+
     logger.info("Verifying Internet connection...")
     ntp_client = ntplib.NTPClient()
     elapsed_time = 0.0
     while max_time == 0.0 or elapsed_time < max_time:
+        if stop_event is not None and stop_event.is_set():
+            logger.info("Internet check cancelled")
+            return False
         try:
             # Internet access is verified by connecting to a reliable, well-known
             # server (in this case an NTP server).
@@ -43,20 +54,23 @@ def is_internet_up(ntp_server="time.nist.gov", max_time=0.0, wait_time=5.0):
             if response is not None:
                 logger.info("Internet verification successful")
                 return True
-            time.sleep(wait_time)
+            if wait():
+                break
             elapsed_time += wait_time
         except KeyboardInterrupt:
             logger.info("Keyboard interrupt terminated Internet check")
             break
         except ntplib.NTPException:
             # Wait and try again
-            time.sleep(wait_time)
+            if wait():
+                break
             elapsed_time += wait_time
         except Exception as e:
             logger.error("Unhandled exception occurred during Internet verification")
             logger.error(str(e))
             # logger.error(sys.exc_info()[0])
-            time.sleep(wait_time)
+            if wait():
+                break
             elapsed_time += wait_time
 
     # Internet test failed
@@ -0,0 +1,303 @@
+#
+# JSON request/response framing for the AtHomePowerlineServer socket protocol
+# Copyright © 2026  Dave Hocker (email: AtHomeX10@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+# Three framings are supported. The framing is negotiated once per connection
+# based on the first bytes the client sends.
+#
+#   json     The original protocol. The client sends a bare JSON object.
+#            The end of the request is found by tracking brace depth
+#            (ignoring braces inside strings). Responses are bare JSON.
+#   newline  The client opens with the line "framing=newline". Each request
+#            and each response is one line of JSON terminated by "\n".
+#   length   The client opens with the line "framing=length". Each request and
+#            each response is a 4 byte, big endian length followed by that
+#            many bytes of UTF-8 JSON.
+#
+# The decoder does not do any I/O. It is fed raw bytes and hands back complete
+# frames. This allows the same framing code to be used by the threaded socket
+# server and by an asyncio based server.
+#
+
+import json
+import struct
+import logging
+
+logger = logging.getLogger("server")
+
+
+class FramingError(Exception):
+    """
+    Raised when a client sends data that cannot be framed
+    """
+    pass
+
+
+class JsonFrameDecoder:
+    """
+    Incremental, sans-I/O decoder that turns a byte stream into JSON frames
+    """
+    # Framing modes
+    FRAMING_JSON = "json"
+    FRAMING_NEWLINE = "newline"
+    FRAMING_LENGTH = "length"
+    FRAMING_MODES = [FRAMING_JSON, FRAMING_NEWLINE, FRAMING_LENGTH]
+
+    # Negotiation line prefix (e.g. framing=length)
+    NEGOTIATION_PREFIX = b"framing="
+    # Longest negotiation line we are willing to buffer
+    MAX_NEGOTIATION_LENGTH = 64
+    # Length prefix for length framing
+    LENGTH_PREFIX = struct.Struct("!I")
+    # Upper limit on the size of a single request
+    MAX_FRAME_SIZE = 1024 * 1024
+
+    # Byte values used by the brace scanner
+    _OPEN_BRACE = ord("{")
+    _CLOSE_BRACE = ord("}")
+    _QUOTE = ord("\"")
+    _BACKSLASH = ord("\\")
+    _WHITESPACE = b" \t\r\n"
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        """
+        Create a decoder for a single connection
+        :param max_frame_size: Maximum size of a request in bytes
+        """
+        self._buffer = bytearray()
+        self._max_frame_size = max_frame_size
+        self._framing = None
+        self._reset_scanner()
+
+    @property
+    def framing(self):
+        """
+        The negotiated framing mode or None if not yet known
+        """
+        return self._framing
+
+    @property
+    def buffered(self):
+        """
+        Number of received bytes not yet returned as a frame
+        """
+        return len(self._buffer)
+
+    def feed(self, data):
+        """
+        Add received bytes to the decoder
+        :param data: bytes, bytearray or memoryview
+        :return: None
+        """
+        self._buffer += data
+
+    def next_frame(self):
+        """
+        Extract the next complete frame from the buffered data.
+        :return: The frame as a str or None if a complete frame is not yet available.
+        """
+        if self._framing is None and not self._negotiate():
+            return None
+
+        if self._framing == JsonFrameDecoder.FRAMING_LENGTH:
+            return self._next_length_frame()
+        if self._framing == JsonFrameDecoder.FRAMING_NEWLINE:
+            return self._next_newline_frame()
+        return self._next_json_frame()
+
+    def encode(self, response):
+        """
+        Encode a response using the negotiated framing
+        :param response: A dict to be serialized as JSON
+        :return: bytes ready to be sent
+        """
+        return JsonFrameDecoder.encode_frame(response, self._framing)
+
+    @classmethod
+    def encode_frame(cls, response, framing):
+        """
+        Encode a response for a given framing mode
+        :param response: A dict to be serialized as JSON
+        :param framing: One of the FRAMING_xxx modes
+        :return: bytes ready to be sent
+        """
+        payload = json.JSONEncoder().encode(response).encode()
+        if framing == JsonFrameDecoder.FRAMING_LENGTH:
+            return JsonFrameDecoder.LENGTH_PREFIX.pack(len(payload)) + payload
+        if framing == JsonFrameDecoder.FRAMING_NEWLINE:
+            return payload + b"\n"
+        return payload
+
+    def _negotiate(self):
+        """
+        Determine the framing for the connection from the first bytes received
+        :return: True if the framing has been determined
+        """
+        # Skip leading white space
+        start = 0
+        while start < len(self._buffer) and self._buffer[start] in JsonFrameDecoder._WHITESPACE:
+            start += 1
+        if start >= len(self._buffer):
+            return False
+
+        first = self._buffer[start]
+        # The original clients sometimes sent a leading quote (a JSON string)
+        if first == JsonFrameDecoder._OPEN_BRACE or first == JsonFrameDecoder._QUOTE:
+            self._framing = JsonFrameDecoder.FRAMING_JSON
+            return True
+
+        # Otherwise, we expect a negotiation line
+        eol = self._buffer.find(b"\n", start)
+        if eol < 0:
+            if len(self._buffer) - start > JsonFrameDecoder.MAX_NEGOTIATION_LENGTH:
+                raise FramingError("Unrecognized framing negotiation")
+            return False
+
+        line = bytes(self._buffer[start:eol]).strip()
+        del self._buffer[:eol + 1]
+        if not line.startswith(JsonFrameDecoder.NEGOTIATION_PREFIX):
+            raise FramingError("Unrecognized framing negotiation: {0}".format(line[:32]))
+        framing = line[len(JsonFrameDecoder.NEGOTIATION_PREFIX):].decode(errors="replace").lower()
+        if framing not in JsonFrameDecoder.FRAMING_MODES:
+            raise FramingError("Unsupported framing: {0}".format(framing))
+
+        self._framing = framing
+        logger.debug("Negotiated %s framing", framing)
+        return True
+
+    def _next_length_frame(self):
+        header_size = JsonFrameDecoder.LENGTH_PREFIX.size
+        if len(self._buffer) < header_size:
+            return None
+        (frame_size,) = JsonFrameDecoder.LENGTH_PREFIX.unpack_from(self._buffer)
+        if frame_size > self._max_frame_size:
+            raise FramingError("Request of {0} bytes exceeds maximum size".format(frame_size))
+        if len(self._buffer) < header_size + frame_size:
+            return None
+        frame = bytes(self._buffer[header_size:header_size + frame_size])
+        del self._buffer[:header_size + frame_size]
+        return frame.decode()
+
+    def _next_newline_frame(self):
+        while True:
+            eol = self._buffer.find(b"\n")
+            if eol < 0:
+                if len(self._buffer) > self._max_frame_size:
+                    raise FramingError("Request exceeds maximum size")
+                return None
+            frame = bytes(self._buffer[:eol]).strip()
+            del self._buffer[:eol + 1]
+            # Blank lines are ignored
+            if frame:
+                return frame.decode()
+
+    def _reset_scanner(self):
+        """
+        Reset the brace scanner state for the next frame
+        """
+        self._scan_pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._frame_start = -1
+
+    def _next_json_frame(self):
+        """
+        Scan forward from where the last call stopped looking for the brace that
+        closes the top level object. Braces inside of strings are ignored.
+        UTF-8 multibyte sequences never contain ASCII bytes, so scanning bytes is safe.
+        """
+        buf = self._buffer
+        pos = self._scan_pos
+        end = len(buf)
+
+        while pos < end:
+            b = buf[pos]
+            if self._frame_start < 0:
+                # Between frames. Skip white space and the legacy leading quote.
+                if b == JsonFrameDecoder._OPEN_BRACE:
+                    self._frame_start = pos
+                    self._depth = 1
+                elif b != JsonFrameDecoder._QUOTE and b not in JsonFrameDecoder._WHITESPACE:
+                    raise FramingError("Expected a JSON object, received 0x{0:02X}".format(b))
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif b == JsonFrameDecoder._BACKSLASH:
+                    self._escape = True
+                elif b == JsonFrameDecoder._QUOTE:
+                    self._in_string = False
+            elif b == JsonFrameDecoder._QUOTE:
+                self._in_string = True
+            elif b == JsonFrameDecoder._OPEN_BRACE:
+                self._depth += 1
+            elif b == JsonFrameDecoder._CLOSE_BRACE:
+                self._depth -= 1
+                if self._depth == 0:
+                    frame = bytes(buf[self._frame_start:pos + 1])
+                    del buf[:pos + 1]
+                    self._reset_scanner()
+                    return frame.decode()
+            pos += 1
+
+        if self._frame_start < 0:
+            # Nothing but white space (or stray quotes) so far
+            del buf[:pos]
+            pos = 0
+        elif pos - self._frame_start > self._max_frame_size:
+            raise FramingError("Request exceeds maximum size")
+        self._scan_pos = pos
+        return None
+
+
+class JsonFrameReader:
+    """
+    Reads JSON frames from a blocking socket using chunked reads into a reusable buffer
+    """
+    CHUNK_SIZE = 4096
+
+    def __init__(self, sock, chunk_size=CHUNK_SIZE, max_frame_size=JsonFrameDecoder.MAX_FRAME_SIZE):
+        """
+        Create a reader for a connected socket
+        :param sock: A connected, blocking socket
+        :param chunk_size: The size of each recv
+        :param max_frame_size: Maximum size of a request in bytes
+        """
+        self._sock = sock
+        self._decoder = JsonFrameDecoder(max_frame_size=max_frame_size)
+        self._chunk = bytearray(chunk_size)
+        self._chunk_view = memoryview(self._chunk)
+
+    @property
+    def framing(self):
+        return self._decoder.framing
+
+    def read_frame(self):
+        """
+        Read the next frame from the socket
+        :return: The frame as a str or None if the client closed the connection
+        """
+        while True:
+            frame = self._decoder.next_frame()
+            if frame is not None:
+                return frame
+            count = self._sock.recv_into(self._chunk_view)
+            if count == 0:
+                if self._decoder.buffered:
+                    logger.warning("Connection closed with %d bytes of incomplete request", self._decoder.buffered)
+                return None
+            self._decoder.feed(self._chunk_view[:count])
+
+    def encode(self, response):
+        """
+        Encode a response using the framing negotiated by the client
+        :param response: A dict
+        :return: bytes
+        """
+        return self._decoder.encode(response)
@@ -0,0 +1,95 @@
+#
+# Startup timing
+# Copyright © 2026  Dave Hocker (email: AtHomeX10@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+# Records how long each startup step (module import, driver open,
+# database init, etc.) takes so slow starts (e.g. on a Raspberry Pi)
+# can be diagnosed from the log. Once the report is logged, startup is
+# over. Later steps (e.g. a command module imported on first use) are
+# only logged at debug level and are not kept.
+#
+
+import importlib
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger("server")
+
+
+class StartupTimer:
+    """
+    Singleton class that collects startup timings
+    """
+    _timings = []
+    _lock = threading.Lock()
+    _start = time.monotonic()
+    # True once the startup report has been logged
+    _finished = False
+
+    @classmethod
+    def record(cls, step, elapsed):
+        """
+        Record the time taken by a step
+        :param step: Description of the step
+        :param elapsed: Time in seconds
+        :return: None
+        """
+        with cls._lock:
+            finished = cls._finished
+            if not finished:
+                cls._timings.append((step, elapsed))
+        logger.debug("%s took %f sec%s", step, elapsed, " (after startup)" if finished else "")
+
+    @classmethod
+    @contextmanager
+    def measure(cls, step):
+        """
+        Context manager that records the time taken by the enclosed block
+        :param step: Description of the step
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            cls.record(step, time.monotonic() - start)
+
+    @classmethod
+    def import_module(cls, module_name):
+        """
+        Import a module and record the time it took
+        :param module_name: Fully qualified module name
+        :return: The module
+        """
+        with cls.measure("import " + module_name):
+            return importlib.import_module(module_name)
+
+    @classmethod
+    def import_class(cls, class_path):
+        """
+        Import a class given as "module:ClassName"
+        :param class_path: Module and class name separated by a colon
+        :return: The class
+        """
+        module_name, class_name = class_path.split(":")
+        return getattr(cls.import_module(module_name), class_name)
+
+    @classmethod
+    def report(cls):
+        """
+        Log all of the recorded startup steps, slowest first. This ends startup.
+        :return: None
+        """
+        with cls._lock:
+            cls._finished = True
+            timings = sorted(cls._timings, key=lambda t: t[1], reverse=True)
+        logger.info("Startup timing report (%f sec since start)", time.monotonic() - cls._start)
+        for step, elapsed in timings:
+            logger.info("  %8.3f sec  %s", elapsed, step)
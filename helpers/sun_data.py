@@ -9,11 +9,159 @@
 #
 
 from datetime import datetime, timedelta
+from collections import OrderedDict
+import threading
+import logging
 from astral import LocationInfo
 from astral.sun import sun
 from astral.geocoder import database, lookup
 from Configuration import Configuration
 
+logger = logging.getLogger("server")
+
+
+class SunDataCache:
+    """
+    Singleton cache of astral sun data.
+    The configured location is resolved once (a geocoder lookup is expensive)
+    and sun data is kept per (date, location, time zone) with LRU eviction.
+    """
+    # Number of days of sun data kept
+    MAX_ENTRIES = 64
+    # Largest date range get_sun_data_range will compute
+    MAX_RANGE_DAYS = 366
+
+    _lock = threading.Lock()
+    _entries = OrderedDict()
+    _location = None
+    # The configuration values the location was built from
+    _location_key = None
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def _configured_location_key(cls):
+        return Configuration.City(), Configuration.Latitude(), Configuration.Longitude()
+
+    @classmethod
+    def _build_location(cls, location_key):
+        """
+        Resolve the configured city and/or latitude/longitude into a LocationInfo
+        :param location_key: (city, latitude, longitude) from the configuration
+        :return: LocationInfo instance
+        """
+        config_city, config_latitude, config_longitude = location_key
+        city = None
+        # Either city/name or latitude and longitude are required
+        if config_city != "":
+            db = database()
+            try:
+                city = lookup(config_city, db)
+                # Overrides
+                if config_latitude != "":
+                    city.latitude = float(config_latitude)
+                if config_longitude != "":
+                    city.longitude = float(config_longitude)
+            except KeyError:
+                pass
+
+        if city is None:
+            # Default if no city is configured
+            city = LocationInfo()
+            # We expect latitude and longitude to be configured to override city
+            if config_latitude != "" and config_longitude != "":
+                city.latitude = float(config_latitude)
+                city.longitude = float(config_longitude)
+            else:
+                raise ValueError("Latitude and longitude are required")
+
+        # region is not used
+        # city.region = ""
+
+        return city
+
+    @classmethod
+    def load_location(cls):
+        """
+        Resolve the configured location. Called at startup. The location is
+        rebuilt automatically when the configuration values change
+        (e.g. the configuration is reloaded).
+        :return: A tuple (LocationInfo instance, location key)
+        """
+        location_key = cls._configured_location_key()
+        location = cls._build_location(location_key)
+        with cls._lock:
+            cls._location = location
+            cls._location_key = location_key
+            # Sun data for the old location is no longer valid
+            cls._entries.clear()
+        logger.info("Sun data location: %s %f %f", location.name, location.latitude, location.longitude)
+        return location, location_key
+
+    @classmethod
+    def get_location(cls):
+        """
+        Return the resolved location, rebuilding it if the configuration changed
+        :return: A tuple (LocationInfo instance, location key)
+        """
+        location_key = cls._configured_location_key()
+        with cls._lock:
+            if cls._location is not None and cls._location_key == location_key:
+                return cls._location, location_key
+        return cls.load_location()
+
+    @classmethod
+    def get(cls, for_date, store=True):
+        """
+        Return the astral sun data for a date
+        :param for_date: A date or datetime (only the date is used)
+        :param store: False to leave the LRU untouched. A cached date is still
+        used, but a computed date is not added. Date ranges use this so they
+        do not evict the dates the scheduler keeps asking for.
+        :return: A dict of astral sun data (sunrise, sunset, etc.)
+        """
+        if isinstance(for_date, datetime):
+            for_date = for_date.date()
+        location, location_key = cls.get_location()
+        # Local timezone
+        timezone = datetime.now().astimezone().tzinfo
+
+        key = (for_date, location_key, timezone)
+        with cls._lock:
+            sun_data = cls._entries.get(key)
+            if sun_data is not None:
+                if store:
+                    cls._entries.move_to_end(key)
+                cls.hits += 1
+                return dict(sun_data)
+            cls.misses += 1
+
+        sun_data = sun(location.observer, date=for_date, tzinfo=timezone)
+        if not store:
+            return dict(sun_data)
+
+        with cls._lock:
+            cls._entries[key] = sun_data
+            while len(cls._entries) > cls.MAX_ENTRIES:
+                cls._entries.popitem(last=False)
+        return dict(sun_data)
+
+    @classmethod
+    def clear(cls):
+        """
+        Drop all cached sun data and the resolved location
+        :return: None
+        """
+        with cls._lock:
+            cls._entries.clear()
+            cls._location = None
+            cls._location_key = None
+
+    @classmethod
+    def get_stats(cls):
+        with cls._lock:
+            return {"entries": len(cls._entries), "hits": cls.hits, "misses": cls.misses}
+
 
 def get_astral_data(for_datetime):
     '''
@@ -25,37 +173,7 @@ def get_astral_data(for_datetime):
     :return: Returns a dict containing the keys sunrise and sunset.
     The values are datetime objects.
     '''
-    city = None
-    # Either city/name or latitude and longitude are required
-    if Configuration.City() != "":
-        db = database()
-        try:
-            city = lookup(Configuration.City(), db)
-            # Overrides
-            if Configuration.Latitude() != "":
-                city.latitude = float(Configuration.Latitude())
-            if Configuration.Longitude() != "":
-                city.longitude = float(Configuration.Longitude())
-        except KeyError:
-            pass
-
-    if city is None:
-        # Default if no city is configured
-        city = LocationInfo()
-        # We expect latitude and longitude to be configured to override city
-        if Configuration.Latitude() != "" and Configuration.Longitude() != "":
-            city.latitude = float(Configuration.Latitude())
-            city.longitude = float(Configuration.Longitude())
-        else:
-            raise ValueError("Latitude and longitude are required")
-
-    # region is not used
-    # city.region = ""
-
-    # Local timezone
-    city.timezone = datetime.now().astimezone().tzinfo
-
-    return sun(city.observer, date=for_datetime, tzinfo=city.timezone)
+    return SunDataCache.get(for_datetime)
 
 
 def get_sun_data(for_datetime):
@@ -108,3 +226,34 @@ def get_sunset(for_datetime):
 
     # Returns a datetime instance in local time
     return round_to_minute(sun_data["sunset"])
+
+
+def get_sun_data_range(start_date, end_date):
+    """
+    Return the sunrise and sunset times for every date in a range
+    :param start_date: First date (date or datetime)
+    :param end_date: Last date, inclusive (date or datetime)
+    :return: A list of dicts containing the keys date, sunrise and sunset.
+    The values are ISO formatted strings. Times are rounded to the minute.
+    """
+    if isinstance(start_date, datetime):
+        start_date = start_date.date()
+    if isinstance(end_date, datetime):
+        end_date = end_date.date()
+    days = (end_date - start_date).days + 1
+    if days < 1:
+        raise ValueError("end date is before start date")
+    if days > SunDataCache.MAX_RANGE_DAYS:
+        raise ValueError("Date range is limited to {0} days".format(SunDataCache.MAX_RANGE_DAYS))
+
+    sun_data_list = []
+    for d in range(days):
+        for_date = start_date + timedelta(days=d)
+        # A range is usually a one time request, so it stays out of the cache
+        sun_data = SunDataCache.get(for_date, store=False)
+        sun_data_list.append({
+            "date": for_date.isoformat(),
+            "sunrise": round_to_minute(sun_data["sunrise"]).isoformat(),
+            "sunset": round_to_minute(sun_data["sunset"]).isoformat()
+        })
+    return sun_data_list
@@ -14,24 +14,25 @@
 #
 
 import threading
-import time
 import datetime
 import logging
 import traceback
-import random
-from helpers.TimeZone import TimeZone
-from helpers.sun_data import get_sunrise, get_sunset
 from database.managed_devices import ManagedDevices
-from database.programs import Programs
+from database.table_cache import TableCache
+from services.timer_schedule import TimerSchedule
 import commands.ActionFactory as ActionFactory
 
 logger = logging.getLogger("server")
 
 
 ########################################################################
-# The timer service thread periodically examines the list of timer programs.
-# When a timer event expires, it transmits the appropriate X10 function.
+# The timer service thread runs timer programs when they are due.
+# The fire times of all active programs are computed once a day (and
+# again whenever the Programs table changes). Between events the thread
+# sleeps until the next fire time.
 class TimerServiceThread(threading.Thread):
+    # Upper limit on a single sleep. Guards against clock changes.
+    MAX_SLEEP = 15 * 60
 
     ########################################################################
     # Constructor
@@ -40,84 +41,98 @@ class TimerServiceThread(threading.Thread):
         self.thread_id = thread_id
         self.name = name
         self.terminate_signal = threading.Event()
+        # Set to wake the thread before its next scheduled event
+        self._wakeup = threading.Event()
+        self._schedule = None
+        self._schedule_stale = True
+        # (program id, fire time) of events run today. Keeps a rebuilt
+        # schedule from running an event a second time.
+        self._fired = set()
+        TableCache.add_listener(["Programs"], self.ProgramsChanged)
 
     ########################################################################
     # Called by threading on the new thread
     def run(self):
-        # logger.info("Timer service running")
-
-        # Check the terminate signal every second
-        while not self.terminate_signal.isSet():
-            logger.info("Program timer checks sleeping...")
-            # This sleeps until the next minute.
-            # We sleep in a granular fashion so that
-            # a service stop/restart command takes effect
-            # in a minimal amount of time.
-            wait_time = 60 - datetime.datetime.now().second
-            while (wait_time > 0) and (not self.terminate_signal.isSet()):
-                time.sleep(1)
-                wait_time -= 1
-
-            # Every minute run the program checks if terminate is not set
-            if not self.terminate_signal.isSet():
-                logger.info("Program timer checks starting...")
-                self.RunTimerPrograms()
-                logger.info("Program timer checks ended")
+        while not self.terminate_signal.is_set():
+            self.RunTimerPrograms()
+            self._wakeup.wait(self._seconds_to_next_event())
+            self._wakeup.clear()
 
     ########################################################################
     # Terminate the timer service thread
     def Terminate(self):
+        TableCache.remove_listener(self.ProgramsChanged)
         self.terminate_signal.set()
-        # wait for service thread to exit - could be a while
-        logger.info("Waiting for timer service to stop...this could take a few seconds")
+        self._wakeup.set()
+        # wait for service thread to exit
+        logger.info("Waiting for timer service to stop...")
         self.join()
         logger.info("Timer service stopped")
 
+    ########################################################################
+    # Called when the Programs table has been changed
+    def ProgramsChanged(self):
+        self._schedule_stale = True
+        self._wakeup.set()
+
     ########################################################################
     # Run timer programs that have reached their trigger time
     def RunTimerPrograms(self):
-        # All of the Programs records where command is not "none"
-        pd = Programs()
-        tp_list = pd.get_all_active_programs()
-        if tp_list is None:
-            logger.error("Unable to get list of active timer programs")
-            logger.error(pd.last_error)
-            return
-
-        for tp in tp_list:
+        now = datetime.datetime.now()
+        if self._schedule_stale or self._schedule is None or self._schedule.date != now.date():
+            self._build_schedule(now)
+            if self._schedule is None:
+                return
+
+        for fire_time, tp in self._schedule.pop_due(now):
+            key = (tp["id"], fire_time)
+            if key in self._fired:
+                continue
+            self._fired.add(key)
             try:
-                self.RunTimerProgram(tp)
+                logger.info("Program event triggered: %s %s", tp["name"], tp["command"])
+                self.RunTimerAction(tp)
             except Exception as ex:
                 logger.error("Unhandled exception caught while running timer program %s id=%d", tp["name"], tp["id"])
                 logger.error(ex)
                 logger.debug(traceback.format_exc())
-            finally:
-                pass
-
-    ########################################################################
-    # Run a single timer program
-    def RunTimerProgram(self, tp):
-        # The date in a timer program's on/off time has no meaning.
-        # We use the time part of the datetime to mean the time TODAY.
-        now = datetime.datetime.now()
 
-        # TODO Answer question about persisting event status in database (and resetting status at well defined times)
-        # This will only be interesting if we want to manage events that may have occurred BEFORE
-        # the server was started. That will be a complicated task.
+    def _build_schedule(self, now):
+        """
+        Build the schedule for the current day
+        :param now: Current local time
+        :return: None
+        """
+        new_day = self._schedule is None or self._schedule.date != now.date()
+        # Cleared first so a change made during the build triggers another build
+        self._schedule_stale = False
+        self._schedule = TimerSchedule.build(now.date())
+        if self._schedule is None:
+            # Try again at the next wake up
+            self._schedule_stale = True
+            return
 
-        # Only if the current day is enabled...
-        if TimerServiceThread.IsDayOfWeekEnabled(now, tp["daymask"]):
-            # we consider the event triggered if the current date/time in hours and minutes matches the event time
-            logger.debug(str(tp))
+        if new_day:
+            self._fired = set()
+        # Like the old once a minute check, events from earlier minutes (e.g. before
+        # the server started or the program was changed) are not run
+        self._schedule.skip_before(now.replace(second=0, microsecond=0))
 
-            # Event check
-            if self.IsEventTriggered(tp):
-                # Event triggered
-                logger.info("Program event triggered: %s %s", tp["name"], tp["command"])
-                # Fire the action
-                self.RunTimerAction(tp)
-        else:
-            logger.debug("%s is not enabled for the current weekday", tp["name"])
+    def _seconds_to_next_event(self):
+        """
+        How long to sleep until the next scheduled event, the next day or a rebuild
+        :return: Seconds
+        """
+        now = datetime.datetime.now()
+        tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+        next_time = tomorrow
+        if self._schedule is None or self._schedule_stale:
+            # The schedule could not be built. Retry in a minute.
+            next_time = now + datetime.timedelta(minutes=1)
+        elif self._schedule.next_fire_time is not None:
+            next_time = min(self._schedule.next_fire_time, tomorrow)
+        wait_time = (next_time - now).total_seconds()
+        return max(0.0, min(wait_time, TimerServiceThread.MAX_SLEEP))
 
     ########################################################################
     # Run an action
@@ -137,88 +152,3 @@ class TimerServiceThread(threading.Thread):
                 logger.info("Executing action: %s %s %s %s", tp["command"], device_mfg, device_address, device_channel)
                 ActionFactory.RunAction(tp["command"], device_rec["id"], device_mfg, device_name, device_address,
                                         device_channel, device_color, device_brightness)
-
-    ########################################################################
-    # Test a date to see if its weekday is enabled
-    @classmethod
-    def IsDayOfWeekEnabled(cls, date_to_test, day_mask):
-        d = day_mask[date_to_test.weekday()]
-        if (d != '-') and (d != '.'):
-            return True
-        return False
-
-    @classmethod
-    def IsEventTriggered(cls, tp):
-        """
-        Test the program against the given time to see if the start event has occurred.
-        :param tp: Timer program record
-        :return:
-        """
-        # We use the time part of the datetime to mean the time TODAY.
-        now = datetime.datetime.now()
-
-        # time without seconds
-        now_dt = datetime.datetime(now.year, now.month, now.day, now.hour, now.minute, 0, tzinfo=TimeZone())
-
-        # Randomized amount
-        randomized_amount = 0
-        if tp["randomize"]:
-            randomized_amount = cls.GetRandomizedAmount(tp["randomizeamount"])
-        logger.debug("Randomize amount: %s", randomized_amount)
-
-        # Factory testing based on trigger method
-        pt = datetime.datetime.strptime(tp["time"], "%Y-%m-%d %H:%M:%S")
-        if tp["triggermethod"] == "clock-time":
-            today_time = datetime.datetime(now.year, now.month, now.day, pt.hour,
-                                                pt.minute, pt.second, tzinfo=TimeZone())
-            today_time = today_time + datetime.timedelta(minutes=(tp["offset"] + randomized_amount))
-            return today_time == now_dt
-        elif tp["triggermethod"] == "sunset":
-            # logger.debug("Testing sunset trigger")
-            sunset = get_sunset(now_dt)
-            offset_sunset = sunset + datetime.timedelta(minutes=(tp["offset"] + randomized_amount))
-            return now_dt == offset_sunset
-        elif tp["triggermethod"] == "sunrise":
-            # logger.debug("Testing sunrise trigger")
-            sunrise = get_sunrise(now_dt)
-            offset_sunrise = sunrise + datetime.timedelta(minutes=(tp["offset"] + randomized_amount))
-            return now_dt == offset_sunrise
-
-        # "none" falls to here
-        return False
-
-
-    @classmethod
-    def GetRandomizedAmount(cls, randomize_amount):
-        """
-        For today's date, calculate the integer randomized amount r where
-        -randomize_amount <= int(r) <= randomize_amount
-        """
-
-        # Today's randomization factor
-        rf = cls.GetRandomFactor()
-
-        # Round randomized value to a whole integer
-        # Return the result as an integer
-        return int(round(rf * float(randomize_amount)))
-
-    @classmethod
-    def GetRandomFactor(cls):
-        """
-        Returns a floating point randomization factor in the range -1.0 <= f <= 1.0
-        """
-
-        # We want to use today's date as the seed (just the date).
-        # This will allow us to reproduce a random factor for a given date, while
-        # allowing the factor to vary over a range of dates.
-        now = datetime.datetime.now()
-        now_date = datetime.date(now.year, now.month, now.day)
-        random.seed(str(now_date))
-
-        # We'll try to inject a little more controlled randomness by using today's
-        # day as an additional factor.
-        f = 1.0
-        for i in range(0, now_date.day):
-            f = random.uniform(-1.0, 1.0)
-
-        return f
@@ -0,0 +1,166 @@
+#
+# AtHomePowerlineServer - networked server for various controllers
+# Copyright © 2026  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Daily timer program schedule.
+# The fire time of every active program is computed once for the day
+# (parsing the program time, the day's random factor and sunrise/sunset).
+# The timer service then only has to look at the events that are due.
+#
+
+import bisect
+import datetime
+import random
+import logging
+from helpers.sun_data import get_sunrise, get_sunset
+from database.programs import Programs
+
+logger = logging.getLogger("server")
+
+
+class TimerSchedule:
+    def __init__(self, for_date, events):
+        """
+        Create a schedule. Use TimerSchedule.build() to create the schedule for a date.
+        :param for_date: The date the schedule covers
+        :param events: List of (fire_time, program) tuples
+        """
+        self.date = for_date
+        # Sorted by fire time. The sequence number keeps programs from being compared.
+        self._events = sorted(((fire_time, seq, tp) for seq, (fire_time, tp) in enumerate(events)),
+                              key=lambda e: (e[0], e[1]))
+        self._next = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    @property
+    def next_fire_time(self):
+        """
+        The time of the next event or None if there are no more events today
+        """
+        if self._next < len(self._events):
+            return self._events[self._next][0]
+        return None
+
+    def skip_before(self, when):
+        """
+        Skip all events scheduled before a given time
+        :param when: Naive local datetime
+        :return: None
+        """
+        times = [e[0] for e in self._events]
+        self._next = max(self._next, bisect.bisect_left(times, when))
+
+    def pop_due(self, now):
+        """
+        Remove and return all events due at or before a given time
+        :param now: Naive local datetime
+        :return: List of (fire_time, program) tuples
+        """
+        due = []
+        while self._next < len(self._events) and self._events[self._next][0] <= now:
+            fire_time, seq, tp = self._events[self._next]
+            due.append((fire_time, tp))
+            self._next += 1
+        return due
+
+    @classmethod
+    def build(cls, for_date):
+        """
+        Build the schedule of active timer programs for a date
+        :param for_date: A datetime.date
+        :return: TimerSchedule instance or None if the programs could not be read
+        """
+        pd = Programs()
+        tp_list = pd.get_all_active_programs()
+        if tp_list is None:
+            logger.error("Unable to get list of active timer programs")
+            logger.error(pd.last_error)
+            return None
+
+        random_factor = cls.random_factor(for_date)
+        # Computed on first use. Most programs are clock-time.
+        sun_times = {}
+
+        events = []
+        for tp in tp_list:
+            try:
+                if not cls.is_day_of_week_enabled(for_date, tp["daymask"]):
+                    logger.debug("%s is not enabled for %s", tp["name"], str(for_date))
+                    continue
+                fire_time = cls._fire_time(tp, for_date, random_factor, sun_times)
+                if fire_time is not None:
+                    events.append((fire_time, tp))
+            except Exception as ex:
+                logger.error("Unable to schedule timer program %s id=%d", tp["name"], tp["id"])
+                logger.error(str(ex))
+
+        schedule = TimerSchedule(for_date, events)
+        logger.info("Timer schedule for %s has %d events", str(for_date), len(schedule))
+        return schedule
+
+    @classmethod
+    def _fire_time(cls, tp, for_date, random_factor, sun_times):
+        """
+        Compute the time a program fires on a given date
+        :return: Naive local datetime (to the minute) or None if the program does not fire
+        """
+        randomized_amount = 0
+        if tp["randomize"]:
+            randomized_amount = int(round(random_factor * float(tp["randomizeamount"])))
+        adjustment = datetime.timedelta(minutes=(tp["offset"] + randomized_amount))
+
+        trigger_method = tp["triggermethod"]
+        if trigger_method == "clock-time":
+            pt = datetime.datetime.strptime(tp["time"], "%Y-%m-%d %H:%M:%S")
+            base_time = datetime.datetime.combine(for_date, datetime.time(pt.hour, pt.minute))
+        elif trigger_method in ["sunrise", "sunset"]:
+            if trigger_method not in sun_times:
+                at_noon = datetime.datetime.combine(for_date, datetime.time(12, 0))
+                sun_time = get_sunrise(at_noon) if trigger_method == "sunrise" else get_sunset(at_noon)
+                # Local time without a time zone, like all of the other schedule times
+                sun_times[trigger_method] = sun_time.astimezone().replace(tzinfo=None)
+            base_time = sun_times[trigger_method]
+        else:
+            # "none"
+            return None
+
+        fire_time = base_time + adjustment
+        # As before, an offset that moves the event into another day means it does not fire
+        if fire_time.date() != for_date:
+            return None
+        return fire_time
+
+    @classmethod
+    def is_day_of_week_enabled(cls, date_to_test, day_mask):
+        d = day_mask[date_to_test.weekday()]
+        return (d != '-') and (d != '.')
+
+    @classmethod
+    def random_factor(cls, for_date):
+        """
+        Returns a floating point randomization factor in the range -1.0 <= f <= 1.0
+        for a given date
+        """
+        # We want to use the date as the seed (just the date).
+        # This will allow us to reproduce a random factor for a given date, while
+        # allowing the factor to vary over a range of dates.
+        # A private generator leaves the global random state alone.
+        rng = random.Random(str(for_date))
+
+        # We'll try to inject a little more controlled randomness by using the
+        # day as an additional factor.
+        f = 1.0
+        for i in range(0, for_date.day):
+            f = rng.uniform(-1.0, 1.0)
+
+        return f